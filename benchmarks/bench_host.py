@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+IdeaShelf Native Host Latency Benchmark
+
+Launches ideashelf_host.py the way Chrome does (executable path plus the
+caller's origin as argument, stdin/stdout pipes, 4-byte little-endian
+length-prefixed JSON) and drives it with captures at a chosen rate and
+concurrency. For every capture it records:
+
+    spawn     time for the host process to be started (spawn mode), or for
+              its connection to be opened (persistent mode)
+    response  time until the host's reply has been read
+    visible   time until <id>.json can be seen in the inbox
+
+All times are measured from when the capture was scheduled to be sent, so
+a host that falls behind shows up as latency instead of as a lower send
+rate. Results are reported as p50/p95/p99/max in JSON, together with the
+number of captures that exceeded the extension's NATIVE_HOST_TIMEOUT_MS,
+and the mean bytes each capture took in the inbox.
+
+Modes:
+    spawn       a new host process per capture, closed after the reply
+                (the original one-shot extension behaviour)
+    persistent  --concurrency long-lived connections shared by all
+                captures, like the extension's persistent port
+
+Usage:
+    python3 benchmarks/bench_host.py --count 500 --rate 50 --concurrency 4
+    python3 benchmarks/bench_host.py --host native-host/ideashelf_host.pyz
+    python3 benchmarks/bench_host.py --encoding compact --content-chars 20000
+
+The host writes to a temporary inbox through IDEASHELF_INBOX, in the
+encoding given by IDEASHELF_CAPTURE_ENCODING.
+
+No external dependencies. Python 3 stdlib only.
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_HOST = os.path.join(ROOT, "native-host", "ideashelf_host.py")
+BACKGROUND_JS = os.path.join(ROOT, "extension", "background.js")
+ORIGIN = "chrome-extension://benchmarkbenchmarkbenchmarkbench/"
+MODES = ("spawn", "persistent")
+
+
+def native_host_timeout_ms(default=5000):
+    """Read NATIVE_HOST_TIMEOUT_MS from the extension, the real budget."""
+    try:
+        with open(BACKGROUND_JS, "r", encoding="utf-8") as f:
+            match = re.search(r"NATIVE_HOST_TIMEOUT_MS\s*=\s*(\d+)", f.read())
+        return int(match.group(1)) if match else default
+    except OSError:
+        return default
+
+
+def frame(message):
+    data = json.dumps(message).encode("utf-8")
+    return struct.pack("<I", len(data)) + data
+
+
+def read_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = struct.unpack("<I", header)[0]
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def make_payload(content_chars):
+    return {
+        "id": str(uuid.uuid4()),
+        "captured_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source_url": "https://example.com/article",
+        "source_title": "Benchmark Article",
+        "content_type": "text_selection",
+        "capture_method": "context_menu",
+        "content": ("lorem ipsum dolor sit amet " * (content_chars // 27 + 1))[:content_chars],
+        "context": {"preceding_text": "", "following_text": ""},
+        "user_note": "",
+    }
+
+
+def host_command(host):
+    """Run .py/.pyz through this interpreter, anything else directly."""
+    if host.endswith((".py", ".pyz")):
+        return [sys.executable, host, ORIGIN]
+    return [host, ORIGIN]
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class VisibilityWatcher:
+    """Notes when each expected capture file first appears in the inbox."""
+
+    def __init__(self, inbox, interval=0.002):
+        self.inbox = inbox
+        self.interval = interval
+        self.expected = {}  # file name -> capture id
+        self.seen = {}  # capture id -> perf_counter time
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def expect(self, capture_id):
+        with self.lock:
+            self.expected[f"{capture_id}.json"] = capture_id
+
+    def _run(self):
+        while not self.stop.is_set():
+            with self.lock:
+                pending = dict(self.expected)
+            if pending:
+                now = time.perf_counter()
+                try:
+                    names = os.listdir(self.inbox)
+                except OSError:
+                    names = []
+                found = [name for name in names if name in pending]
+                with self.lock:
+                    for name in found:
+                        self.seen[pending[name]] = now
+                        self.expected.pop(name, None)
+            time.sleep(self.interval)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self, grace=1.0):
+        deadline = time.perf_counter() + grace
+        while self.expected and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.stop.set()
+        self.thread.join()
+
+
+class Sample:
+    def __init__(self, capture_id, scheduled):
+        self.capture_id = capture_id
+        self.scheduled = scheduled
+        self.spawn = None
+        self.response = None
+        self.visible = None
+        self.success = False
+        self.error = None
+
+
+def send_spawned(host, env, payload, sample):
+    """One capture over a freshly started host, like a one-shot port."""
+    proc = subprocess.Popen(
+        host_command(host), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, env=env,
+    )
+    sample.spawn = time.perf_counter()
+    try:
+        proc.stdin.write(frame(payload))
+        proc.stdin.flush()
+        reply = read_frame(proc.stdout)
+        sample.response = time.perf_counter()
+        sample.success = bool(reply and reply.get("success"))
+        sample.error = None if sample.success else (reply or {}).get("error", "no reply")
+    finally:
+        proc.stdin.close()
+        proc.wait()
+
+
+class Connection:
+    """A long-lived host process that handles captures in order."""
+
+    def __init__(self, host, env):
+        started = time.perf_counter()
+        self.proc = subprocess.Popen(
+            host_command(host), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=env,
+        )
+        self.spawn_seconds = time.perf_counter() - started
+
+    def send(self, payload, sample):
+        sample.spawn = sample.scheduled  # The connection already exists
+        self.proc.stdin.write(frame(payload))
+        self.proc.stdin.flush()
+        reply = read_frame(self.proc.stdout)
+        sample.response = time.perf_counter()
+        sample.success = bool(reply and reply.get("success"))
+        sample.error = None if sample.success else (reply or {}).get("error", "no reply")
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def run(host, mode, count, rate, concurrency, content_chars, inbox, encoding="pretty"):
+    """Drive the host and return the list of Samples plus spawn times."""
+    env = dict(os.environ, IDEASHELF_INBOX=inbox, IDEASHELF_CAPTURE_ENCODING=encoding)
+    watcher = VisibilityWatcher(inbox)
+    watcher.start()
+
+    work = queue.Queue()
+    samples = []
+    connection_spawns = []
+
+    def worker(connection):
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            payload, sample = item
+            try:
+                if connection is None:
+                    send_spawned(host, env, payload, sample)
+                else:
+                    connection.send(payload, sample)
+            except (OSError, ValueError) as e:
+                sample.error = str(e)
+
+    connections = []
+    if mode == "persistent":
+        connections = [Connection(host, env) for _ in range(concurrency)]
+        connection_spawns = [c.spawn_seconds for c in connections]
+    threads = [
+        threading.Thread(target=worker, args=(connections[i] if connections else None,))
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+
+    started = time.perf_counter()
+    for i in range(count):
+        scheduled = started + i / rate if rate else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        payload = make_payload(content_chars)
+        sample = Sample(payload["id"], scheduled)
+        samples.append(sample)
+        watcher.expect(payload["id"])
+        work.put((payload, sample))
+
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    for connection in connections:
+        connection.close()
+    watcher.close()
+
+    for sample in samples:
+        sample.visible = watcher.seen.get(sample.capture_id)
+    return samples, connection_spawns, elapsed
+
+
+def stored_bytes(inbox, samples):
+    """Size of each capture's file in the inbox, for those still there."""
+    sizes = []
+    for sample in samples:
+        try:
+            sizes.append(os.path.getsize(os.path.join(inbox, f"{sample.capture_id}.json")))
+        except OSError:
+            pass
+    return sizes
+
+
+def summarize(samples, connection_spawns, elapsed, budget_ms):
+    def ms(attr):
+        return [
+            (getattr(s, attr) - s.scheduled) * 1000
+            for s in samples if getattr(s, attr) is not None
+        ]
+
+    responses = ms("response")
+    spawn = (
+        [seconds * 1000 for seconds in connection_spawns]
+        if connection_spawns else ms("spawn")
+    )
+    errors = [s.error for s in samples if not s.success]
+    return {
+        "captures": len(samples),
+        "succeeded": len(samples) - len(errors),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 3),
+        "captures_per_sec": round(len(samples) / elapsed, 1) if elapsed else None,
+        "spawn_ms": percentiles(spawn),
+        "response_ms": percentiles(responses),
+        "visible_ms": percentiles(ms("visible")),
+        "budget_ms": budget_ms,
+        "over_budget": sum(1 for value in responses if value > budget_ms)
+        + sum(1 for s in samples if s.response is None),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure IdeaShelf native host latency.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Host executable (.py, .pyz or binary)")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated: spawn,persistent")
+    parser.add_argument("--count", type=int, default=200, help="Captures per mode (default: 200)")
+    parser.add_argument("--rate", type=float, default=20.0,
+                        help="Captures per second; 0 sends as fast as possible (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Captures in flight / persistent connections (default: 1)")
+    parser.add_argument("--content-chars", type=int, default=500)
+    parser.add_argument("--encoding", choices=("pretty", "compact"), default="pretty",
+                        help="How the host stores captures (default: pretty)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        sys.exit(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    budget_ms = native_host_timeout_ms()
+    report = {
+        "meta": {
+            "benchmark": "host",
+            "host": os.path.relpath(args.host, ROOT),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "content_chars": args.content_chars,
+            "encoding": args.encoding,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": [],
+    }
+    for mode in modes:
+        inbox = tempfile.mkdtemp(prefix="ideashelf-host-bench-")
+        try:
+            samples, spawns, elapsed = run(
+                args.host, mode, args.count, args.rate,
+                max(1, args.concurrency), args.content_chars, inbox, args.encoding,
+            )
+            sizes = stored_bytes(inbox, samples)
+        finally:
+            shutil.rmtree(inbox, ignore_errors=True)
+        result = {"mode": mode}
+        result.update(summarize(samples, spawns, elapsed, budget_ms))
+        result["bytes_written_per_capture"] = round(sum(sizes) / len(sizes)) if sizes else None
+        report["results"].append(result)
+        print(f"{mode:10s} response p50 {result['response_ms']['p50'] if result['response_ms'] else '-'} ms"
+              f"  p99 {result['response_ms']['p99'] if result['response_ms'] else '-'} ms"
+              f"  over budget {result['over_budget']}"
+              f"  {result['bytes_written_per_capture']} B/capture", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
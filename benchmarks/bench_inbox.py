@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+IdeaShelf Inbox Processor Benchmark
+
+Generates synthetic inboxes and times process_inbox() against them,
+reporting captures/sec, peak RSS, read/write syscall counts and bytes
+read and written per capture as JSON so runs can be compared across
+versions.
+
+Captures have the same shape as the test suite's make_capture(). Content
+lengths follow a log-normal distribution (median about 300 characters,
+like a typical selection) with a 1% tail of full-page captures of
+20k-200k characters.
+
+Modes:
+    serial    process_inbox() with one worker
+    parallel  process_inbox() with --workers threads
+    log       the same captures appended to the segmented capture log
+    watch     the --watch daemon, fed captures while it runs
+
+Captures are stored in each --encodings form the native host supports
+("pretty" indented JSON, "compact" minified and gzip-compressed past the
+host's COMPRESS_OVER_BYTES). Each case runs in a fresh interpreter so
+peak RSS and syscall counts belong to that case alone. Inboxes are
+generated once per size and encoding and hard-linked into each case's
+directory.
+
+Usage:
+    python3 benchmarks/bench_inbox.py --sizes 1000,100000 --workers 4
+    python3 benchmarks/bench_inbox.py --sizes 1000000 --modes serial,log \\
+        --output results.json
+    python3 benchmarks/bench_inbox.py --sizes 10000 --encodings pretty,compact
+
+No external dependencies. Python 3 stdlib only. Syscall counts come from
+/proc/self/io and are null where that is unavailable.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "runtime"))
+sys.path.insert(0, os.path.join(ROOT, "native-host"))
+
+MODES = ("serial", "parallel", "log", "watch")
+ENCODINGS = ("pretty", "compact")
+DEFAULT_SIZES = (1000, 100_000)
+
+WORDS = (
+    "idea scaffold metaphor concept exercise model learning feedback system "
+    "context attention memory practice signal pattern teacher student design "
+    "insight reference example correction framing structure loop habit note "
+    "the a of and to in is that for it as with on this be by are from or"
+).split()
+
+CONTENT_TYPES = ("text_selection", "text_selection", "text_selection", "quick_note", "bookmark")
+
+
+def content_length(rng):
+    """Draw a content length in characters."""
+    if rng.random() < 0.01:
+        return rng.randint(20_000, 200_000)
+    return max(20, min(50_000, int(rng.lognormvariate(5.7, 1.1))))
+
+
+def make_capture(rng):
+    """A synthetic capture shaped like tests/conftest.make_capture."""
+    length = content_length(rng)
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    content = " ".join(words)[:length]
+    n = rng.randrange(10_000)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "captured_at": f"2026-02-{1 + n % 28:02d}T{n % 24:02d}:{n % 60:02d}:00Z",
+        "source_url": f"https://example.com/article/{n}",
+        "source_title": f"Article {n}: " + " ".join(rng.choice(WORDS) for _ in range(5)),
+        "content_type": rng.choice(CONTENT_TYPES),
+        "content": content,
+        "context": {
+            "preceding_text": " ".join(rng.choice(WORDS) for _ in range(12)),
+            "following_text": " ".join(rng.choice(WORDS) for _ in range(12)),
+        },
+        "user_note": "" if rng.random() < 0.8 else "Follow up on this",
+    }
+
+
+def generate(directory, count, seed=0, encoding="pretty"):
+    """Write `count` capture files into directory, as the native host would.
+
+    Returns the total payload bytes written.
+    """
+    import ideashelf_host
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    for _ in range(count):
+        capture = make_capture(rng)
+        data, _ = ideashelf_host.encode_capture(capture, encoding=encoding)
+        with open(os.path.join(directory, f"{capture['id']}.json"), "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+
+def link_tree(src, dst):
+    """Populate dst with hard links to the capture files in src."""
+    os.makedirs(dst, exist_ok=True)
+    for name in sorted(os.listdir(src)):
+        os.link(os.path.join(src, name), os.path.join(dst, name))
+
+
+def read_proc_io():
+    """Return /proc/self/io counters as a dict, or None off Linux."""
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except OSError:
+        return None
+
+
+def peak_rss_kb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def bench_config(workdir):
+    return {
+        "inbox_folder": os.path.join(workdir, "inbox"),
+        "output_folder": os.path.join(workdir, "ideas"),
+        "defaults": {"status": "raw"},
+    }
+
+
+def run_case(source, workdir, mode, workers):
+    """Run one timed case in this process and return its measurements."""
+    import process_inbox
+
+    config = bench_config(workdir)
+    inbox = config["inbox_folder"]
+    os.makedirs(inbox, exist_ok=True)
+
+    if mode == "log":
+        import capture_codec
+        import ideashelf_host
+
+        payloads = []
+        for name in sorted(os.listdir(source)):
+            payloads.append(capture_codec.load_file(os.path.join(source, name)))
+            if len(payloads) == 1024:
+                ideashelf_host.append_captures(payloads, inbox)
+                payloads = []
+        if payloads:
+            ideashelf_host.append_captures(payloads, inbox)
+        del payloads
+    elif mode != "watch":
+        link_tree(source, inbox)
+
+    expected = len(os.listdir(source))
+    io_before = read_proc_io()
+    started = time.perf_counter()
+
+    if mode == "watch":
+        processed, errors = _run_watch(config, source, expected, workers)
+    else:
+        processed, errors = process_inbox.process_inbox(
+            config, workers=workers if mode == "parallel" else 1
+        )
+
+    seconds = time.perf_counter() - started
+    io_after = read_proc_io()
+
+    result = {
+        "mode": mode,
+        "workers": workers if mode in ("parallel", "watch") else 1,
+        "captures": expected,
+        "processed": processed,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "captures_per_sec": round(processed / seconds, 1) if seconds else None,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    for key in ("syscr", "syscw", "rchar", "wchar", "read_bytes", "write_bytes"):
+        result[key] = io_after[key] - io_before[key] if io_before and io_after else None
+    # Bytes through read() and write() calls, page cache included
+    for key, name in (("rchar", "bytes_read_per_capture"), ("wchar", "bytes_written_per_capture")):
+        result[name] = round(result[key] / processed) if result[key] is not None and processed else None
+    return result
+
+
+def _run_watch(config, source, expected, workers):
+    """Feed captures to a running daemon and wait until all are processed.
+
+    The feeder writes each capture the way the host does (temporary file,
+    then rename), so its syscalls are included in the counts.
+    """
+    import inbox_watch
+
+    stop = threading.Event()
+    totals = [0, 0]
+    done = threading.Event()
+
+    def on_batch(processed, errors):
+        totals[0] += processed
+        totals[1] += errors
+        if sum(totals) >= expected:
+            done.set()
+
+    daemon = threading.Thread(
+        target=inbox_watch.watch_inbox,
+        args=(config,),
+        kwargs={"workers": workers, "stop_event": stop, "on_batch": on_batch},
+        daemon=True,
+    )
+    daemon.start()
+
+    inbox = config["inbox_folder"]
+    for name in sorted(os.listdir(source)):
+        tmp = os.path.join(inbox, f".{name}.tmp")
+        shutil.copyfile(os.path.join(source, name), tmp)
+        os.replace(tmp, os.path.join(inbox, name))
+
+    while not done.wait(1.0) and daemon.is_alive():
+        pass
+    stop.set()
+    daemon.join()
+    return totals[0], totals[1]
+
+
+def run_isolated(source, mode, workers, encoding="pretty"):
+    """Run one case in a fresh interpreter and return its result dict."""
+    workdir = tempfile.mkdtemp(prefix="ideashelf-bench-")
+    try:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "_case",
+             "--source", source, "--workdir", workdir,
+             "--mode", mode, "--workers", str(workers)],
+            check=True, capture_output=True, text=True,
+            # The log mode appends through the host, in this encoding
+            env=dict(os.environ, IDEASHELF_CAPTURE_ENCODING=encoding),
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "-C", ROOT, "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "benchmark": "inbox",
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run_suite(sizes, modes, workers, seed=0, scratch=None, encodings=("pretty",)):
+    """Generate each inbox size once per encoding and run every mode against it."""
+    report = {"meta": metadata(), "results": []}
+    report["meta"]["seed"] = seed
+    base = tempfile.mkdtemp(prefix="ideashelf-bench-src-", dir=scratch)
+    try:
+        for size in sizes:
+            for encoding in encodings:
+                source = os.path.join(base, f"{size}-{encoding}")
+                started = time.perf_counter()
+                payload_bytes = generate(source, size, seed, encoding)
+                print(f"Generated {size} {encoding} captures ({payload_bytes / 1e6:.1f} MB) in "
+                      f"{time.perf_counter() - started:.1f} s", file=sys.stderr)
+                for mode in modes:
+                    result = run_isolated(source, mode, workers, encoding)
+                    result["encoding"] = encoding
+                    result["payload_bytes"] = payload_bytes
+                    report["results"].append(result)
+                    print(f"  {mode:8s} {result['captures_per_sec']:>10} captures/s  "
+                          f"peak RSS {result['peak_rss_kb'] / 1024:.0f} MB  "
+                          f"read {result['bytes_read_per_capture']} B/capture  "
+                          f"written {result['bytes_written_per_capture']} B/capture",
+                          file=sys.stderr)
+                shutil.rmtree(source)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the IdeaShelf inbox processor.")
+    sub = parser.add_subparsers(dest="command")
+    case = sub.add_parser("_case", help=argparse.SUPPRESS)
+    case.add_argument("--source", required=True)
+    case.add_argument("--workdir", required=True)
+    case.add_argument("--mode", choices=MODES, required=True)
+    case.add_argument("--workers", type=int, default=1)
+
+    parser.add_argument(
+        "--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="Comma-separated inbox sizes (default: 1000,100000; add 1000000 for the full run)",
+    )
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Threads for parallel and watch modes")
+    parser.add_argument("--encodings", default="pretty",
+                        help="Comma-separated capture encodings: pretty,compact (default: pretty)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scratch", help="Directory for generated inboxes (default: system temp)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "_case":
+        result = run_case(args.source, args.workdir, args.mode, args.workers)
+        print(json.dumps(result))
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        sys.exit(f"Unknown modes: {', '.join(sorted(unknown))}")
+    encodings = [e for e in args.encodings.split(",") if e]
+    unknown = set(encodings) - set(ENCODINGS)
+    if unknown:
+        sys.exit(f"Unknown encodings: {', '.join(sorted(unknown))}")
+
+    report = run_suite(sizes, modes, args.workers, seed=args.seed, scratch=args.scratch,
+                       encodings=encodings)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,16 @@
 const NATIVE_HOST_NAME = "com.ideashelf.host";
 const NATIVE_HOST_TIMEOUT_MS = 5000;
 
+// Chrome caps messages from the extension to the host, and the host caps
+// them at 1 MB. Longer captures are streamed in pieces of this many
+// characters; even fully escaped they stay well under the limit.
+const CHUNK_THRESHOLD_CHARS = 256 * 1024;
+const CHUNK_CHARS = 128 * 1024;
+
+// Batches are split into envelopes of at most this many bytes of JSON,
+// leaving room under the host's 1 MB limit for the envelope itself.
+const BATCH_MAX_BYTES = 768 * 1024;
+
 // --- Context Menu ---
 
 chrome.runtime.onInstalled.addListener(() => {
@@ -58,6 +68,23 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
     return true;
   }
 
+  if (message.type === "capture-batch") {
+    const payloads = (message.items || []).map((item) =>
+      buildPayload({
+        content: item.content,
+        contentType: item.contentType || "text_selection",
+        captureMethod: item.captureMethod || "popup",
+        sourceUrl: item.sourceUrl || "",
+        sourceTitle: item.sourceTitle || "",
+        precedingText: item.precedingText || "",
+        followingText: item.followingText || "",
+        userNote: item.userNote || "",
+      })
+    );
+    sendBatchToNativeHost(payloads, sendResponse);
+    return true;
+  }
+
   return false;
 });
 
@@ -125,7 +152,203 @@ function buildPayload({
 
 // --- Native Messaging ---
 
+// A single long-lived port is shared by all captures so the host process
+// is spawned once and reused. The host exits on its own after an idle
+// period; the next capture simply opens a new port. If the persistent
+// port fails, the capture is retried over a one-shot connection.
+
+let nativePort = null;
+const pendingCaptures = new Map(); // capture id -> { respond, fallback }
+
 function sendToNativeHost(payload, callback) {
+  if (typeof payload.content === "string" && payload.content.length > CHUNK_THRESHOLD_CHARS) {
+    sendChunkedToNativeHost(payload, callback);
+    return;
+  }
+
+  let responded = false;
+
+  function respond(result) {
+    if (responded) return;
+    responded = true;
+    if (callback) callback(result);
+  }
+
+  const timeoutId = setTimeout(() => {
+    pendingCaptures.delete(payload.id);
+    respond({ success: false, error: "Native host timed out" });
+  }, NATIVE_HOST_TIMEOUT_MS);
+
+  const finish = (result) => {
+    clearTimeout(timeoutId);
+    respond(result);
+  };
+
+  const fallback = () => {
+    clearTimeout(timeoutId);
+    sendToNativeHostOnce(payload, respond);
+  };
+
+  try {
+    const port = getNativePort();
+    pendingCaptures.set(payload.id, { respond: finish, fallback });
+    port.postMessage(payload);
+  } catch (err) {
+    pendingCaptures.delete(payload.id);
+    fallback();
+  }
+}
+
+// Streams a large capture as chunk_start, chunk..., chunk_end, waiting
+// for each acknowledgement before sending the next piece. The host
+// writes the pieces straight to disk and answers chunk_end like a normal
+// capture.
+function sendChunkedToNativeHost(payload, callback) {
+  const { content, ...capture } = payload;
+  const messages = [{ type: "chunk_start", id: payload.id, capture }];
+  let seq = 0;
+  for (let i = 0; i < content.length; ) {
+    let end = Math.min(i + CHUNK_CHARS, content.length);
+    // Never split a surrogate pair across chunks
+    const last = content.charCodeAt(end - 1);
+    if (end < content.length && last >= 0xd800 && last <= 0xdbff) end -= 1;
+    messages.push({ type: "chunk", id: payload.id, seq: seq++, data: content.slice(i, end) });
+    i = end;
+  }
+  messages.push({ type: "chunk_end", id: payload.id, chunks: seq });
+
+  const sendNext = (index) => {
+    sendToNativeHost(messages[index], (result) => {
+      if (!result?.success || index === messages.length - 1) {
+        if (callback) callback(result);
+        return;
+      }
+      sendNext(index + 1);
+    });
+  };
+  sendNext(0);
+}
+
+// Several captures can travel in one message. The host writes them all
+// and syncs once, then answers with a result per capture. A batch too
+// big for one message goes out as several envelopes, one after another;
+// a capture too big for any envelope is streamed on its own. The
+// callback gets one combined reply, with results in the original order.
+function sendBatchToNativeHost(payloads, callback) {
+  const encoder = new TextEncoder();
+  const sends = []; // arrays of payload indices, or a single oversized index
+  let group = [];
+  let groupBytes = 0;
+  payloads.forEach((payload, index) => {
+    const bytes = encoder.encode(JSON.stringify(payload)).length;
+    const long = typeof payload.content === "string" && payload.content.length > CHUNK_THRESHOLD_CHARS;
+    if (long || bytes > BATCH_MAX_BYTES) {
+      sends.push(index);
+      return;
+    }
+    if (group.length && groupBytes + bytes > BATCH_MAX_BYTES) {
+      sends.push(group);
+      group = [];
+      groupBytes = 0;
+    }
+    group.push(index);
+    groupBytes += bytes + 1;
+  });
+  if (group.length) sends.push(group);
+
+  const results = new Array(payloads.length);
+
+  const failAll = (indices, result) => {
+    for (const index of indices) {
+      results[index] = {
+        success: false,
+        id: payloads[index].id,
+        error: result?.error || "Failed to save.",
+      };
+    }
+  };
+
+  const sendNext = (n) => {
+    if (n === sends.length) {
+      const failed = results.filter((r) => !r.success).length;
+      const duplicates = results.filter((r) => r.duplicate).length;
+      if (callback) {
+        callback({
+          success: failed === 0 && results.length > 0,
+          batch: true,
+          written: results.length - failed - duplicates,
+          duplicates,
+          failed,
+          results,
+        });
+      }
+      return;
+    }
+    const send = sends[n];
+    if (!Array.isArray(send)) {
+      sendChunkedToNativeHost(payloads[send], (result) => {
+        if (result?.success) {
+          results[send] = { ...result, id: payloads[send].id };
+        } else {
+          failAll([send], result);
+        }
+        sendNext(n + 1);
+      });
+      return;
+    }
+    const envelope = {
+      type: "batch",
+      id: crypto.randomUUID(),
+      captures: send.map((index) => payloads[index]),
+    };
+    sendToNativeHost(envelope, (result) => {
+      if (Array.isArray(result?.results) && result.results.length === send.length) {
+        send.forEach((index, i) => { results[index] = result.results[i]; });
+      } else {
+        failAll(send, result);
+      }
+      sendNext(n + 1);
+    });
+  };
+  sendNext(0);
+}
+
+function getNativePort() {
+  if (nativePort) return nativePort;
+
+  const port = chrome.runtime.connectNative(NATIVE_HOST_NAME);
+
+  port.onMessage.addListener((response) => {
+    let id = response?.id;
+    if (id === null || id === undefined) {
+      // Errors for unparseable messages carry no id; the host answers
+      // in order, so they belong to the oldest outstanding capture.
+      id = pendingCaptures.keys().next().value;
+    }
+    // A reply for a capture that already timed out is dropped
+    const pending = pendingCaptures.get(id);
+    if (!pending) return;
+    pendingCaptures.delete(id);
+    pending.respond(response);
+  });
+
+  port.onDisconnect.addListener(() => {
+    // Reading lastError marks it as handled.
+    void chrome.runtime.lastError;
+    if (nativePort === port) nativePort = null;
+
+    // Anything still waiting was lost with the port (e.g. the host hit
+    // its idle timeout as we posted). Retry each one-shot.
+    const stranded = Array.from(pendingCaptures.values());
+    pendingCaptures.clear();
+    for (const pending of stranded) pending.fallback();
+  });
+
+  nativePort = port;
+  return port;
+}
+
+function sendToNativeHostOnce(payload, callback) {
   let responded = false;
 
   function respond(result) {
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Build the native host as a precompiled zipapp.
+
+Chrome starts the host once per connection. Run as a plain script,
+Python recompiles ideashelf_host.py on every start, because scripts are
+never cached as bytecode. The zipapp ships the host as ready-made .pyc,
+and its shebang skips the site module, which the stdlib-only host does
+not need.
+
+Usage:
+    python3 build_zipapp.py [--output PATH] [--python INTERPRETER]
+
+The bytecode matches the Python that runs this script. Build with the
+same interpreter the zipapp will run under.
+
+No external dependencies. Python 3 stdlib only.
+"""
+
+import argparse
+import importlib.util
+import io
+import marshal
+import os
+import sys
+import zipapp
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST_SOURCE = os.path.join(HERE, "ideashelf_host.py")
+DEFAULT_OUTPUT = os.path.join(HERE, "ideashelf_host.pyz")
+
+# -S skips site-packages setup. Note that `env -S` is needed to pass
+# arguments through a shebang.
+DEFAULT_INTERPRETER = "/usr/bin/env -S python3 -S"
+
+MAIN = b"import ideashelf_host\nideashelf_host.main()\n"
+
+
+def compile_module(source_path):
+    """Return .pyc bytes for a source file, checked by hash not mtime.
+
+    Hash-based (unchecked) pyc stays valid inside the archive, where
+    there is no source file to compare timestamps against.
+    """
+    with open(source_path, "rb") as f:
+        source = f.read()
+    code = compile(source, source_path, "exec", dont_inherit=True, optimize=0)
+    data = bytearray(importlib.util.MAGIC_NUMBER)
+    data += (0b01).to_bytes(4, "little")  # hash-based, unchecked
+    data += importlib.util.source_hash(source)
+    data += marshal.dumps(code)
+    return bytes(data)
+
+
+def build(output=DEFAULT_OUTPUT, interpreter=DEFAULT_INTERPRETER):
+    """Write the zipapp and return its path."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("__main__.py", MAIN)
+        zf.writestr("ideashelf_host.pyc", compile_module(HOST_SOURCE))
+
+    buffer.seek(0)
+    zipapp.create_archive(buffer, output, interpreter=interpreter)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build ideashelf_host.pyz")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Archive path")
+    parser.add_argument(
+        "--python", default=DEFAULT_INTERPRETER,
+        help=f"Shebang interpreter (default: {DEFAULT_INTERPRETER})",
+    )
+    args = parser.parse_args(argv)
+    path = build(args.output, args.python)
+    print(f"Built {path} for Python {sys.version_info.major}.{sys.version_info.minor}")
+
+
+if __name__ == "__main__":
+    main()
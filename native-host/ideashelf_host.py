@@ -4,7 +4,13 @@ IdeaShelf Native Messaging Host
 
 Receives JSON capture payloads from the Chrome extension via the native
 messaging protocol (4-byte length prefix + JSON) and writes them as
-individual .json files to the inbox folder.
+individual .json files to the inbox folder. Captures larger than one
+message are streamed in chunks (see ChunkedUploads).
+
+By default the host stays alive for the lifetime of the extension's port
+and handles any number of captures, exiting when Chrome closes stdin or
+after IDLE_TIMEOUT_SECONDS without a message. Pass --once for the original
+read-one-message-and-exit behaviour.
 
 No external dependencies. Python 3 stdlib only.
 """
@@ -14,43 +20,213 @@ import os
 import re
 import struct
 import sys
+import time
+import zlib
+
+# Chrome starts a fresh host process per connection, so modules only some
+# code paths need (fcntl for the capture log, select for persistent mode)
+# are imported where they are used.
 
 DEFAULT_INBOX = os.path.expanduser("~/IdeaShelf/inbox/")
 
 REQUIRED_FIELDS = ["id", "captured_at", "content_type", "content"]
 
+# Safety limit: reject messages over 1 MB
+MAX_MESSAGE_BYTES = 1_048_576
+
+# Persistent mode: exit after this many seconds without a message
+IDLE_TIMEOUT_SECONDS = 30
+
+# Inbox backend. "files" writes one <id>.json per capture. "log" appends
+# captures to rotating segment files under inbox/log/, which the inbox
+# processor consumes sequentially.
+INBOX_FORMAT = "files"
+
+LOG_DIRNAME = "log"
+SEGMENT_SUFFIX = ".seg"
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+
+# Log record: u32 payload length, u32 CRC-32 of the payload, u8 flags
+# (0 = plain UTF-8 JSON, RECORD_GZIP = gzip-compressed JSON), then the
+# payload. Little-endian like the native messaging frame header.
+RECORD_HEADER = struct.Struct("<IIB")
+RECORD_GZIP = 0x01
+
+# How captures are stored. "pretty" writes indented JSON that is easy to
+# read. "compact" writes minified JSON and gzip-compresses any capture
+# whose JSON is over COMPRESS_OVER_BYTES, which shrinks typical page
+# captures several times over. File names stay <id>.json either way; the
+# inbox processor tells the forms apart by the gzip magic number, and
+# `zcat -f` prints them all. The log always holds minified JSON, and
+# compresses records past the same threshold in "compact" mode. The
+# IDEASHELF_CAPTURE_ENCODING environment variable overrides this.
+CAPTURE_ENCODING = "pretty"
+COMPRESS_OVER_BYTES = 4096
+COMPRESS_LEVEL = 6
+
+# How hard to try to make captures survive a crash or power loss. Files
+# are always written to a temporary name and renamed into place, so
+# readers never see half-written captures. On top of that:
+#   "none"  - leave flushing to the OS
+#   "file"  - fsync each capture and the inbox before replying
+#   "batch" - fsync outstanding captures together once SYNC_EVERY_FILES
+#             have accumulated or SYNC_EVERY_MS have passed, and when the
+#             host exits. A crash can lose at most that window.
+DURABILITY = "batch"
+SYNC_EVERY_FILES = 64
+SYNC_EVERY_MS = 200
+
+# Chunked transfer: a capture too large for one message is sent as
+# chunk_start, any number of chunk messages, then chunk_end. The content
+# is streamed to a hidden .partial file in the inbox as it arrives.
+MAX_CAPTURE_BYTES = 64 * 1024 * 1024
+PARTIAL_SUFFIX = ".partial"
+COPY_BLOCK_BYTES = 1024 * 1024
+
+# Retried sends. The host remembers which capture ids it has stored in
+# inbox/.seen: a Bloom filter of every id plus an exact ring of the most
+# recent SEEN_RING_SLOTS. A retry of a recent capture is acknowledged as a
+# duplicate from memory. An id the filter may have seen is confirmed
+# against inbox/ and inbox/processed/ first, since the filter can give
+# false positives; an id it has never seen is stored without any check.
+# 1 MiB of filter keeps false positives under 0.1% up to ~500,000 ids.
+SEEN_INDEX = True
+SEEN_NAME = ".seen"
+SEEN_BLOOM_BYTES = 1024 * 1024
+SEEN_HASHES = 7
+SEEN_RING_SLOTS = 4096
+
+# Per-connection stage timings and counters. When this names a file (or
+# the IDEASHELF_HOST_METRICS environment variable does), the host appends
+# one JSON line to it as each connection closes.
+METRICS_PATH = None
+
+
+class MessageError(Exception):
+    """A framed message was received but cannot be used."""
+
+
+def _read_exact(stream, size):
+    """Read exactly `size` bytes, or fewer only if the stream hits EOF."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _discard(stream, size):
+    """Skip `size` bytes so the next frame header lines up."""
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(min(remaining, 65536))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+
+
+class Stats:
+    """Stage timings, counters and peak queue depths for one connection."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}  # stage -> [count, seconds]
+        self.counters = {}
+        self.peaks = {}
+
+    def add(self, stage, seconds):
+        entry = self.stages.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def peak(self, name, value):
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+
+    def record(self):
+        return {
+            "time": round(time.time(), 3),
+            "started": round(self.started, 3),
+            "pid": os.getpid(),
+            "stages": {
+                stage: {"count": count, "seconds": round(seconds, 6)}
+                for stage, (count, seconds) in self.stages.items()
+            },
+            "counters": dict(self.counters),
+            "peaks": dict(self.peaks),
+        }
+
+    def write(self, path):
+        """Append this connection's figures as one JSON line."""
+        try:
+            with open(os.path.expanduser(path), "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.record()) + "\n")
+        except OSError as e:
+            print(f"IdeaShelf: cannot write metrics: {e}", file=sys.stderr)
+
+
+def get_metrics_path():
+    return os.environ.get("IDEASHELF_HOST_METRICS") or METRICS_PATH
+
+
+def get_capture_encoding():
+    return os.environ.get("IDEASHELF_CAPTURE_ENCODING") or CAPTURE_ENCODING
 
-def read_message():
+
+def read_message(stream=None, stats=None):
     """Read a native messaging message from stdin.
 
     Chrome native messaging protocol: 4-byte unsigned int (little-endian)
     indicating message length, followed by the JSON-encoded message.
+
+    Returns None on EOF. Raises MessageError for a frame that was read
+    but rejected, leaving the stream positioned at the next frame.
     """
-    raw_length = sys.stdin.buffer.read(4)
+    if stream is None:
+        stream = sys.stdin.buffer
+
+    raw_length = _read_exact(stream, 4)
     if not raw_length or len(raw_length) < 4:
         return None
 
     message_length = struct.unpack("<I", raw_length)[0]
+    if stats is not None:
+        stats.count("bytes_in", 4 + message_length)
     if message_length == 0:
-        return None
+        raise MessageError("Empty message")
 
-    # Safety limit: reject messages over 1 MB
-    if message_length > 1_048_576:
-        return None
+    if message_length > MAX_MESSAGE_BYTES:
+        _discard(stream, message_length)
+        raise MessageError(
+            f"Message too large ({message_length} bytes, limit {MAX_MESSAGE_BYTES})"
+        )
 
-    raw_message = sys.stdin.buffer.read(message_length)
+    raw_message = _read_exact(stream, message_length)
     if len(raw_message) < message_length:
         return None
 
     return json.loads(raw_message.decode("utf-8"))
 
 
-def send_message(msg):
-    """Send a native messaging response back to Chrome."""
+def send_message(msg, stream=None):
+    """Send a native messaging response back to Chrome.
+
+    Returns the number of bytes written.
+    """
+    if stream is None:
+        stream = sys.stdout.buffer
+
     encoded = json.dumps(msg).encode("utf-8")
-    sys.stdout.buffer.write(struct.pack("<I", len(encoded)))
-    sys.stdout.buffer.write(encoded)
-    sys.stdout.buffer.flush()
+    stream.write(struct.pack("<I", len(encoded)) + encoded)
+    stream.flush()
+    return 4 + len(encoded)
 
 
 def validate_payload(payload):
@@ -94,70 +270,1003 @@ def sanitize_id(raw_id):
     return safe or "unknown"
 
 
-def write_capture(payload, inbox_path):
+def write_capture(payload, inbox_path, durability=None):
     """Write the capture payload as a JSON file in the inbox.
 
+    The file appears atomically under its final name. `durability`
+    defaults to DURABILITY.
+
     Returns (success, error_message, filepath).
     """
     capture_id = sanitize_id(payload.get("id", "unknown"))
     filename = f"{capture_id}.json"
     filepath = os.path.join(inbox_path, filename)
+    mode = DURABILITY if durability is None else durability
 
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2, ensure_ascii=False)
+        data, _ = encode_capture(payload)
+        write_atomic(filepath, data, fsync=mode == "file")
+        if mode == "file":
+            _fsync_directory(inbox_path)
+        elif mode == "batch":
+            pending_sync.add(filepath)
         return True, "", filepath
     except OSError as e:
         return False, f"Failed to write file: {e}", ""
 
 
-def get_inbox_path():
-    """Determine the inbox path. Could be extended to read from config."""
-    return DEFAULT_INBOX
+def compact_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def gzip_compressor():
+    # wbits 16+ writes a gzip header with no name and a zero mtime
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def encode_capture(payload, minified=False, encoding=None):
+    """Serialize a capture for storage in `encoding`, by default
+    get_capture_encoding().
+
+    minified=True skips indentation even in "pretty" mode, for the log.
+    Returns (data, compressed).
+    """
+    compact = (encoding or get_capture_encoding()) == "compact"
+    if not compact and not minified:
+        return json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8"), False
+    data = compact_json(payload)
+    if compact and len(data) > COMPRESS_OVER_BYTES:
+        compressor = gzip_compressor()
+        packed = compressor.compress(data) + compressor.flush()
+        if len(packed) < len(data):
+            return packed, True
+    return data, False
 
 
-def main():
-    """Main loop: read one message, process it, respond, and exit.
+def write_atomic(path, data, fsync=False):
+    """Write bytes to a hidden temporary file and rename it over `path`.
 
-    Native messaging hosts are launched per-connection by Chrome.
+    The temporary name starts with a dot and does not end in .json, so
+    the inbox processor never picks it up.
     """
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
     try:
-        payload = read_message()
-    except json.JSONDecodeError:
-        send_message({"success": False, "error": "Invalid JSON in message"})
-        return
-    except Exception as e:
-        send_message({"success": False, "error": f"Read error: {e}"})
-        return
+        try:
+            _write_all(fd, data)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
 
-    if payload is None:
-        send_message({"success": False, "error": "No message received"})
-        return
+
+class PendingSync:
+    """Captures written but not yet fsynced, for DURABILITY = "batch".
+
+    Files are synced one after another and each containing directory
+    once, so a burst of captures costs one pass instead of an fsync per
+    capture on the reply path.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.seen = []  # (inbox_path, capture_ids) to remember once synced
+        self.since = None
+        self.stats = None  # The current connection's Stats, if any
+
+    def add(self, path):
+        if not self.paths:
+            self.since = time.monotonic()
+        self.paths.append(path)
+        if self.stats is not None:
+            self.stats.peak("pending_sync", len(self.paths))
+        if len(self.paths) >= SYNC_EVERY_FILES:
+            self.flush()
+
+    def remember(self, inbox_path, capture_ids):
+        """Add captures to the seen index once the pending group is synced."""
+        if self.paths:
+            self.seen.append((inbox_path, capture_ids))
+        else:
+            remember_seen(inbox_path, capture_ids)  # Already synced
+
+    def remaining(self):
+        """Seconds until the pending group is due, or None if empty."""
+        if not self.paths:
+            return None
+        return max(0.0, self.since + SYNC_EVERY_MS / 1000 - time.monotonic())
+
+    def flush(self):
+        paths, self.paths = self.paths, []
+        if not paths:
+            return
+        started = time.perf_counter()
+        try:
+            _fsync_files(paths)
+            for directory in sorted({os.path.dirname(p) for p in paths}):
+                _fsync_directory(directory)
+        except OSError as e:
+            # The data is still in the page cache; nothing to retry.
+            print(f"IdeaShelf: fsync failed: {e}", file=sys.stderr)
+            if self.stats is not None:
+                self.stats.count("sync_errors")
+        if self.stats is not None:
+            self.stats.add("sync", time.perf_counter() - started)
+            self.stats.count("synced_files", len(paths))
+        seen, self.seen = self.seen, []
+        for inbox_path, capture_ids in seen:
+            remember_seen(inbox_path, capture_ids)
+
+
+pending_sync = PendingSync()
+
+
+SEEN_HEADER = struct.Struct("<8sIII")  # magic, bloom bytes, ring slots, next slot
+SEEN_MAGIC = b"ISSEEN1\0"
+SEEN_DIGEST_BYTES = 16
+
+
+class SeenIndex:
+    """Capture ids stored in an inbox, in a memory-mapped file.
+
+    Lookups read the map without locking: bits are only ever set, and a
+    ring slot overwritten mid-read at worst sends a lookup to the
+    filesystem check. Updates take an flock, so concurrent host processes
+    share one index.
+    """
+
+    def __init__(self, path, bloom_bytes=None, ring_slots=None):
+        import fcntl
+        import mmap
+
+        bloom_bytes = bloom_bytes or SEEN_BLOOM_BYTES
+        ring_slots = ring_slots or SEEN_RING_SLOTS
+
+        self.bloom_bits = bloom_bytes * 8
+        self.ring_start = SEEN_HEADER.size + bloom_bytes
+        self.ring_slots = ring_slots
+        size = self.ring_start + ring_slots * SEEN_DIGEST_BYTES
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(self.fd, SEEN_HEADER.size, 0)
+                if (os.fstat(self.fd).st_size != size or header[:8] != SEEN_MAGIC
+                        or SEEN_HEADER.unpack(header)[1:3] != (bloom_bytes, ring_slots)):
+                    # New, damaged or sized differently: start afresh
+                    os.ftruncate(self.fd, 0)
+                    os.ftruncate(self.fd, size)
+                    os.pwrite(self.fd, SEEN_HEADER.pack(SEEN_MAGIC, bloom_bytes, ring_slots, 0), 0)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.map = mmap.mmap(self.fd, size)
+        except (OSError, ValueError):
+            os.close(self.fd)
+            raise
+
+    @staticmethod
+    def digest(capture_id):
+        import hashlib
+
+        return hashlib.blake2b(
+            str(capture_id).encode("utf-8"), digest_size=SEEN_DIGEST_BYTES
+        ).digest()
+
+    def _bits(self, digest):
+        # Double hashing: k bit positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        offset = SEEN_HEADER.size * 8
+        return [offset + (h1 + i * h2) % self.bloom_bits for i in range(SEEN_HASHES)]
+
+    def check(self, capture_id):
+        """"recent" if the id is in the ring, "maybe" if the filter has it,
+        None if it has certainly never been added."""
+        digest = self.digest(capture_id)
+        data = self.map
+        for bit in self._bits(digest):
+            if not data[bit >> 3] & (1 << (bit & 7)):
+                return None
+        end = self.ring_start + self.ring_slots * SEEN_DIGEST_BYTES
+        pos = data.find(digest, self.ring_start, end)
+        while pos != -1:
+            if (pos - self.ring_start) % SEEN_DIGEST_BYTES == 0:
+                return "recent"
+            pos = data.find(digest, pos + 1, end)
+        return "maybe"
+
+    def add_many(self, capture_ids):
+        import fcntl
+
+        data = self.map
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            magic, bloom_bytes, ring_slots, slot = SEEN_HEADER.unpack_from(data, 0)
+            for capture_id in capture_ids:
+                digest = self.digest(capture_id)
+                for bit in self._bits(digest):
+                    data[bit >> 3] |= 1 << (bit & 7)
+                start = self.ring_start + slot * SEEN_DIGEST_BYTES
+                data[start:start + SEEN_DIGEST_BYTES] = digest
+                slot = (slot + 1) % ring_slots
+            SEEN_HEADER.pack_into(data, 0, magic, bloom_bytes, ring_slots, slot)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+_seen_indexes = {}
+
+
+def open_seen_index(inbox_path):
+    """The inbox's SeenIndex, or None if disabled or unusable."""
+    if not SEEN_INDEX:
+        return None
+    index = _seen_indexes.get(inbox_path)
+    if index is None:
+        try:
+            index = SeenIndex(os.path.join(inbox_path, SEEN_NAME))
+        except (OSError, ValueError) as e:
+            print(f"IdeaShelf: seen-id index unavailable: {e}", file=sys.stderr)
+            index = False
+        _seen_indexes[inbox_path] = index
+    return index or None
+
+
+def seen_before(capture_id, inbox_path):
+    """True if this capture was already stored, i.e. the send is a retry."""
+    index = open_seen_index(inbox_path)
+    if index is None:
+        return False
+    state = index.check(capture_id)
+    if state == "recent":
+        return True
+    if state == "maybe":
+        # Rule out a false positive. Older captures may be archived by
+        # now; the processor skips ids it has already rendered.
+        name = f"{sanitize_id(capture_id)}.json"
+        return (os.path.exists(os.path.join(inbox_path, name))
+                or os.path.exists(os.path.join(inbox_path, "processed", name)))
+    return False
+
+
+def remember_seen(inbox_path, capture_ids):
+    index = open_seen_index(inbox_path)
+    if index is not None and capture_ids:
+        try:
+            index.add_many(capture_ids)
+        except OSError as e:
+            print(f"IdeaShelf: cannot update seen-id index: {e}", file=sys.stderr)
+
+
+def remember_stored(inbox_path, capture_ids):
+    """Add stored captures to the seen index once they are durable."""
+    if DURABILITY == "batch":
+        pending_sync.remember(inbox_path, capture_ids)
+    else:
+        remember_seen(inbox_path, capture_ids)
+
+
+def duplicate_response(capture_id):
+    return {"success": True, "id": capture_id, "duplicate": True}
+
+
+def encode_record(payload):
+    """Encode a capture as one log record."""
+    data, compressed = encode_capture(payload, minified=True)
+    flags = RECORD_GZIP if compressed else 0
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data), flags) + data
+
+
+def _active_segment(log_dir, incoming_bytes):
+    """Return the segment to append to, starting a new one when full.
+
+    Must be called with the log lock held.
+    """
+    segments = sorted(
+        name for name in os.listdir(log_dir) if name.endswith(SEGMENT_SUFFIX)
+    )
+    if not segments:
+        return os.path.join(log_dir, f"{1:012d}{SEGMENT_SUFFIX}")
+
+    last = segments[-1]
+    path = os.path.join(log_dir, last)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if size and size + incoming_bytes > SEGMENT_MAX_BYTES:
+        seq = int(last[:-len(SEGMENT_SUFFIX)]) + 1
+        return os.path.join(log_dir, f"{seq:012d}{SEGMENT_SUFFIX}")
+    return path
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def append_capture(payload, inbox_path):
+    """Append the capture as a record to the active log segment.
+
+    Returns (success, error_message, segment_path).
+    """
+    ok, err, paths = append_captures([payload], inbox_path, sync=DURABILITY == "file")
+    if ok and DURABILITY == "batch":
+        pending_sync.add(paths[0])
+    return ok, err, paths[0] if paths else ""
+
+
+def append_captures(payloads, inbox_path, sync=False):
+    """Append captures to the log in as few writes as possible.
+
+    Appends are serialized across host processes with an flock on
+    log/.lock, which also makes rotation safe: a segment only stops
+    growing once its successor exists. Records bound for the same segment
+    go out in a single write. With sync=True each touched segment is
+    fsynced once, after all records are written.
+
+    Returns (success, error_message, segment_paths), one path per payload.
+    """
+    import fcntl
+
+    log_dir = os.path.join(inbox_path, LOG_DIRNAME)
+    records = [encode_record(payload) for payload in payloads]
+    paths = []
+
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        lock_fd = os.open(os.path.join(log_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            pending = []
+            segment_path = None
+            size = 0
+
+            def flush():
+                fd = os.open(segment_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    _write_all(fd, b"".join(pending))
+                    if sync:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+            for record in records:
+                if segment_path is None:
+                    segment_path = _active_segment(log_dir, len(record))
+                    size = os.path.getsize(segment_path) if os.path.exists(segment_path) else 0
+                elif size and size + len(record) > SEGMENT_MAX_BYTES:
+                    flush()
+                    pending = []
+                    segment_path = _active_segment(log_dir, len(record))
+                    size = 0
+                pending.append(record)
+                size += len(record)
+                paths.append(segment_path)
+            if pending:
+                flush()
+            if sync:
+                _fsync_directory(log_dir)
+        finally:
+            os.close(lock_fd)
+        return True, "", paths
+    except OSError as e:
+        return False, f"Failed to append to capture log: {e}", []
+
+
+def append_record_file(path, length, crc, inbox_path, sync=False, flags=0):
+    """Append a capture whose JSON is already in a file as one log record.
+
+    The file is copied into the segment in blocks, so the record never has
+    to fit in memory. `length`, `crc` and `flags` describe the file's
+    contents.
+
+    Returns (success, error_message, segment_path).
+    """
+    import fcntl
+
+    log_dir = os.path.join(inbox_path, LOG_DIRNAME)
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        lock_fd = os.open(os.path.join(log_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            segment_path = _active_segment(log_dir, RECORD_HEADER.size + length)
+            fd = os.open(segment_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                _write_all(fd, RECORD_HEADER.pack(length, crc, flags))
+                with open(path, "rb") as src:
+                    while True:
+                        block = src.read(COPY_BLOCK_BYTES)
+                        if not block:
+                            break
+                        _write_all(fd, block)
+                if sync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        finally:
+            os.close(lock_fd)
+        return True, "", segment_path
+    except OSError as e:
+        return False, f"Failed to append to capture log: {e}", ""
+
+
+def _fsync_directory(path):
+    """Make renames and new entries in a directory durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_files(paths):
+    """Flush already-written files to disk, one fsync each, back to back."""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def store_capture(payload, inbox_path):
+    """Store a capture using the configured INBOX_FORMAT.
+
+    Returns (success, error_message, path).
+    """
+    if INBOX_FORMAT == "log":
+        return append_capture(payload, inbox_path)
+    return write_capture(payload, inbox_path)
+
+
+def get_inbox_path():
+    """Determine the inbox path.
+
+    IDEASHELF_INBOX overrides DEFAULT_INBOX, for tests and benchmarks that
+    launch the host as a separate process.
+    """
+    override = os.environ.get("IDEASHELF_INBOX")
+    return os.path.expanduser(override) if override else DEFAULT_INBOX
+
+
+def handle_message(message, uploads=None):
+    """Validate and store one capture, or a batch of them.
+
+    A batch is either a JSON array of captures or an envelope
+    {"type": "batch", "id": ..., "captures": [...]}. Chunked transfer
+    messages go to `uploads`, the connection's ChunkedUploads.
+
+    Returns the response dict to send back to the extension. The capture
+    (or envelope) id is echoed whenever one is present so the extension
+    can match responses to requests on a shared port.
+    """
+    if isinstance(message, list):
+        return handle_batch(message)
+    if isinstance(message, dict) and message.get("type") == "batch":
+        captures = message.get("captures")
+        if not isinstance(captures, list):
+            response = {"success": False, "error": "Field 'captures' must be a list"}
+        else:
+            response = handle_batch(captures)
+        if message.get("id") is not None:
+            response["id"] = message["id"]
+        return response
+    if isinstance(message, dict) and message.get("type") in CHUNK_TYPES:
+        if uploads is None:
+            return {
+                "success": False,
+                "id": message.get("id"),
+                "error": "Chunked transfer needs a persistent connection",
+            }
+        return uploads.handle(message)
+
+    payload = message
+    capture_id = payload.get("id") if isinstance(payload, dict) else None
+
+    def failure(error):
+        response = {"success": False, "error": error}
+        if capture_id is not None:
+            response["id"] = capture_id
+        return response
 
     # Validate
     valid, err = validate_payload(payload)
     if not valid:
-        send_message({"success": False, "error": err})
-        return
+        return failure(err)
 
     # Ensure inbox exists
     inbox_path = get_inbox_path()
     ok, err = ensure_inbox(inbox_path)
     if not ok:
-        send_message({"success": False, "error": err})
-        return
+        return failure(err)
+
+    # A retried send of a capture that is already stored
+    if seen_before(capture_id, inbox_path):
+        return duplicate_response(capture_id)
 
     # Write capture
-    ok, err, filepath = write_capture(payload, inbox_path)
+    ok, err, filepath = store_capture(payload, inbox_path)
     if not ok:
-        send_message({"success": False, "error": err})
-        return
+        return failure(err)
+    remember_stored(inbox_path, [capture_id])
 
-    send_message({
+    return {
         "success": True,
-        "id": payload.get("id"),
+        "id": capture_id,
         "path": filepath,
-    })
+    }
+
+
+def handle_batch(captures):
+    """Validate and store many captures with one group commit.
+
+    Each capture is validated on its own; invalid ones are reported and
+    the rest are still written. All writes happen first and are then made
+    durable together according to DURABILITY (one fsync pass plus one
+    directory fsync, or a single fsync per log segment), instead of
+    paying a sync per capture.
+
+    Captures already stored by an earlier send are acknowledged with
+    "duplicate": true instead of being written again.
+
+    Returns {"success", "batch", "written", "duplicates", "failed",
+    "results"} where results holds one {"id", "success",
+    "path"|"duplicate"|"error"} per capture, in order.
+    """
+    results = []
+    accepted = []
+    for payload in captures:
+        capture_id = payload.get("id") if isinstance(payload, dict) else None
+        valid, err = validate_payload(payload)
+        if valid:
+            results.append({"success": True, "id": capture_id})
+            accepted.append(len(results) - 1)
+        else:
+            results.append({"success": False, "id": capture_id, "error": err})
+
+    def fail_accepted(error):
+        for index in accepted:
+            results[index] = {
+                "success": False, "id": results[index]["id"], "error": error,
+            }
+
+    if accepted:
+        inbox_path = get_inbox_path()
+        ok, err = ensure_inbox(inbox_path)
+        if ok:
+            fresh = []
+            for index in accepted:
+                if seen_before(results[index]["id"], inbox_path):
+                    results[index] = duplicate_response(results[index]["id"])
+                else:
+                    fresh.append(index)
+            accepted = fresh
+        if not ok:
+            fail_accepted(err)
+        elif not accepted:
+            pass  # Nothing new to store
+        elif INBOX_FORMAT == "log":
+            ok, err, paths = append_captures(
+                [captures[i] for i in accepted], inbox_path,
+                sync=DURABILITY == "file",
+            )
+            if not ok:
+                fail_accepted(err)
+            else:
+                for index, path in zip(accepted, paths):
+                    results[index]["path"] = path
+                if DURABILITY == "batch":
+                    for path in sorted(set(paths)):
+                        pending_sync.add(path)
+        else:
+            written = []
+            for index in accepted:
+                ok, err, filepath = write_capture(
+                    captures[index], inbox_path, durability="none"
+                )
+                if ok:
+                    results[index]["path"] = filepath
+                    written.append(filepath)
+                else:
+                    results[index] = {
+                        "success": False, "id": results[index]["id"], "error": err,
+                    }
+            if DURABILITY == "file":
+                try:
+                    _fsync_files(written)
+                    _fsync_directory(inbox_path)
+                except OSError as e:
+                    fail_accepted(f"Failed to sync captures: {e}")
+            elif DURABILITY == "batch":
+                for filepath in written:
+                    pending_sync.add(filepath)
+        stored = [results[i]["id"] for i in accepted if results[i]["success"]]
+        if stored:
+            remember_stored(inbox_path, stored)
+
+    failed = sum(1 for result in results if not result["success"])
+    duplicates = sum(1 for result in results if result.get("duplicate"))
+    return {
+        "success": failed == 0 and bool(results),
+        "batch": True,
+        "written": len(results) - failed - duplicates,
+        "duplicates": duplicates,
+        "failed": failed,
+        "results": results,
+    }
+
+
+CHUNK_TYPES = ("chunk_start", "chunk", "chunk_end")
+
+
+class Upload:
+    """A capture being streamed to a .partial file."""
+
+    def __init__(self, capture_id, path, f):
+        self.capture_id = capture_id
+        self.path = path
+        self.file = f
+        self.next_seq = 0
+        self.size = 0  # JSON bytes received
+        self.stored = 0  # Bytes written to the file
+        self.crc = 0  # Of the stored bytes
+        self.has_content = False
+        # Chunked captures are large, so "compact" always compresses them
+        self.compressed = get_capture_encoding() == "compact"
+        self.compressor = gzip_compressor() if self.compressed else None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self._store(data)
+
+    def close(self, fsync=False):
+        """Finish the stored bytes and close the file."""
+        if self.compressor is not None:
+            self._store(self.compressor.flush())
+            self.compressor = None
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+    def _store(self, data):
+        self.file.write(data)
+        self.stored += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+
+class ChunkedUploads:
+    """Captures arriving in chunks over one connection, keyed by capture id.
+
+    chunk_start carries the capture without its content:
+        {"type": "chunk_start", "id": ..., "capture": {...}}
+    each chunk carries the next piece of content, numbered from 0:
+        {"type": "chunk", "id": ..., "seq": n, "data": "..."}
+    and chunk_end commits it:
+        {"type": "chunk_end", "id": ..., "chunks": n}
+
+    The capture's JSON is written incrementally (metadata first, then the
+    content string escaped chunk by chunk), so memory use does not depend
+    on the capture size. chunk_end renames the finished file into the
+    inbox, or copies it into the capture log as a single record.
+    """
+
+    def __init__(self):
+        self.active = {}
+
+    def handle(self, message):
+        capture_id = message.get("id")
+        if not isinstance(capture_id, str) or not capture_id:
+            # Uploads are keyed by id, so it must be a usable key
+            return {"success": False, "id": capture_id,
+                    "error": "Field 'id' must be a non-empty string"}
+        handler = {
+            "chunk_start": self.start,
+            "chunk": self.append,
+            "chunk_end": self.finish,
+        }[message["type"]]
+        try:
+            response = handler(capture_id, message)
+        except OSError as e:
+            self.abort(capture_id)
+            response = {"success": False, "error": f"Failed to write chunk: {e}"}
+        response["id"] = capture_id
+        return response
+
+    def start(self, capture_id, message):
+        capture = message.get("capture")
+        if not isinstance(capture, dict):
+            return {"success": False, "error": "Field 'capture' must be a JSON object"}
+        missing = [f for f in REQUIRED_FIELDS if f != "content" and f not in capture]
+        if missing:
+            return {"success": False, "error": f"Missing required fields: {', '.join(missing)}"}
+        if capture.get("id") != capture_id:
+            return {"success": False, "error": "Capture id does not match message id"}
+
+        inbox_path = get_inbox_path()
+        ok, err = ensure_inbox(inbox_path)
+        if not ok:
+            return {"success": False, "error": err}
+
+        self.abort(capture_id)  # A restarted upload replaces the old one
+        name = sanitize_id(capture_id)
+        path = os.path.join(inbox_path, f".{name}.json{PARTIAL_SUFFIX}")
+        upload = Upload(capture_id, path, open(path, "wb"))
+        self.active[capture_id] = upload
+
+        metadata = {k: v for k, v in capture.items() if k != "content"}
+        head = json.dumps(metadata, ensure_ascii=False, separators=(",", ":"))[:-1]
+        upload.write(((head + ",") if metadata else "{").encode("utf-8"))
+        upload.write(b'"content":"')
+        return {"success": True}
+
+    def append(self, capture_id, message):
+        upload = self.active.get(capture_id)
+        if upload is None:
+            return {"success": False, "error": "No chunked capture in progress"}
+        data = message.get("data")
+        if message.get("seq") != upload.next_seq or not isinstance(data, str):
+            self.abort(capture_id)
+            return {"success": False, "error": f"Expected chunk {upload.next_seq}"}
+
+        # ensure_ascii keeps any stray surrogate escaped rather than
+        # failing to encode; the result is still valid JSON.
+        encoded = json.dumps(data)[1:-1].encode("ascii")
+        if upload.size + len(encoded) > MAX_CAPTURE_BYTES:
+            self.abort(capture_id)
+            return {"success": False, "error": f"Capture exceeds {MAX_CAPTURE_BYTES} bytes"}
+        upload.write(encoded)
+        upload.has_content = upload.has_content or bool(data.strip())
+        upload.next_seq += 1
+        return {"success": True, "received": upload.next_seq}
+
+    def finish(self, capture_id, message):
+        upload = self.active.pop(capture_id, None)
+        if upload is None:
+            return {"success": False, "error": "No chunked capture in progress"}
+        if message.get("chunks", upload.next_seq) != upload.next_seq:
+            self._discard(upload)
+            return {"success": False, "error": "Missing chunks"}
+        if not upload.has_content:
+            self._discard(upload)
+            return {"success": False, "error": "Field 'content' must be a non-empty string"}
+        if seen_before(capture_id, os.path.dirname(upload.path)):
+            self._discard(upload)
+            return duplicate_response(capture_id)
+
+        try:
+            upload.write(b'"}')
+            upload.close(fsync=DURABILITY == "file")
+
+            inbox_path = os.path.dirname(upload.path)
+            if INBOX_FORMAT == "log":
+                ok, err, path = append_record_file(
+                    upload.path, upload.stored, upload.crc, inbox_path,
+                    sync=DURABILITY == "file",
+                    flags=RECORD_GZIP if upload.compressed else 0,
+                )
+                os.unlink(upload.path)
+                if not ok:
+                    return {"success": False, "error": err}
+            else:
+                path = os.path.join(inbox_path, f"{sanitize_id(capture_id)}.json")
+                os.replace(upload.path, path)
+                if DURABILITY == "file":
+                    _fsync_directory(inbox_path)
+            if DURABILITY == "batch":
+                pending_sync.add(path)
+        except OSError:
+            self._discard(upload)
+            raise
+        remember_stored(inbox_path, [capture_id])
+        return {"success": True, "path": path}
+
+    def abort(self, capture_id):
+        upload = self.active.pop(capture_id, None)
+        if upload is not None:
+            self._discard(upload)
+
+    def abort_all(self):
+        for capture_id in list(self.active):
+            self.abort(capture_id)
+
+    def _discard(self, upload):
+        try:
+            upload.file.close()
+            os.unlink(upload.path)
+        except OSError:
+            pass
+
+
+def _wait_readable(stream, timeout):
+    """Block until `stream` has data or EOF, or `timeout` seconds pass.
+
+    Returns False on timeout. Streams without a file descriptor (such as
+    in-memory buffers) are always considered readable.
+    """
+    if timeout is None:
+        return True
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return True
+    import select
+
+    readable, _, _ = select.select([fd], [], [], timeout)
+    return bool(readable)
+
+
+def run_once(stdin=None, stdout=None):
+    """Read one message, process it, respond, and return.
+
+    This is the original per-connection behaviour, kept as a fallback.
+    """
+    stats = Stats()
+    pending_sync.stats = stats
+    try:
+        _run_once(stdin, stdout, stats)
+    finally:
+        pending_sync.stats = None
+        path = get_metrics_path()
+        if path:
+            stats.write(path)
+
+
+def _run_once(stdin, stdout, stats):
+    started = time.perf_counter()
+    try:
+        payload = read_message(stdin, stats)
+    except json.JSONDecodeError:
+        send_message({"success": False, "error": "Invalid JSON in message"}, stdout)
+        return
+    except MessageError as e:
+        send_message({"success": False, "error": str(e)}, stdout)
+        return
+    except Exception as e:
+        send_message({"success": False, "error": f"Read error: {e}"}, stdout)
+        return
+
+    if payload is None:
+        send_message({"success": False, "error": "No message received"}, stdout)
+        return
+
+    read_done = time.perf_counter()
+    stats.add("read", read_done - started)
+    response = handle_message(payload)
+    stats.add("handle", time.perf_counter() - read_done)
+    pending_sync.flush()
+    _record_response(stats, response)
+    stats.count("bytes_out", send_message(response, stdout))
+
+
+def serve(stdin=None, stdout=None, idle_timeout=IDLE_TIMEOUT_SECONDS):
+    """Handle messages on one port until EOF or the idle timeout.
+
+    stdin should be unbuffered so that waiting on its file descriptor
+    reflects all pending input. Returns the number of messages handled.
+    """
+    stats = Stats()
+    pending_sync.stats = stats
+    try:
+        return _serve(stdin, stdout, idle_timeout, stats)
+    finally:
+        pending_sync.stats = None
+        path = get_metrics_path()
+        if path:
+            stats.write(path)
+
+
+def _record_response(stats, response):
+    stats.count("messages")
+    if not response.get("success"):
+        stats.count("errors")
+    elif "written" in response:
+        stats.count("captures", response["written"])
+        stats.count("duplicates", response.get("duplicates", 0))
+    elif "path" in response:
+        stats.count("captures")
+    elif response.get("duplicate"):
+        stats.count("duplicates")
+
+
+def _serve(stdin, stdout, idle_timeout, stats):
+    if stdin is None:
+        stdin = sys.stdin.buffer.raw
+    if stdout is None:
+        stdout = sys.stdout.buffer
+
+    uploads = ChunkedUploads()
+    handled = 0
+    idle_deadline = None if idle_timeout is None else time.monotonic() + idle_timeout
+    while True:
+        # Wake up early to sync captures whose batch window has closed.
+        wait = None if idle_deadline is None else max(0.0, idle_deadline - time.monotonic())
+        due = pending_sync.remaining()
+        if due is not None and (wait is None or due < wait):
+            if not _wait_readable(stdin, due):
+                pending_sync.flush()
+                continue
+        elif not _wait_readable(stdin, wait):
+            break
+
+        started = time.perf_counter()
+        try:
+            payload = read_message(stdin, stats)
+        except json.JSONDecodeError:
+            response = {"success": False, "error": "Invalid JSON in message"}
+        except MessageError as e:
+            response = {"success": False, "error": str(e)}
+        except Exception as e:
+            # The stream itself is broken; report once and stop.
+            _try_send({"success": False, "error": f"Read error: {e}"}, stdout)
+            break
+        else:
+            if payload is None:
+                break  # Chrome closed the port
+            read_done = time.perf_counter()
+            stats.add("read", read_done - started)
+            try:
+                response = handle_message(payload, uploads)
+            except Exception as e:
+                # One bad message must not end the connection for the rest
+                print(f"IdeaShelf: error handling message: {e!r}", file=sys.stderr)
+                response = {"success": False, "error": f"Internal error: {e}"}
+                if isinstance(payload, dict) and payload.get("id") is not None:
+                    response["id"] = payload["id"]
+            stats.add("handle", time.perf_counter() - read_done)
+            stats.peak("uploads_in_progress", len(uploads.active))
+
+        handled += 1
+        _record_response(stats, response)
+        if idle_deadline is not None:
+            idle_deadline = time.monotonic() + idle_timeout
+        sent = _try_send(response, stdout)
+        if not sent:
+            break
+        stats.count("bytes_out", sent)
+
+    uploads.abort_all()  # Incomplete captures die with the connection
+    pending_sync.flush()
+    return handled
+
+
+def _try_send(msg, stream):
+    """Send a response, returning the bytes sent, or 0 if the port has gone away."""
+    try:
+        return send_message(msg, stream)
+    except (BrokenPipeError, ValueError):
+        return 0
+
+
+def main(argv=None):
+    """Entry point.
+
+    Chrome launches the host with the caller's origin as an argument, so
+    unknown arguments are ignored. --once selects one-shot mode.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if "--once" in args:
+        run_once()
+    else:
+        serve()
 
 
 if __name__ == "__main__":
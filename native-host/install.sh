@@ -5,12 +5,22 @@
 # Registers the native messaging host with Chrome so the extension
 # can communicate with the local Python host script.
 #
+# Usage: ./install.sh [--zipapp] [EXTENSION_ID]
+#
+#   --zipapp  Register a precompiled ideashelf_host.pyz (built with
+#             build_zipapp.py) instead of the script. Starts faster.
+#
 
 set -e
 
 SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 HOST_NAME="com.ideashelf.host"
 HOST_SCRIPT="$SCRIPT_DIR/ideashelf_host.py"
+USE_ZIPAPP=0
+if [ "${1:-}" = "--zipapp" ]; then
+    USE_ZIPAPP=1
+    shift
+fi
 MANIFEST_TEMPLATE="$SCRIPT_DIR/$HOST_NAME.json"
 
 # Chrome native messaging host directory on macOS
@@ -29,6 +39,13 @@ fi
 chmod +x "$HOST_SCRIPT"
 echo "[OK] Made ideashelf_host.py executable"
 
+if [ "$USE_ZIPAPP" = "1" ]; then
+    python3 "$SCRIPT_DIR/build_zipapp.py"
+    HOST_SCRIPT="$SCRIPT_DIR/ideashelf_host.pyz"
+    chmod +x "$HOST_SCRIPT"
+    echo "[OK] Built precompiled host: $HOST_SCRIPT"
+fi
+
 # Create the Chrome NMH directory if needed
 mkdir -p "$CHROME_NMH_DIR"
 echo "[OK] Native messaging directory ready"
@@ -41,7 +58,7 @@ if [ -z "$EXTENSION_ID" ]; then
     echo "  1. Load the extension in chrome://extensions (developer mode)"
     echo "  2. Copy the extension ID shown under the extension name"
     echo "  3. Re-run this script with the ID:"
-    echo "     ./install.sh YOUR_EXTENSION_ID"
+    echo "     ./install.sh [--zipapp] YOUR_EXTENSION_ID"
     echo ""
     echo "For now, installing with a placeholder. You can re-run later."
     EXTENSION_ID="EXTENSION_ID_PLACEHOLDER"
@@ -0,0 +1,302 @@
+"""
+IdeaShelf Capture Archive
+
+Packs processed captures from inbox/processed/ into a few compressed
+segment files under inbox/archive/, so that folder no longer fills up
+with one pretty-printed JSON file per capture:
+
+    000000000001.jsonl.gz  000000000002.jsonl.xz  ...  index.sqlite3
+
+A segment is a series of independently compressed blocks (gzip members
+or xz streams, so `zcat`/`xzcat` read a whole segment as JSON lines).
+Each block holds up to BLOCK_BYTES of captures. index.sqlite3 maps every
+capture id to its segment, block offset, block length and line, so
+get() reads and decompresses one block no matter how large the archive
+grows.
+
+Compaction appends blocks to the newest segment and starts a new one
+once it reaches segment_bytes. Blocks are fsynced and indexed before the
+processed files are deleted, and the index records how far each segment
+is valid, so a crash at any point loses nothing: a torn block past that
+point is cut off, and files that were indexed but not yet deleted are
+recognised by id and removed on the next run.
+
+Retention applies to whole closed segments: retention_days drops
+segments whose newest capture was archived longer ago than that, and
+max_bytes drops the oldest segments while the archive is larger.
+
+Configured by the `archive` section of config.yaml. No external
+dependencies. Python 3 stdlib only (lzma if compression is "lzma").
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import capture_codec
+import durable
+
+ARCHIVE_DIRNAME = "archive"
+INDEX_NAME = "index.sqlite3"
+SUFFIXES = {"gzip": ".jsonl.gz", "lzma": ".jsonl.xz"}
+
+# Uncompressed bytes per block: large enough to compress well, small
+# enough that fetching one capture stays cheap.
+BLOCK_BYTES = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    captures INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captures (
+    id TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_segment ON captures (segment);
+"""
+
+
+def _codec(compression):
+    """Return (compress, decompress) for a compression name."""
+    if compression == "gzip":
+        import gzip
+
+        return (lambda data: gzip.compress(data, mtime=0)), gzip.decompress
+    if compression == "lzma":
+        import lzma
+
+        return lzma.compress, lzma.decompress
+    raise ValueError(f"Unknown archive compression: {compression!r}")
+
+
+def _compression_of(segment):
+    for compression, suffix in SUFFIXES.items():
+        if segment.endswith(suffix):
+            return compression
+    raise ValueError(f"Not an archive segment: {segment!r}")
+
+
+class Archive:
+    """Compressed, indexed storage for processed captures."""
+
+    def __init__(self, path, compression="gzip", segment_bytes=64 * 1024 * 1024):
+        _codec(compression)  # Validate early
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.compression = compression
+        self.segment_bytes = max(1, int(segment_bytes))
+        self.conn = sqlite3.connect(os.path.join(path, INDEX_NAME))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def contains(self, capture_id):
+        return self.conn.execute(
+            "SELECT 1 FROM captures WHERE id = ?", (capture_id,)
+        ).fetchone() is not None
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM captures").fetchone()[0]
+
+    def size(self):
+        """Total bytes of all segments."""
+        return self.conn.execute("SELECT coalesce(sum(size), 0) FROM segments").fetchone()[0]
+
+    def get(self, capture_id):
+        """Return an archived capture as a dict, or None."""
+        row = self.conn.execute(
+            "SELECT segment, offset, length, line FROM captures WHERE id = ?",
+            (capture_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, line = row
+        _, decompress = _codec(_compression_of(segment))
+        with open(os.path.join(self.path, segment), "rb") as f:
+            f.seek(offset)
+            block = decompress(f.read(length))
+        return json.loads(block.split(b"\n")[line])
+
+    def iter_captures(self):
+        """Yield every archived capture, one block in memory at a time."""
+        blocks = self.conn.execute(
+            "SELECT DISTINCT segment, offset, length FROM captures ORDER BY segment, offset"
+        ).fetchall()
+        handle = None
+        try:
+            for segment, offset, length in blocks:
+                if handle is None or handle.name != os.path.join(self.path, segment):
+                    if handle is not None:
+                        handle.close()
+                    handle = open(os.path.join(self.path, segment), "rb")
+                    _, decompress = _codec(_compression_of(segment))
+                handle.seek(offset)
+                for line in decompress(handle.read(length)).split(b"\n"):
+                    if line:
+                        yield json.loads(line)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def _active_segment(self):
+        """Return (name, size) of the segment to append to."""
+        suffix = SUFFIXES[self.compression]
+        row = self.conn.execute(
+            "SELECT name, size FROM segments ORDER BY name DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            name, size = row
+            path = os.path.join(self.path, name)
+            # Cut off a block written after the last committed index update
+            if os.path.getsize(path) > size:
+                os.truncate(path, size)
+            if name.endswith(suffix) and size < self.segment_bytes:
+                return name, size
+        number = int(row[0].split(".")[0]) + 1 if row else 1
+        name = f"{number:012d}{suffix}"
+        with open(os.path.join(self.path, name), "wb"):
+            pass
+        self.conn.execute(
+            "INSERT INTO segments (name, size, captures, archived_at) VALUES (?, 0, 0, ?)",
+            (name, time.time()),
+        )
+        self.conn.commit()
+        return name, 0
+
+    def add_many(self, captures):
+        """Append captures (dicts with an "id") and index them durably.
+
+        Captures already in the archive are skipped. Returns the number
+        added.
+        """
+        compress, _ = _codec(self.compression)
+        fresh = {}
+        for capture in captures:
+            capture_id = str(capture["id"])
+            if capture_id not in fresh and not self.contains(capture_id):
+                fresh[capture_id] = capture
+        if not fresh:
+            return 0
+
+        blocks = []
+        lines, ids, used = [], [], 0
+        for capture_id, capture in fresh.items():
+            line = json.dumps(capture, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            lines.append(line)
+            ids.append(capture_id)
+            used += len(line) + 1
+            if used >= BLOCK_BYTES:
+                blocks.append((ids, lines))
+                lines, ids, used = [], [], 0
+        if lines:
+            blocks.append((ids, lines))
+
+        while blocks:
+            name, size = self._active_segment()
+            rows = []
+            with open(os.path.join(self.path, name), "ab") as f:
+                while blocks and size < self.segment_bytes:
+                    ids, lines = blocks.pop(0)
+                    data = compress(b"\n".join(lines) + b"\n")
+                    f.write(data)
+                    rows += [(i, name, size, len(data), n) for n, i in enumerate(ids)]
+                    size += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO captures (id, segment, offset, length, line) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.conn.execute(
+                    "UPDATE segments SET size = ?, captures = captures + ?, archived_at = ? "
+                    "WHERE name = ?",
+                    (size, len(rows), time.time(), name),
+                )
+        return len(fresh)
+
+    def apply_retention(self, retention_days=None, max_bytes=None):
+        """Delete closed segments outside the retention policy.
+
+        The newest segment is never deleted. Returns the number of
+        captures removed.
+        """
+        rows = self.conn.execute(
+            "SELECT name, size, captures, archived_at FROM segments ORDER BY name"
+        ).fetchall()
+        closed = rows[:-1]
+        total = sum(row[1] for row in rows)
+        cutoff = time.time() - retention_days * 86400 if retention_days else None
+        removed = 0
+        for name, size, captures, archived_at in closed:
+            expired = cutoff is not None and archived_at < cutoff
+            over = max_bytes is not None and total > max_bytes
+            if not (expired or over):
+                break  # Segments only get newer from here
+            with self.conn:
+                self.conn.execute("DELETE FROM captures WHERE segment = ?", (name,))
+                self.conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += captures
+        return removed
+
+
+def compact(processed_path, archive, batch_size=1000, limit=None):
+    """Move capture files from processed_path into the archive.
+
+    Returns (archived, failed). Files that cannot be read or parsed are
+    left in place and counted as failed.
+    """
+    try:
+        names = sorted(n for n in os.listdir(processed_path) if n.endswith(".json"))
+    except FileNotFoundError:
+        return 0, 0
+    if limit is not None:
+        names = names[:limit]
+
+    archived = failed = 0
+    for start in range(0, len(names), batch_size):
+        captures, paths = [], []
+        for name in names[start:start + batch_size]:
+            path = os.path.join(processed_path, name)
+            try:
+                capture = capture_codec.load_file(path)
+                if not isinstance(capture, dict):
+                    raise ValueError("not a JSON object")
+            except (OSError, ValueError) as e:
+                print(f"Cannot archive {name}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            capture.setdefault("id", name[:-len(".json")])
+            captures.append(capture)
+            paths.append(path)
+
+        archive.add_many(captures)
+        for path in paths:
+            os.remove(path)
+        archived += len(paths)
+        if paths:
+            durable.fsync_path(processed_path)
+    return archived, failed
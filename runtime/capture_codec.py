@@ -0,0 +1,48 @@
+"""
+IdeaShelf Capture Encoding
+
+The native host can store captures in one of three forms, chosen by
+CAPTURE_ENCODING in ideashelf_host.py:
+
+- "pretty":  indented UTF-8 JSON (the default).
+- "compact": minified UTF-8 JSON.
+- "compact" over COMPRESS_OVER_BYTES: the minified JSON, gzip-compressed.
+
+Inbox files keep their <id>.json names whatever the encoding, so claims,
+processed/ and the archive handle them unchanged; readers tell the forms
+apart by the gzip magic number, which JSON text can never start with.
+`zcat -f` prints any of them. In the capture log a compressed record has
+RECORD_GZIP set in its flags byte.
+"""
+
+import json
+import zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Capture log record flags
+RECORD_GZIP = 0x01
+
+
+def is_compressed(data):
+    return data[:2] == GZIP_MAGIC
+
+
+def decode(data):
+    """Return a stored capture's JSON bytes, decompressing if needed."""
+    if is_compressed(data):
+        try:
+            return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed capture: {e}") from None
+    return data
+
+
+def loads(data):
+    """Parse a stored capture in any encoding."""
+    return json.loads(decode(data))
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
@@ -0,0 +1,269 @@
+"""
+IdeaShelf Capture Log Reader
+
+Consumes the append-only capture log that the native host writes when
+INBOX_FORMAT = "log". Captures live as length-prefixed records in
+rotating segment files under inbox/log/:
+
+    000000000001.seg  000000000002.seg  ...  checkpoint.json  .lock
+
+Each record is a little-endian header (u32 payload length, u32 CRC-32 of
+the payload, u8 flags) followed by the UTF-8 JSON payload, gzip-compressed
+when flags has capture_codec.RECORD_GZIP set. The host only
+ever appends to the highest-numbered segment, under an exclusive flock on
+.lock, so every other segment is immutable.
+
+Progress is kept in checkpoint.json as {"segment": name, "offset": n}
+and advanced after each batch is written. Fully consumed segments are
+deleted. Records that cannot be decoded are copied to inbox/failed/ so
+nothing is silently lost. One processor consumes the log at a time, under
+an exclusive flock on .consumer; a run that finds it held leaves the log
+to the run holding it.
+"""
+
+import fcntl
+import json
+import os
+import struct
+import sys
+import zlib
+
+import capture_codec
+import durable
+
+LOG_DIRNAME = "log"
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_NAME = "checkpoint.json"
+LOCK_NAME = ".lock"
+CONSUMER_LOCK_NAME = ".consumer"
+
+RECORD_HEADER = struct.Struct("<IIB")  # length, crc32, flags
+
+# Upper bound used to reject nonsense lengths when resynchronizing
+MAX_RECORD_BYTES = 64 * 1024 * 1024
+
+
+class LogRecord:
+    """One record from a segment, presented as a pipeline source."""
+
+    def __init__(self, segment, offset, end, data, flags, intact, failed_path):
+        self.segment = segment
+        self.offset = offset
+        self.end = end
+        self.data = data
+        self.flags = flags
+        self.intact = intact
+        self.failed_path = failed_path
+        self.name = f"{LOG_DIRNAME}/{segment}@{offset}"
+
+    def read(self):
+        """Return the record's stored bytes, refusing damaged records."""
+        if not self.intact:
+            raise ValueError("Corrupt log record (bad length or checksum)")
+        if self.flags & ~capture_codec.RECORD_GZIP:
+            raise ValueError(f"Unsupported log record flags: {self.flags:#x}")
+        if bool(self.flags & capture_codec.RECORD_GZIP) != capture_codec.is_compressed(self.data):
+            raise ValueError("Log record flags do not match its payload")
+        return self.data
+
+    def load(self):
+        return capture_codec.loads(self.read())
+
+    def claim(self):
+        return True  # The consumer lock covers the whole log
+
+    def renew(self):
+        return True
+
+    def finish(self):
+        pass  # Retired by advancing the checkpoint
+
+    def fail(self):
+        """Keep a copy of the raw record, since its segment will be deleted.
+
+        Returns the failed/ directory once the copy is written.
+        """
+        stem = self.segment[:-len(SEGMENT_SUFFIX)]
+        try:
+            os.makedirs(self.failed_path, exist_ok=True)
+            path = os.path.join(self.failed_path, f"{stem}-{self.offset}.json")
+            durable.write_atomic(path, self.data, fsync=True)
+        except OSError as e:
+            print(f"Cannot save failed record {self.name}: {e}", file=sys.stderr)
+            return None
+        return self.failed_path
+
+
+def list_segments(log_dir):
+    """Return segment file names in append order."""
+    return sorted(
+        name for name in os.listdir(log_dir) if name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def load_checkpoint(log_dir):
+    """Return the saved {"segment", "offset"} checkpoint, or None."""
+    path = os.path.join(log_dir, CHECKPOINT_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        return {"segment": str(checkpoint["segment"]), "offset": int(checkpoint["offset"])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_checkpoint(log_dir, segment, offset):
+    """Atomically replace the checkpoint file."""
+    path = os.path.join(log_dir, CHECKPOINT_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"segment": segment, "offset": offset}, f)
+    os.replace(tmp, path)
+
+
+def _valid_at(data, pos):
+    """Return (length, flags) if a complete, checksummed record starts at pos."""
+    if pos + RECORD_HEADER.size > len(data):
+        return None
+    length, crc, flags = RECORD_HEADER.unpack_from(data, pos)
+    start = pos + RECORD_HEADER.size
+    if length == 0 or length > MAX_RECORD_BYTES or start + length > len(data):
+        return None
+    if zlib.crc32(data[start:start + length]) != crc:
+        return None
+    return length, flags
+
+
+def _resync(data, pos):
+    """Find the next offset after pos where an intact record starts."""
+    for candidate in range(pos + 1, len(data) - RECORD_HEADER.size + 1):
+        if _valid_at(data, candidate):
+            return candidate
+    return None
+
+
+def parse_records(data, base_offset=0):
+    """Split segment bytes into records.
+
+    A damaged region (for example a torn write left by a crash) becomes a
+    single non-intact record spanning up to the next intact one. Returns
+    (records, consumed) where records are (offset, end, payload, flags,
+    intact) and anything past `consumed` is an incomplete tail.
+    """
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        valid = _valid_at(data, pos)
+        if valid:
+            length, flags = valid
+            start = pos + RECORD_HEADER.size
+            records.append((
+                base_offset + pos, base_offset + start + length,
+                data[start:start + length], flags, True,
+            ))
+            pos = start + length
+            continue
+
+        length = RECORD_HEADER.unpack_from(data, pos)[0]
+        if 0 < length <= MAX_RECORD_BYTES and pos + RECORD_HEADER.size + length > len(data):
+            break  # Plausibly a record still being written
+
+        nxt = _resync(data, pos)
+        if nxt is None:
+            break
+        records.append((base_offset + pos, base_offset + nxt, data[pos:nxt], 0, False))
+        pos = nxt
+
+    return records, base_offset + pos
+
+
+def _read_from(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read()
+
+
+def consume(log_dir, process, failed_path, batch_size=256):
+    """Feed every unconsumed record to `process` in order.
+
+    `process` receives a list of LogRecord sources and returns
+    (processed_count, error_count), like process_inbox.process_sources.
+    The checkpoint is saved after each batch, so a crash replays at most
+    one batch.
+
+    Returns (processed_count, error_count); (0, 0) if another processor
+    is consuming the log.
+    """
+    lock_fd = os.open(os.path.join(log_dir, CONSUMER_LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0, 0
+        return _consume(log_dir, process, failed_path, batch_size)
+    finally:
+        os.close(lock_fd)
+
+
+def _consume(log_dir, process, failed_path, batch_size):
+    processed_count = 0
+    error_count = 0
+
+    # Take the host's lock while listing and reading the active segment so
+    # the snapshot never includes a half-appended record.
+    lock_fd = os.open(os.path.join(log_dir, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_SH)
+        segments = list_segments(log_dir)
+        checkpoint = load_checkpoint(log_dir)
+        snapshot = {}
+        if segments:
+            last = segments[-1]
+            start = checkpoint["offset"] if checkpoint and checkpoint["segment"] == last else 0
+            snapshot[last] = (start, _read_from(os.path.join(log_dir, last), start))
+    finally:
+        os.close(lock_fd)
+
+    for index, name in enumerate(segments):
+        path = os.path.join(log_dir, name)
+        is_last = index == len(segments) - 1
+
+        if checkpoint and name < checkpoint["segment"]:
+            os.remove(path)  # Consumed before a crash but not yet deleted
+            continue
+
+        if name in snapshot:
+            offset, data = snapshot[name]
+        else:
+            offset = checkpoint["offset"] if checkpoint and checkpoint["segment"] == name else 0
+            data = _read_from(path, offset)
+
+        records, consumed = parse_records(data, offset)
+        sources = [
+            LogRecord(name, rec_offset, end, payload, flags, intact, failed_path)
+            for rec_offset, end, payload, flags, intact in records
+        ]
+
+        for start in range(0, len(sources), batch_size):
+            batch = sources[start:start + batch_size]
+            processed, errors = process(batch)
+            processed_count += processed
+            error_count += errors
+            save_checkpoint(log_dir, name, batch[-1].end)
+
+        if is_last:
+            break
+
+        if consumed < offset + len(data):
+            # A sealed segment should end on a record boundary
+            tail = LogRecord(name, consumed, offset + len(data),
+                             data[consumed - offset:], 0, False, failed_path)
+            print(f"Error processing {tail.name}: truncated record", file=sys.stderr)
+            if tail.fail():
+                durable.fsync_path(failed_path)
+            error_count += 1
+
+        os.remove(path)
+        save_checkpoint(log_dir, segments[index + 1], 0)
+
+    return processed_count, error_count
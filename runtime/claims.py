@@ -0,0 +1,163 @@
+"""
+IdeaShelf Inbox Claims
+
+Lets any number of processor runs drain the same inbox without
+processing a capture twice. That guarantee rests on rename being atomic,
+so it holds for runs on one host, or on several hosts sharing the inbox
+over a POSIX filesystem such as NFS. Sync tools (Dropbox, Syncthing and
+the like) copy renames between machines after the fact, so two hosts can
+both claim a capture; there the seen and dedup indexes only keep
+duplicates out on a best-effort basis.
+
+A worker claims a capture by renaming it into its own folder:
+
+    inbox/<id>.json  ->  inbox/.claims/<owner>/<id>.json
+
+Renaming is atomic, so exactly one worker wins; the others find the file
+gone and move on. The owner is "<host>-<pid>-<random>", unique per run.
+A claim is a lease: the claimed file's change time marks when it was
+taken or last renewed, and the worker renews it (by touching the file)
+while the capture is in flight. Once processed, the file is moved on to
+inbox/processed/; if processing fails it is renamed back into the inbox.
+
+A claim older than `lease_seconds`, or held by a process on this host
+that no longer exists, is expired: the worker that crashed or hung
+holding it has given it up. Another worker takes it over with the same
+atomic rename, from the old owner's folder into its own.
+"""
+
+import os
+import re
+import secrets
+import socket
+import time
+
+CLAIMS_DIRNAME = ".claims"
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+def make_owner():
+    host = re.sub(r"[^A-Za-z0-9]+", "_", socket.gethostname()) or "host"
+    return f"{host}-{os.getpid()}-{secrets.token_hex(3)}"
+
+
+def local_pid(owner, host):
+    """The pid in owner if it names a process on this host, else None."""
+    parts = owner.rsplit("-", 2)
+    if len(parts) != 3 or parts[0] != host or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def pid_gone(owner, host):
+    """True if owner names a process on this host that has exited."""
+    pid = local_pid(owner, host)
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # Exists but is not ours
+    return False
+
+
+class Claims:
+    """Claims inbox files for one worker."""
+
+    def __init__(self, inbox_path, lease_seconds=DEFAULT_LEASE_SECONDS, owner=None):
+        self.inbox_path = inbox_path
+        self.root = os.path.join(inbox_path, CLAIMS_DIRNAME)
+        self.lease_seconds = float(lease_seconds)
+        self.owner = owner or make_owner()
+        self.path = os.path.join(self.root, self.owner)
+
+    def _take(self, src):
+        """Rename src into our folder; return the new path, or None if gone."""
+        dst = os.path.join(self.path, os.path.basename(src))
+        for _ in range(2):
+            try:
+                os.rename(src, dst)
+            except FileNotFoundError:
+                if os.path.exists(src):
+                    os.makedirs(self.path, exist_ok=True)  # First claim
+                    continue
+                return None  # Another worker got it first
+            # Start the lease now; rename alone may not touch the file
+            try:
+                os.utime(dst)
+            except FileNotFoundError:
+                return None
+            return dst
+        return None
+
+    def claim(self, filename):
+        """Claim inbox/<filename>. Returns the claimed path or None."""
+        return self._take(os.path.join(self.inbox_path, filename))
+
+    def renew(self, path):
+        """Extend the lease on a claimed path. False if it was taken over."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def release(self, path):
+        """Put a claimed file back in the inbox for a later run."""
+        try:
+            os.rename(path, os.path.join(self.inbox_path, os.path.basename(path)))
+        except FileNotFoundError:
+            pass  # Taken over; the new owner deals with it
+
+    def expired(self):
+        """Yield paths of other workers' claims whose lease has expired."""
+        try:
+            owners = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for owner in sorted(owners):
+            if owner == self.owner:
+                continue
+            folder = os.path.join(self.root, owner)
+            try:
+                names = sorted(os.listdir(folder))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if not names:
+                # An abandoned owner's empty folder
+                if self._is_expired(folder, owner):
+                    try:
+                        os.rmdir(folder)
+                    except OSError:
+                        pass  # In use again, or already removed
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if self._is_expired(path, owner):
+                    yield path
+
+    def _is_expired(self, path, owner):
+        """True if `owner`'s claim (or empty folder) at path has lapsed."""
+        if pid_gone(owner, self.owner.rsplit("-", 2)[0]):
+            return True
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return max(st.st_mtime, st.st_ctime) < time.time() - self.lease_seconds
+
+    def take_over(self, path):
+        """Claim an expired claim for this worker. Returns the new path or None."""
+        if not self._is_expired(path, os.path.basename(os.path.dirname(path))):
+            return None  # Renewed or taken over since it was listed
+        return self._take(path)
+
+    def close(self):
+        """Remove this worker's folder if it holds nothing."""
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,181 @@
+"""
+IdeaShelf Taxonomy Classifier
+
+Fills themes, categories and idea_type offline by scoring captures
+against the taxonomy in config.yaml. Enable it with:
+
+    classify:
+      enabled: true
+      threshold: 0.5
+      keywords:                      # optional extra words per term
+        scaffolding: [support, structure]
+
+Every taxonomy term is matched by one or more phrases: its own name
+(machine-learning -> "machine learning") and any configured keywords.
+Each phrase is a small weighted word vector. Words shared by many
+phrases count for less (an IDF over the taxonomy), and each vector sums
+to 1. A capture's evidence for a word saturates with repetition
+(1 mention 0.5, 2 mentions 0.75, ...), so its score for a phrase is a
+confidence between 0 and 1: one mention of a one-word phrase scores 0.5,
+and a two-word phrase needs both words. A term scores its best phrase.
+Terms at or above `threshold` are kept, best first.
+
+A batch is scored as one matrix product, evidence (captures x words)
+times weights (words x phrases), then a max over each term's phrases.
+NumPy does it when installed; otherwise a pure-Python loop over the few
+matching words gives the same scores.
+"""
+
+import importlib.util
+import math
+import re
+from collections import Counter
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+KINDS = (("types", "idea_type"), ("categories", "categories"), ("themes", "themes"))
+
+TEXT_FIELDS = ("content", "source_title", "user_note")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def stem(word):
+    """Fold case and a plural s, so "Metaphors" matches "metaphor"."""
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def phrase_words(phrase):
+    """Distinct word stems of a phrase or term name."""
+    return list(dict.fromkeys(stem(w) for w in _WORD.findall(str(phrase).replace("_", " "))))
+
+
+class TaxonomyClassifier:
+    """Scores batches of captures against taxonomy terms."""
+
+    def __init__(self, taxonomy, keywords=None, threshold=0.5, max_themes=3,
+                 max_categories=3, use_numpy=None):
+        self.threshold = float(threshold)
+        self.limits = {"themes": max_themes, "categories": max_categories, "idea_type": 1}
+        self.use_numpy = HAS_NUMPY if use_numpy is None else use_numpy
+        keywords = keywords or {}
+
+        # labels[i] = (annotation key, term). Phrases are stored in label
+        # order; self.starts[i] is the index of label i's first phrase.
+        self.labels = []
+        self.starts = []
+        phrases = []
+        for kind, key in KINDS:
+            for term in (taxonomy or {}).get(kind) or []:
+                stems = [phrase_words(term)]
+                stems += [phrase_words(p) for p in keywords.get(term) or ()]
+                stems = [words for words in stems if words]
+                if stems:
+                    self.labels.append((key, term))
+                    self.starts.append(len(phrases))
+                    phrases.extend(stems)
+
+        self.vocab = {}
+        for words in phrases:
+            for w in words:
+                self.vocab.setdefault(w, len(self.vocab))
+
+        # IDF over the taxonomy: a word in many phrases identifies none
+        df = Counter(w for words in phrases for w in words)
+        n = max(1, len(phrases))
+        self.weights = []  # per phrase: [(column, weight)], weights sum to 1
+        for words in phrases:
+            raw = [(self.vocab[w], math.log(1 + n / df[w])) for w in words]
+            total = sum(weight for _, weight in raw)
+            self.weights.append([(col, weight / total) for col, weight in raw])
+
+        self._matrix = None
+        if self.use_numpy and self.labels:
+            import numpy
+
+            matrix = numpy.zeros((len(self.vocab), len(phrases)), dtype=numpy.float32)
+            for phrase, pairs in enumerate(self.weights):
+                for col, weight in pairs:
+                    matrix[col, phrase] = weight
+            self._matrix = matrix
+
+    def counts(self, capture):
+        """Vocabulary column -> mentions in the capture's text."""
+        vocab = self.vocab
+        text = " ".join(str(capture.get(field) or "") for field in TEXT_FIELDS)
+        found = Counter()
+        for word in _WORD.findall(text):
+            col = vocab.get(stem(word))
+            if col is not None:
+                found[col] += 1
+        return found
+
+    def scores(self, captures):
+        """A list of per-label score lists, one per capture."""
+        if not self.labels:
+            return [[] for _ in captures]
+        counts = [self.counts(capture) for capture in captures]
+        if self._matrix is not None:
+            import numpy
+
+            evidence = numpy.zeros((len(captures), len(self.vocab)), dtype=numpy.float32)
+            for row, found in enumerate(counts):
+                if found:
+                    cols = list(found)
+                    evidence[row, cols] = list(found.values())
+            evidence = 1.0 - numpy.power(0.5, evidence)
+            phrase_scores = evidence @ self._matrix
+            return numpy.maximum.reduceat(phrase_scores, self.starts, axis=1).tolist()
+
+        ends = self.starts[1:] + [len(self.weights)]
+        result = []
+        for found in counts:
+            if not found:
+                result.append([0.0] * len(self.labels))
+                continue
+            evidence = {col: 1.0 - 0.5 ** n for col, n in found.items()}
+            phrase_scores = [
+                sum(weight * evidence.get(col, 0.0) for col, weight in pairs)
+                for pairs in self.weights
+            ]
+            result.append([
+                max(phrase_scores[start:end]) for start, end in zip(self.starts, ends)
+            ])
+        return result
+
+    def classify(self, captures):
+        """Return frontmatter annotations for each capture, in order."""
+        results = []
+        for row in self.scores(captures):
+            picked = {}
+            # Best first; ties keep taxonomy order. float32 rounding must
+            # not drop a term scoring exactly the threshold.
+            ranked = sorted(
+                (-score, label) for label, score in enumerate(row)
+                if score >= self.threshold - 1e-6
+            )
+            for _, label in ranked:
+                key, term = self.labels[label]
+                picked.setdefault(key, [])
+                if len(picked[key]) < self.limits[key]:
+                    picked[key].append(term)
+            if "idea_type" in picked:
+                picked["idea_type"] = picked["idea_type"][0]
+            results.append(picked)
+        return results
+
+
+def from_config(settings, taxonomy):
+    """Build a classifier from the `classify` config section, or None."""
+    if not settings.get("enabled"):
+        return None
+    return TaxonomyClassifier(
+        taxonomy,
+        keywords=settings.get("keywords"),
+        threshold=settings["threshold"],
+        max_themes=settings["max_themes"],
+        max_categories=settings["max_categories"],
+    )
@@ -0,0 +1,201 @@
+"""
+IdeaShelf Duplicate Index
+
+Detects captures that repeat an idea already on the shelf, before it is
+written again. Two fingerprints are kept per idea:
+
+- an exact hash of the normalized content (case and whitespace folded),
+  looked up through a unique index in O(1);
+- a 64-bit SimHash over word shingles, for near-duplicates such as the
+  same passage re-selected a few words shorter. The fingerprint is split
+  into BANDS equal bands, and every band is indexed. Two fingerprints
+  within MAX_DISTANCE bits must agree on at least one band (pigeonhole),
+  so only the few ideas sharing a band are compared.
+
+The index is a SQLite file in the processor's state folder.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+MAX_DISTANCE = BANDS - 1
+
+# SimHash is unreliable on very short texts; below this many words only
+# exact matching is used.
+MIN_WORDS_FOR_SIMHASH = 8
+
+SHINGLE_SIZE = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY,
+    capture_id TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    simhash INTEGER,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_hash ON fingerprints (content_hash);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    fingerprint INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, value);
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(content):
+    """Fold case and whitespace so trivially different copies hash alike."""
+    return " ".join(content.lower().split())
+
+
+def content_hash(content):
+    return hashlib.sha256(normalize(content).encode("utf-8")).hexdigest()
+
+
+def simhash(content):
+    """64-bit SimHash of the content's word shingles, or None if too short."""
+    words = _WORD.findall(content.lower())
+    if len(words) < MIN_WORDS_FOR_SIMHASH:
+        return None
+
+    shingles = [
+        " ".join(words[i:i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    ]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for bit in range(64):
+            if h >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, value >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class Match:
+    """An existing idea that a new capture duplicates."""
+
+    def __init__(self, kind, capture_id, path, distance):
+        self.kind = kind  # "exact" or "near"
+        self.capture_id = capture_id
+        self.path = path
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Match({self.kind!r}, {self.capture_id!r}, {self.path!r}, {self.distance})"
+
+
+class DedupIndex:
+    """Persistent exact and near-duplicate lookup for captured content."""
+
+    def __init__(self, path, max_distance=MAX_DISTANCE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_distance = min(int(max_distance), MAX_DISTANCE)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def find(self, content):
+        """Return the best Match for content, or None."""
+        digest = content_hash(content)
+        row = self.conn.execute(
+            "SELECT capture_id, path FROM fingerprints WHERE content_hash = ? LIMIT 1",
+            (digest,),
+        ).fetchone()
+        if row:
+            return Match("exact", row[0], row[1], 0)
+
+        value = simhash(content)
+        if value is None or self.max_distance <= 0:
+            return None
+
+        best = None
+        seen = set()
+        for band, band_value in _bands(value):
+            rows = self.conn.execute(
+                "SELECT f.id, f.capture_id, f.path, f.simhash FROM bands AS b "
+                "JOIN fingerprints AS f ON f.id = b.fingerprint "
+                "WHERE b.band = ? AND b.value = ?",
+                (band, band_value),
+            )
+            for fp_id, capture_id, path, other in rows:
+                if fp_id in seen:
+                    continue
+                seen.add(fp_id)
+                distance = hamming(value, _to_unsigned(other))
+                if distance <= self.max_distance and (best is None or distance < best.distance):
+                    best = Match("near", capture_id, path, distance)
+        return best
+
+    def add(self, capture_id, content, path):
+        """Record a written idea. Call commit() to persist a batch."""
+        value = simhash(content)
+        self.discard(capture_id)
+        fp_id = self.conn.execute(
+            "INSERT INTO fingerprints (capture_id, content_hash, simhash, path) "
+            "VALUES (?, ?, ?, ?)",
+            (capture_id, content_hash(content),
+             None if value is None else _to_signed(value), path),
+        ).lastrowid
+        if value is not None:
+            self.conn.executemany(
+                "INSERT INTO bands (band, value, fingerprint) VALUES (?, ?, ?)",
+                [(band, band_value, fp_id) for band, band_value in _bands(value)],
+            )
+
+    def discard(self, capture_id):
+        row = self.conn.execute(
+            "SELECT id FROM fingerprints WHERE capture_id = ?", (capture_id,)
+        ).fetchone()
+        if row:
+            self.conn.execute("DELETE FROM bands WHERE fingerprint = ?", row)
+            self.conn.execute("DELETE FROM fingerprints WHERE id = ?", row)
+
+    def rename_paths(self, pairs):
+        """Repoint many moved files and commit."""
+        self.conn.executemany(
+            "UPDATE fingerprints SET path = ? WHERE path = ?",
+            [(new_path, old_path) for old_path, new_path in pairs],
+        )
+        self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
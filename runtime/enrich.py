@@ -0,0 +1,281 @@
+"""
+IdeaShelf Enrichment
+
+Sends captures to an external tagger (a local model, an AI runtime, or
+stub_tagger.py) and turns its answers into frontmatter for the idea.
+Runs between parsing and rendering, and is configured by the `enrich`
+section of config.yaml:
+
+    enrich:
+      enabled: true
+      command: [python3, ~/IdeaShelf/runtime/stub_tagger.py]   # or:
+      # url: http://127.0.0.1:8765/tag
+
+Captures are sent in batches of `batch_size`, with up to `concurrency`
+batches in flight at once, so a slow model costs roughly one call's
+latency per `batch_size * concurrency` captures instead of one call per
+capture. Each call has a `timeout` and is retried `retries` times with
+exponential backoff. A capture whose batch still fails is written
+without tags; enrichment never holds up or fails a capture.
+
+Protocol (JSON, both transports). The tagger receives
+
+    {"version": 1, "taxonomy": {...},
+     "items": [{"id", "content", "content_type", "source_title",
+                "source_url", "user_note"}, ...]}
+
+on stdin (command) or as a POST body (url), and answers with
+
+    {"results": [{"id", "themes": [...], "categories": [...],
+                  "idea_type": "..."}, ...]}
+
+Items it leaves out get no tags. Any other keys are ignored.
+
+With an EnrichCache (enrich_cache.py), answers are looked up by content,
+taxonomy and tagger version first, and only misses reach the tagger.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+PROTOCOL_VERSION = 1
+
+# Frontmatter annotations that come from the tagger
+TAG_KEYS = ("themes", "categories", "idea_type")
+
+ITEM_FIELDS = ("content", "content_type", "source_title", "source_url", "user_note")
+
+
+def _item(capture):
+    """The capture fields sent to the tagger, without the id."""
+    return {field: capture.get(field, "") for field in ITEM_FIELDS}
+
+
+class TaggerError(Exception):
+    """A tagger call failed or returned something unusable."""
+
+
+def _clean(value):
+    """Keep a tag from breaking the single-line YAML frontmatter."""
+    text = " ".join(str(value).split())
+    return "".join(c for c in text if c not in "[],:#")
+
+
+def to_annotations(result):
+    """Frontmatter annotations from one tagger result."""
+    annotations = {}
+    for key in ("themes", "categories"):
+        values = result.get(key)
+        if isinstance(values, str):
+            values = [values]
+        if isinstance(values, list):
+            cleaned = [_clean(v) for v in values if _clean(v)]
+            if cleaned:
+                annotations[key] = cleaned
+    idea_type = result.get("idea_type")
+    if idea_type and _clean(idea_type):
+        annotations["idea_type"] = _clean(idea_type)
+    return annotations
+
+
+def parse_response(data):
+    """Map capture id -> result dict from a tagger's JSON reply."""
+    try:
+        reply = json.loads(data)
+    except ValueError as e:
+        raise TaggerError(f"invalid JSON from tagger: {e}") from None
+    results = reply.get("results") if isinstance(reply, dict) else reply
+    if not isinstance(results, list):
+        raise TaggerError("tagger reply has no results list")
+    return {
+        str(item["id"]): item
+        for item in results
+        if isinstance(item, dict) and "id" in item
+    }
+
+
+class CommandTagger:
+    """Runs a command per batch, request on stdin, reply on stdout."""
+
+    def __init__(self, command):
+        if isinstance(command, str):
+            import shlex
+
+            command = shlex.split(command)
+        self.command = [os.path.expanduser(part) for part in command]
+
+    async def __call__(self, request, timeout):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self.command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            raise TaggerError(f"cannot run tagger: {e}") from None
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(request), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise TaggerError(f"tagger timed out after {timeout:g} s") from None
+        if proc.returncode != 0:
+            detail = stderr.decode("utf-8", "replace").strip().splitlines()[-1:] or [""]
+            raise TaggerError(f"tagger exited with {proc.returncode}: {detail[0]}")
+        return stdout
+
+
+class HttpTagger:
+    """POSTs each batch to a URL.
+
+    urllib blocks, so calls run on the event loop's thread pool; the
+    concurrency limit keeps that pool from growing past `concurrency`.
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def _post(self, request, timeout):
+        import urllib.error
+        import urllib.request
+
+        req = urllib.request.Request(
+            self.url, data=request, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as response:
+                return response.read()
+        except (urllib.error.URLError, OSError) as e:
+            raise TaggerError(f"tagger request failed: {e}") from None
+
+    async def __call__(self, request, timeout):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._post, request, timeout)
+
+
+class Enricher:
+    """Tags captures through a tagger with bounded concurrency."""
+
+    def __init__(self, tagger, taxonomy=None, batch_size=16, concurrency=4,
+                 timeout=30.0, retries=2, backoff=0.5, cache=None, version=None):
+        self.tagger = tagger
+        self.taxonomy = taxonomy or {}
+        self.cache = cache
+        self.version = version
+        self.batch_size = max(1, int(batch_size))
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = float(timeout)
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.failures = 0
+
+    def request(self, captures):
+        """The JSON request body for a batch of captures."""
+        items = [
+            dict({"id": str(capture.get("id"))}, **_item(capture))
+            for capture in captures
+        ]
+        message = {"version": PROTOCOL_VERSION, "taxonomy": self.taxonomy, "items": items}
+        return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+    async def _tag_batch(self, captures, limit):
+        request = self.request(captures)
+        attempt = 0
+        while True:
+            try:
+                async with limit:
+                    data = await self.tagger(request, self.timeout)
+                return parse_response(data)
+            except TaggerError as e:
+                if attempt >= self.retries:
+                    self.failures += len(captures)
+                    print(f"Enrichment failed for {len(captures)} captures: {e}",
+                          file=sys.stderr)
+                    return None
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    async def _tag_all(self, captures):
+        limit = asyncio.Semaphore(self.concurrency)
+        batches = [
+            captures[start:start + self.batch_size]
+            for start in range(0, len(captures), self.batch_size)
+        ]
+        replies = await asyncio.gather(*(self._tag_batch(b, limit) for b in batches))
+        results = {}
+        failed = set()
+        for batch, reply in zip(batches, replies):
+            if reply is None:
+                failed.update(str(capture.get("id")) for capture in batch)
+            else:
+                results.update(reply)
+        return results, failed
+
+    def tag(self, captures):
+        """Return one annotations dict per capture, in order.
+
+        Answers come from the cache where possible. Captures with the
+        same content are sent to the tagger once. Captures the tagger
+        could not tag get an empty dict.
+        """
+        if not captures:
+            return []
+        if self.cache is None:
+            results, _ = asyncio.run(self._tag_all(list(captures)))
+            return [
+                to_annotations(results.get(str(capture.get("id")), {}))
+                for capture in captures
+            ]
+
+        import enrich_cache
+
+        version = [PROTOCOL_VERSION, self.version]
+        keys = [
+            enrich_cache.cache_key(_item(capture), self.taxonomy, version)
+            for capture in captures
+        ]
+        answers = self.cache.get_many(keys)
+        pending = {}
+        for key, capture in zip(keys, captures):
+            if key not in answers:
+                pending.setdefault(key, capture)
+        if pending:
+            results, failed = asyncio.run(self._tag_all(list(pending.values())))
+            fresh = {
+                key: to_annotations(results.get(str(capture.get("id")), {}))
+                for key, capture in pending.items()
+                if str(capture.get("id")) not in failed
+            }
+            self.cache.put_many(fresh)
+            answers.update(fresh)
+        return [dict(answers.get(key, {})) for key in keys]
+
+
+def from_config(settings, taxonomy=None, cache=None):
+    """Build an Enricher from the `enrich` config section, or None.
+
+    Without an explicit `version`, the tagger's command or URL stands in
+    for it, so pointing at a different tagger bypasses old cache entries.
+    """
+    if not settings.get("enabled"):
+        return None
+    if settings.get("command"):
+        tagger = CommandTagger(settings["command"])
+    elif settings.get("url"):
+        tagger = HttpTagger(settings["url"])
+    else:
+        raise ValueError("enrich is enabled but neither command nor url is set")
+    return Enricher(
+        tagger,
+        taxonomy=taxonomy,
+        batch_size=settings["batch_size"],
+        concurrency=settings["concurrency"],
+        timeout=settings["timeout"],
+        retries=settings["retries"],
+        backoff=settings["backoff"],
+        cache=cache,
+        version=settings.get("version") or str(settings.get("command") or settings.get("url")),
+    )
@@ -0,0 +1,178 @@
+"""
+IdeaShelf Enrichment Cache
+
+Remembers tagger answers so the same capture is never sent to the model
+twice. The key is a SHA-256 of everything that can change the answer:
+the capture fields sent to the tagger (not its id), the taxonomy, the
+tagger version and the protocol version. Re-running a capture, rebuilding
+the ideas folder or re-importing an archive is then answered from disk.
+Changing the taxonomy or bumping `enrich.version` invalidates old entries
+automatically.
+
+Entries live in an SQLite file in the processor's state folder. When the
+cache holds more than max_entries entries or max_bytes of answers, the
+least recently used entries are evicted. The totals are read when the
+cache is opened (and every RECOUNT_EVERY writes, to notice other
+processes) and tracked from there, so a write does not scan the table.
+An empty answer may only mean the tagger skipped the capture, so it
+expires after empty_ttl seconds and the capture is tagged again. Hits
+and misses are counted per process and reported through metrics.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS answers_used ON answers (used);
+"""
+
+# Seconds an empty answer stays valid before the capture is tagged again
+EMPTY_TTL_SECONDS = 24 * 3600
+
+# Writes between re-reading the totals, which other processes also change
+RECOUNT_EVERY = 100
+
+EMPTY = "{}"
+
+
+def cache_key(item, taxonomy, version):
+    """Key for one request item (a dict without its id)."""
+    material = json.dumps(
+        {"item": item, "taxonomy": taxonomy, "version": version},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class EnrichCache:
+    """LRU cache of tagger results, keyed by cache_key()."""
+
+    def __init__(self, path, max_entries=200_000, max_bytes=None,
+                 empty_ttl=EMPTY_TTL_SECONDS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.empty_ttl = empty_ttl
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+        if "expires" not in columns:
+            # Caches written before empty answers expired
+            with self.conn:
+                self.conn.execute("ALTER TABLE answers ADD COLUMN expires REAL")
+                self.conn.execute(
+                    "UPDATE answers SET expires = ? WHERE value = ?",
+                    (time.time() + self.empty_ttl, EMPTY),
+                )
+        self._recount()
+
+    def _recount(self):
+        self._entries, self._bytes = self.conn.execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM answers"
+        ).fetchone()
+        self._writes = 0
+
+    def _sizes(self, keys):
+        """Return {key: stored size} for the keys that are cached."""
+        sizes = {}
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            sizes.update(self.conn.execute(
+                f"SELECT key, size FROM answers WHERE key IN ({marks})", chunk
+            ))
+        return sizes
+
+    def get_many(self, keys):
+        """Return {key: result} for the keys that are cached."""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, value in self.conn.execute(
+                f"SELECT key, value FROM answers WHERE key IN ({marks}) "
+                "AND (expires IS NULL OR expires > ?)", chunk + [now]
+            ):
+                found[key] = json.loads(value)
+        if found:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE answers SET used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Store {key: result} and evict down to the size limits."""
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, result in entries.items():
+            value = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+            expires = now + self.empty_ttl if value == EMPTY else None
+            rows.append((key, value, len(value), now, expires))
+        with self.conn:
+            replaced = self._sizes(list(entries))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO answers (key, value, size, used, expires) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._entries += len(rows) - len(replaced)
+            self._bytes += sum(row[2] for row in rows) - sum(replaced.values())
+            self._writes += 1
+            if self._writes >= RECOUNT_EVERY:
+                self._recount()
+            self._evict()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            excess = self._entries - int(self.max_entries)
+            if excess > 0:
+                self._delete(self.conn.execute(
+                    "SELECT key, size FROM answers ORDER BY used LIMIT ?", (excess,)
+                ).fetchall())
+        if self.max_bytes is not None:
+            excess = self._bytes - int(self.max_bytes)
+            if excess > 0:
+                # Oldest entries whose sizes add up to the excess
+                self._delete(self.conn.execute(
+                    "SELECT key, size FROM "
+                    "(SELECT key, size, sum(size) OVER (ORDER BY used, key) AS running "
+                    "FROM answers) WHERE running - size < ?",
+                    (excess,),
+                ).fetchall())
+
+    def _delete(self, rows):
+        self.conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key, _ in rows])
+        self._entries -= len(rows)
+        self._bytes -= sum(size for _, size in rows)
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM answers").fetchone()[0]
+
+    def size(self):
+        return self.conn.execute("SELECT coalesce(sum(size), 0) FROM answers").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
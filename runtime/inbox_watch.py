@@ -0,0 +1,342 @@
+"""
+IdeaShelf Inbox Watcher
+
+Event-driven daemon mode for the inbox processor. Instead of re-listing the
+whole inbox on every run, the watcher learns about new capture files from
+the kernel (inotify on Linux) and hands just those names to
+process_inbox.process_files(). Where inotify is unavailable it falls back
+to polling the inbox directory's mtime, and only lists the directory when
+that changes.
+
+Appends to the segmented capture log (inbox/log/) are watched as well,
+once that directory exists, and trigger process_inbox.process_log().
+The inbox is also rescanned every `rescan_interval` seconds, which picks
+up claims left by workers that died.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+import capture_log
+import process_inbox
+
+# inotify event bits (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Quiet period that ends a burst, and the most a burst may delay work
+DEFAULT_DEBOUNCE_SECONDS = 0.05
+DEFAULT_MAX_DELAY_SECONDS = 0.25
+DEFAULT_POLL_INTERVAL_SECONDS = 0.2
+
+# How often to list the inbox anyway, which also recovers expired claims
+DEFAULT_RESCAN_INTERVAL_SECONDS = 60
+
+# A file that fails to process is retried on later cycles this many times
+# (it may have been caught mid-write by the polling watcher).
+MAX_ATTEMPTS = 3
+
+RESCAN = object()  # Sentinel: events were lost, list the directory once
+
+
+def _file_version(path):
+    """(inode, mtime) of a file, or None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+class InotifyWatcher:
+    """Report names written or moved into a directory, via inotify.
+
+    Changes inside any of `subdirs` (relative to `path`) are reported as
+    "<subdir>/<name>".
+    """
+
+    def __init__(self, path, subdirs=()):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.prefixes = {}
+        watches = [(path, "", IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF)]
+        watches += [
+            (os.path.join(path, sub), sub + "/", IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO)
+            for sub in subdirs
+        ]
+        for watch_path, prefix, mask in watches:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(watch_path), mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, f"inotify_add_watch failed for {watch_path}")
+            self.prefixes[wd] = prefix
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for events.
+
+        Returns a set of names, or RESCAN if the kernel queue overflowed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        names = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                raw_name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & (IN_DELETE_SELF | IN_IGNORED):
+                    raise OSError("Inbox directory was removed")
+                elif raw_name:
+                    names.add(self.prefixes.get(wd, "") + os.fsdecode(raw_name))
+        return RESCAN if overflow else names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback: detect new names by polling the directory mtime.
+
+    The directory is only listed when its mtime changes, which happens
+    whenever an entry is created, renamed in, or removed. Each of
+    `subdirs` is checked for growth of its newest file, which is how
+    appends to the capture log show up.
+    """
+
+    def __init__(self, path, interval=DEFAULT_POLL_INTERVAL_SECONDS, subdirs=()):
+        self.path = path
+        self.interval = interval
+        self.last_mtime = None
+        self.known = set()
+        self.subdirs = {sub: self._subdir_state(sub) for sub in subdirs}
+        self._scan()
+
+    def _subdir_state(self, sub):
+        """Return (dir mtime, newest name, its size) for a subdirectory."""
+        sub_path = os.path.join(self.path, sub)
+        try:
+            mtime = os.stat(sub_path).st_mtime_ns
+            names = sorted(os.listdir(sub_path))
+            newest = names[-1] if names else None
+            size = os.path.getsize(os.path.join(sub_path, newest)) if newest else 0
+        except OSError:
+            return None
+        return mtime, newest, size
+
+    def _changed_subdirs(self):
+        changed = set()
+        for sub, state in self.subdirs.items():
+            current = self._subdir_state(sub)
+            if current != state:
+                self.subdirs[sub] = current
+                if current and current[1]:
+                    changed.add(f"{sub}/{current[1]}")
+        return changed
+
+    def _scan(self):
+        st = os.stat(self.path)
+        self.last_mtime = st.st_mtime_ns
+        with os.scandir(self.path) as it:
+            current = {entry.name for entry in it}
+        new = current - self.known
+        self.known = current
+        return new
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            new = self._changed_subdirs()
+            if os.stat(self.path).st_mtime_ns != self.last_mtime:
+                new |= self._scan()
+            if new:
+                return new
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def open_watcher(path, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS, subdirs=()):
+    """Return an inotify watcher if possible, otherwise a polling one."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path, subdirs)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(path, poll_interval, subdirs)
+
+
+def collect_burst(watcher, first, debounce, max_delay):
+    """Keep gathering events until `debounce` seconds pass with none.
+
+    Stops after `max_delay` seconds regardless, so a steady stream of
+    captures still gets processed promptly.
+    """
+    names = set() if first is RESCAN else set(first)
+    rescan = first is RESCAN
+    deadline = time.monotonic() + max_delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        more = watcher.wait(min(debounce, remaining))
+        if not more:
+            break
+        if more is RESCAN:
+            rescan = True
+        else:
+            names.update(more)
+    return RESCAN if rescan else names
+
+
+def watch_inbox(
+    config,
+    workers=1,
+    debounce=DEFAULT_DEBOUNCE_SECONDS,
+    max_delay=DEFAULT_MAX_DELAY_SECONDS,
+    poll_interval=DEFAULT_POLL_INTERVAL_SECONDS,
+    stop_event=None,
+    on_batch=None,
+    rescan_interval=DEFAULT_RESCAN_INTERVAL_SECONDS,
+):
+    """Process the inbox now, then keep processing new captures as they land.
+
+    Runs until `stop_event` is set (or forever). `on_batch`, if given, is
+    called with (processed, errors) after each batch.
+
+    Returns the total (processed_count, error_count).
+    """
+    inbox_path = config.get(
+        "inbox_folder", process_inbox.DEFAULT_CONFIG["inbox_folder"]
+    )
+    log_dirname = capture_log.LOG_DIRNAME
+
+    def log_subdirs():
+        # Only the host's "log" inbox format creates the capture log
+        if os.path.isdir(os.path.join(inbox_path, log_dirname)):
+            return (log_dirname,)
+        return ()
+
+    # Start watching before the initial drain so nothing slips between them
+    subdirs = log_subdirs()
+    watcher = open_watcher(inbox_path, poll_interval, subdirs=subdirs)
+    session = process_inbox.Session(config)
+    attempts = {}
+    failed_versions = {}
+    totals = [0, 0]
+
+    def run(names, log=False):
+        names = [n for n in names if process_inbox.is_capture_file(n)]
+        processed, errors = process_inbox.process_files(
+            config, sorted(names), workers=workers, session=session
+        )
+        if log:
+            # Initial drain and rescans: also pick up abandoned claims
+            recovered, recover_errors = process_inbox.process_expired_claims(
+                config, workers=workers, session=session
+            )
+            processed += recovered
+            errors += recover_errors
+            log_processed, log_errors = process_inbox.process_log(
+                config, workers=workers, session=session
+            )
+            processed += log_processed
+            errors += log_errors
+        totals[0] += processed
+        totals[1] += errors
+        if processed:
+            session.maybe_compact(processed)
+        if processed or errors:
+            session.metrics.emit()
+            if on_batch:
+                on_batch(processed, errors)
+
+        # Anything still in the inbox failed; retry it a few times
+        for name in names:
+            version = _file_version(os.path.join(inbox_path, name))
+            if version is not None:
+                attempts[name] = attempts.get(name, 0) + 1
+                failed_versions[name] = version
+            else:
+                attempts.pop(name, None)
+                failed_versions.pop(name, None)
+
+    def rescan():
+        nonlocal watcher, subdirs
+        if log_subdirs() != subdirs:
+            # The capture log appeared since we started watching
+            subdirs = log_subdirs()
+            watcher.close()
+            watcher = open_watcher(inbox_path, poll_interval, subdirs=subdirs)
+        names = os.listdir(inbox_path)
+        # Forget failures that have since been removed or processed
+        for name in set(attempts).difference(names):
+            attempts.pop(name)
+            failed_versions.pop(name, None)
+        run(names, log=True)
+        return time.monotonic() + rescan_interval
+
+    def retry_names():
+        return {name for name, n in attempts.items() if n < MAX_ATTEMPTS}
+
+    def given_up(name):
+        """A failed file put back unchanged (a released claim) is not news."""
+        return (attempts.get(name, 0) >= MAX_ATTEMPTS
+                and failed_versions.get(name) == _file_version(os.path.join(inbox_path, name)))
+
+    try:
+        next_rescan = rescan()
+        while stop_event is None or not stop_event.is_set():
+            timeout = poll_interval if stop_event is not None else 60
+            timeout = max(0, min(timeout, next_rescan - time.monotonic()))
+            first = watcher.wait(timeout)
+            names = collect_burst(watcher, first, debounce, max_delay) if first else set()
+
+            if names is RESCAN or time.monotonic() >= next_rescan:
+                next_rescan = rescan()
+                continue
+
+            log = any(n.startswith(log_dirname + "/") for n in names)
+            names = {n for n in names if not given_up(n)} | retry_names()
+            if names:
+                run(names, log=log)
+    finally:
+        watcher.close()
+        session.close()
+
+    return totals[0], totals[1]
@@ -0,0 +1,186 @@
+"""
+IdeaShelf Processing Journal
+
+A write-ahead journal that makes reprocessing after a crash idempotent.
+Before a batch of ideas is written, the processor appends an intent per
+capture, naming the idea's path, and syncs it. Once the capture has left
+the inbox it appends a completion:
+
+    {"op": "intent", "id": "<capture id>", "path": "<idea>", "source": "<inbox name>"}
+    {"op": "done", "id": "<capture id>"}
+
+An intent is recorded as soon as the idea's name is allocated, before
+tagging. A capture with an intent but no completion was interrupted
+somewhere between claiming that name and retiring its source. When it
+comes round again it is rendered over the same path instead of getting a
+new `_<id>` name.
+
+Each run appends to its own file, <state_folder>/journal/<owner>.jsonl,
+so concurrent workers never interleave writes. A run that ends with
+nothing unfinished deletes its file, and a long run truncates it whenever
+everything is done, so the journal only ever holds work in flight. On
+start-up a run adopts the files of runs that are gone: a dead process on
+this host, or a run on another host that has not written for
+`lease_seconds`. A live process on this host keeps its journal however
+long it sits idle, as a `--watch` daemon does. Recovery therefore reads
+O(unfinished captures), not the output folder.
+"""
+
+import json
+import os
+import time
+
+import claims
+
+SUFFIX = ".jsonl"
+
+# Truncate the journal once it holds no unfinished work and is this big
+COMPACT_BYTES = 1024 * 1024
+
+# Owners of the journals open in this process
+_open_owners = set()
+
+
+def read_entries(path):
+    """Unfinished intents in a journal file: {id: (path, source)}.
+
+    A torn final line, from a crash mid-append, is ignored.
+    """
+    pending = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or "id" not in record:
+                    continue
+                if record.get("op") == "intent":
+                    pending[record["id"]] = (record.get("path"), record.get("source"))
+                elif record.get("op") == "done":
+                    pending.pop(record["id"], None)
+    except FileNotFoundError:
+        pass
+    return pending
+
+
+class Journal:
+    """One run's intent/completion journal."""
+
+    def __init__(self, directory, owner=None, sync=True,
+                 lease_seconds=claims.DEFAULT_LEASE_SECONDS):
+        self.directory = directory
+        self.owner = owner or claims.make_owner()
+        self.path = os.path.join(directory, self.owner + SUFFIX)
+        self.sync = sync
+        self.lease_seconds = float(lease_seconds)
+        self.pending = {}
+        self._file = None
+        _open_owners.add(self.owner)
+
+    def _abandoned(self, name):
+        owner = name[:-len(SUFFIX)]
+        host = self.owner.rsplit("-", 2)[0]
+        pid = claims.local_pid(owner, host)
+        if pid == os.getpid():
+            return owner not in _open_owners  # An earlier run in this process
+        if pid is not None:
+            # Our host: only a process that has exited gives it up
+            return claims.pid_gone(owner, host)
+        try:
+            return os.stat(os.path.join(self.directory, name)).st_mtime < (
+                time.time() - self.lease_seconds
+            )
+        except FileNotFoundError:
+            return False
+
+    def recover(self):
+        """Adopt the unfinished intents of runs that are gone.
+
+        Returns the number of intents adopted. Two runs adopting the same
+        file is harmless: intents are hints to reuse a path.
+        """
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return 0
+        adopted = {}
+        for name in names:
+            if not name.endswith(SUFFIX) or name == self.owner + SUFFIX:
+                continue
+            if self._abandoned(name):
+                path = os.path.join(self.directory, name)
+                entries = read_entries(path)
+                if entries:
+                    # Carry them over before the old file goes
+                    self._write([_intent(i, *entry) for i, entry in entries.items()], sync=True)
+                    adopted.update(entries)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.pending.update(adopted)
+        return len(adopted)
+
+    def resume(self, capture_id):
+        """The path an interrupted capture was being written to, or None."""
+        entry = self.pending.get(capture_id)
+        return entry[0] if entry else None
+
+    def intend(self, entries):
+        """Record (capture id, idea path, source name) before writing them."""
+        if not entries:
+            return
+        records = []
+        for capture_id, path, source in entries:
+            self.pending[capture_id] = (path, source)
+            records.append(_intent(capture_id, path, source))
+        self._write(records, sync=self.sync)
+
+    def done(self, capture_ids):
+        """Record that captures were retired (or abandoned)."""
+        capture_ids = [i for i in capture_ids if self.pending.pop(i, None) is not None]
+        if not capture_ids:
+            return
+        self._write([{"op": "done", "id": i} for i in capture_ids], sync=False)
+        if not self.pending and self._file.tell() >= COMPACT_BYTES:
+            self._file.seek(0)
+            self._file.truncate()
+
+    def settle(self, unfinished):
+        """Drop intents whose source `unfinished(source)` says is gone.
+
+        Returns the idea paths of the intents dropped.
+        """
+        stale = {i: path for i, (path, source) in self.pending.items() if not unfinished(source)}
+        self.done(list(stale))
+        return list(stale.values())
+
+    def _write(self, records, sync):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records
+        ))
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the file, deleting it if nothing is unfinished."""
+        _open_owners.discard(self.owner)
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if not self.pending:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _intent(capture_id, path, source):
+    return {"op": "intent", "id": capture_id, "path": path, "source": source}
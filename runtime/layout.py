@@ -0,0 +1,262 @@
+"""
+IdeaShelf Output Layout
+
+Decides which folder under output_folder an idea lives in, and migrates
+an existing output folder from one layout to another.
+
+Layouts (the `output_layout` config key):
+
+- "flat": every idea directly in output_folder (the original layout)
+- "date": YYYY/MM/ subfolders, taken from the YYMMDD file name prefix
+- "hash": 256 subfolders named by two hex digits of a hash of the name
+
+The folder depends only on the file name, so migration never has to
+open an idea to find where it belongs. A name already taken in the new
+folder gets the same suffixes as a new idea: name_<id8>.md, then
+name_<id8>_2.md, and so on.
+
+Migration moves files in bounded batches. Before each batch it records
+the planned moves in a journal in the state folder. After the files are
+moved and the indexes have been updated, the `duplicate_of:` and
+`related:` links of ideas pointing at the moved files are rewritten, and
+the journal is deleted. An interrupted run is finished by replaying the
+journal, and a re-run only touches files that are not yet in place.
+"""
+
+import hashlib
+import json
+import os
+
+import durable
+
+LAYOUTS = ("flat", "date", "hash")
+UNDATED = "undated"
+JOURNAL_NAME = "migrate-layout.json"
+
+# Frontmatter keys holding output_folder-relative links to other ideas
+LINK_KEYS = ("duplicate_of", "related")
+
+
+def output_subdir(filename, layout):
+    """Folder, relative to output_folder, for an idea named `filename`."""
+    if layout == "date":
+        prefix = filename[:6]
+        if len(prefix) == 6 and prefix.isdigit():
+            return os.path.join(f"20{prefix[:2]}", prefix[2:4])
+        return UNDATED
+    if layout == "hash":
+        return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2]
+    if layout == "flat":
+        return ""
+    raise ValueError(f"Unknown output layout: {layout!r}")
+
+
+def candidate_names(filename, capture_id=None):
+    """Names to try, in order, for an idea that wants `filename`."""
+    base, ext = os.path.splitext(filename)
+    yield filename
+    suffix = str(capture_id or "dup")[:8]
+    yield f"{base}_{suffix}{ext}"
+    counter = 2
+    while True:
+        yield f"{base}_{suffix}_{counter}{ext}"
+        counter += 1
+
+
+def iter_ideas(output_path):
+    """Yield the path of every markdown idea under output_path.
+
+    Hidden folders (such as those kept by editors and sync tools) are
+    skipped.
+    """
+    for directory, dirnames, filenames in os.walk(output_path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.endswith(".md") and not name.startswith("."):
+                yield os.path.join(directory, name)
+
+
+def _target(output_path, path, layout, taken, capture_id=None):
+    """Where `path` belongs in `layout`, avoiding names already in use."""
+    name = os.path.basename(path)
+    directory = os.path.join(output_path, output_subdir(name, layout))
+    for candidate in candidate_names(name, capture_id):
+        candidate = os.path.join(directory, candidate)
+        if candidate not in taken and not os.path.exists(candidate):
+            taken.add(candidate)
+            return candidate
+
+
+def parse_links(line):
+    """(key, [targets]) for a frontmatter link line, else None."""
+    key, sep, value = line.partition(": ")
+    if not sep or key not in LINK_KEYS:
+        return None
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        return key, [t for t in value[1:-1].split(", ") if t]
+    return key, [value] if value else []
+
+
+def _frontmatter_end(lines):
+    """Index of the line closing the frontmatter, or 0 if there is none."""
+    if not lines or lines[0].rstrip("\r\n") != "---":
+        return 0
+    for i in range(1, len(lines)):
+        if lines[i].rstrip("\r\n") == "---":
+            return i
+    return 0
+
+
+class _Links:
+    """Which ideas link to which, read from frontmatter on first use."""
+
+    def __init__(self, output_path, relinked=None):
+        self.output_path = output_path
+        self.relinked = relinked
+        self.referrers = None  # target relpath -> set of linking paths
+
+    def _scan(self):
+        self.referrers = {}
+        for path in iter_ideas(self.output_path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    if f.readline().rstrip("\r\n") != "---":
+                        continue
+                    for line in f:
+                        if line.rstrip("\r\n") == "---":
+                            break
+                        parsed = parse_links(line.rstrip("\r\n"))
+                        for target in parsed[1] if parsed else ():
+                            self.referrers.setdefault(target, set()).add(path)
+            except (OSError, UnicodeDecodeError):
+                continue
+
+    def moved(self, moves):
+        """Rewrite links to files in `moves` to their new paths."""
+        if self.referrers is None:
+            self._scan()
+        where = dict(moves)
+        for linking in self.referrers.values():
+            for path in [p for p in linking if p in where]:
+                linking.discard(path)
+                linking.add(where[path])
+        rel = {
+            os.path.relpath(old, self.output_path): os.path.relpath(new, self.output_path)
+            for old, new in moves
+        }
+        affected = set()
+        for old_rel, new_rel in rel.items():
+            linking = self.referrers.pop(old_rel, set())
+            affected |= linking
+            if linking:
+                self.referrers.setdefault(new_rel, set()).update(linking)
+        for path in sorted(affected):
+            self._rewrite(path, rel)
+
+    def _rewrite(self, path, rel):
+        try:
+            with open(path, "rb") as f:
+                old_data = f.read()
+        except FileNotFoundError:
+            return
+        lines = old_data.decode("utf-8").splitlines(True)
+        for i in range(1, _frontmatter_end(lines)):
+            line = lines[i].rstrip("\r\n")
+            parsed = parse_links(line)
+            if parsed is None:
+                continue
+            key, targets = parsed
+            targets = [rel.get(t, t) for t in targets]
+            value = "[" + ", ".join(targets) + "]" if key == "related" else targets[0]
+            lines[i] = f"{key}: {value}" + lines[i][len(line):]
+        new_data = "".join(lines).encode("utf-8")
+        if new_data == old_data:
+            return
+        durable.write_atomic(path, new_data, fsync=True)
+        if self.relinked:
+            self.relinked(path, rel, hashlib.sha256(old_data).hexdigest(),
+                          hashlib.sha256(new_data).hexdigest())
+
+
+def _apply(moves, indexes, links):
+    """Move files, repoint the indexes and fix links. Safe to repeat."""
+    for old, new in moves:
+        if os.path.exists(old) and not os.path.exists(new):
+            os.makedirs(os.path.dirname(new), exist_ok=True)
+            os.rename(old, new)
+    for index in indexes:
+        index.rename_paths(moves)
+    links.moved(moves)
+
+
+def _prune_empty_dirs(output_path, moves):
+    """Remove folders emptied by `moves`, up to but not including output_path."""
+    root = os.path.normpath(output_path)
+    for directory in sorted({os.path.dirname(old) for old, _ in moves}, reverse=True):
+        directory = os.path.normpath(directory)
+        while directory != root and directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break  # Not empty
+            directory = os.path.dirname(directory)
+
+
+def migrate(output_path, layout, state_path, indexes=(), batch_size=500, limit=None,
+            progress=None, capture_ids=None, relinked=None):
+    """Move ideas into `layout`, at most `limit` of them (None for all).
+
+    `indexes` are objects with rename_paths([(old, new), ...]), such as
+    the search and duplicate indexes. `capture_ids` maps idea paths to
+    capture ids, for collision suffixes. `relinked(path, {old: new},
+    old_digest, new_digest)`, if given, is called for each idea whose
+    links were rewritten. `progress`, if given, is called with the number
+    of files moved after each batch.
+
+    Returns the number of files moved by this call.
+    """
+    output_subdir("", layout)  # Validate early
+    journal = os.path.join(state_path, JOURNAL_NAME)
+    capture_ids = capture_ids or {}
+    links = _Links(output_path, relinked)
+    moved = 0
+
+    # Finish a batch interrupted by a crash before planning new ones
+    if os.path.exists(journal):
+        with open(journal, "r", encoding="utf-8") as f:
+            pending = [tuple(pair) for pair in json.load(f)["moves"]]
+        _apply(pending, indexes, links)
+        os.remove(journal)
+        _prune_empty_dirs(output_path, pending)
+        moved += len(pending)
+
+    batch = []
+    taken = set()
+
+    def flush():
+        durable.write_atomic(journal, json.dumps({"layout": layout, "moves": batch}),
+                             fsync=True)
+        _apply(batch, indexes, links)
+        os.remove(journal)
+        _prune_empty_dirs(output_path, batch)
+        if progress:
+            progress(moved)
+
+    for path in list(iter_ideas(output_path)):
+        if limit is not None and moved >= limit:
+            break
+        expected = os.path.join(output_path, output_subdir(os.path.basename(path), layout))
+        if os.path.normpath(os.path.dirname(path)) == os.path.normpath(expected):
+            continue
+        if os.path.getsize(path) == 0:
+            continue  # A name being written right now
+        batch.append((path, _target(output_path, path, layout, taken, capture_ids.get(path))))
+        moved += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+            taken = set()
+    if batch:
+        flush()
+    return moved
@@ -0,0 +1,188 @@
+"""
+IdeaShelf Processor Metrics
+
+Per-stage timers, byte and error counters, and queue depth for the inbox
+processor. Enable them in config.yaml:
+
+    metrics:
+      enabled: true
+      jsonl: ~/IdeaShelf/metrics.jsonl        # one JSON object per emit
+      prometheus: /var/lib/node_exporter/textfile/ideashelf.prom
+
+With neither path set, JSON lines go to stderr. When metrics are
+disabled the processor uses NullMetrics, whose methods do nothing, so
+instrumented code pays only a method call.
+
+Values are cumulative for the life of the process: one run, or the whole
+watch daemon, which emits after every batch.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+PROMETHEUS_PREFIX = "ideashelf_processor"
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Metrics sink used when metrics are disabled."""
+
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def emit(self):
+        pass
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Thread-safe stage timers, counters and gauges."""
+
+    enabled = True
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self.stages = {}  # stage -> [count, seconds, max_seconds]
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage):
+        """Context manager adding the enclosed wall time to `stage`."""
+        return _Timer(self, stage)
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                self.stages[stage] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": round(time.time(), 3),
+                "started": round(self.started, 3),
+                "pid": os.getpid(),
+                "stages": {
+                    stage: {
+                        "count": count,
+                        "seconds": round(seconds, 6),
+                        "max_seconds": round(longest, 6),
+                    }
+                    for stage, (count, seconds, longest) in self.stages.items()
+                },
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def emit(self):
+        """Write the current values to the configured outputs."""
+        snapshot = self.snapshot()
+        try:
+            if self.prometheus_path:
+                write_prometheus(self.prometheus_path, snapshot)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(snapshot) + "\n")
+            elif not self.prometheus_path:
+                print(json.dumps(snapshot), file=sys.stderr)
+        except OSError as e:
+            print(f"Cannot write metrics: {e}", file=sys.stderr)
+
+
+def format_prometheus(snapshot, prefix=PROMETHEUS_PREFIX):
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {prefix}_stage_seconds_total Wall time spent in each stage.",
+        f"# TYPE {prefix}_stage_seconds_total counter",
+    ]
+    for stage, entry in sorted(snapshot["stages"].items()):
+        lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {entry["seconds"]}')
+    lines += [
+        f"# HELP {prefix}_stage_calls_total Times each stage ran.",
+        f"# TYPE {prefix}_stage_calls_total counter",
+    ]
+    for stage, entry in sorted(snapshot["stages"].items()):
+        lines.append(f'{prefix}_stage_calls_total{{stage="{stage}"}} {entry["count"]}')
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    lines.append(f"# TYPE {prefix}_last_emit_timestamp_seconds gauge")
+    lines.append(f"{prefix}_last_emit_timestamp_seconds {snapshot['time']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, snapshot):
+    """Atomically replace a textfile-collector file."""
+    import durable
+
+    durable.write_atomic(path, format_prometheus(snapshot))
+
+
+def from_config(settings):
+    """Build Metrics from the `metrics` config section, or NullMetrics."""
+    if not settings.get("enabled"):
+        return NullMetrics()
+
+    def path(key):
+        value = settings.get(key)
+        return os.path.expanduser(value) if value else None
+
+    return Metrics(jsonl_path=path("jsonl"), prometheus_path=path("prometheus"))
@@ -13,21 +13,29 @@ processing the inbox with proper inference for tagging and categorization.
 No external dependencies. Python 3 stdlib only.
 """
 
+import hashlib
+import importlib.util
 import json
 import os
-import shutil
 import sys
+import threading
 from datetime import datetime
 
-# Try to load PyYAML if available, otherwise use a simple fallback
-try:
-    import yaml
-    HAS_YAML = True
-except ImportError:
-    HAS_YAML = False
+import capture_codec
+import durable
+import layout
+import metrics
+
+# PyYAML is used if available, otherwise a simple fallback parser. It is
+# only imported when config.yaml has changed since its last snapshot, and
+# argparse and concurrent.futures only when needed, to keep start-up fast.
+HAS_YAML = importlib.util.find_spec("yaml") is not None
 
 DEFAULT_CONFIG = {
     "output_folder": os.path.expanduser("~/IdeaShelf/ideas/"),
+    # Subfolders of output_folder: "flat" (none), "date" (YYYY/MM/) or
+    # "hash" (two hex digits). Move existing ideas with migrate-layout.
+    "output_layout": "flat",
     "inbox_folder": os.path.expanduser("~/IdeaShelf/inbox/"),
     "taxonomy": {
         "types": [
@@ -40,8 +48,113 @@ DEFAULT_CONFIG = {
     "defaults": {
         "status": "raw",
     },
+    # Indexes and other bookkeeping. Defaults to <inbox_folder>/.state/
+    "state_folder": None,
+    "search": {
+        "enabled": True,
+    },
+    # What to do with a capture that repeats an existing idea, per kind of
+    # match: "skip" (no new file), "link" (new file with duplicate_of:),
+    # "merge" (append to the existing idea) or "keep" (write normally).
+    "dedup": {
+        "enabled": False,
+        "exact": "skip",
+        "near": "link",
+        "max_distance": 3,
+    },
+    # Claim each inbox file before processing it, so overlapping runs and
+    # workers on other hosts sharing the inbox never process it twice. A
+    # claim not renewed for lease_seconds is taken over. See claims.py.
+    "claims": {
+        "enabled": True,
+        "lease_seconds": 300,
+    },
+    # Outputs are always written to a temporary file and renamed into
+    # place. mode: "none" (no fsync), "file" (fsync every file) or "batch"
+    # (one fsync pass per every_files files or every_ms milliseconds).
+    "durability": {
+        "mode": "batch",
+        "every_files": 64,
+        "every_ms": 200,
+    },
+    # Tag captures with an external tagger before rendering: `command`
+    # (request on stdin) or `url` (HTTP POST). See enrich.py.
+    "enrich": {
+        "enabled": False,
+        "command": None,
+        "url": None,
+        "batch_size": 16,
+        "concurrency": 4,
+        "timeout": 30,
+        "retries": 2,
+        "backoff": 0.5,
+        # Bump when the tagger's answers change (default: command or url)
+        "version": None,
+        # Answers cached in <state_folder>/enrich-cache.sqlite3, least
+        # recently used evicted past either limit (null for no limit)
+        "cache": True,
+        "cache_max_entries": 200_000,
+        "cache_max_bytes": None,
+    },
+    # Built-in offline tagging: scores captures against the taxonomy and
+    # keeps terms scoring at least `threshold` (0-1). `keywords` maps a
+    # term to extra words that count as mentioning it. See classifier.py.
+    "classify": {
+        "enabled": False,
+        "threshold": 0.5,
+        "max_themes": 3,
+        "max_categories": 3,
+        "keywords": {},
+    },
+    # Link each new idea to up to k similar ones in a `related:` list,
+    # from a similarity index in <state_folder>/related.sqlite3. Ideas
+    # scoring below min_score (cosine, 0-1) are not linked. See related.py.
+    "related": {
+        "enabled": False,
+        "k": 5,
+        "min_score": 0.15,
+        "max_terms": 24,
+        "max_postings": 256,
+        "max_df": 0.1,
+    },
+    # Pack inbox/processed/ into compressed, indexed segments in
+    # inbox/archive/. auto: compact after each run, and in watch mode
+    # after every compact_every captures. Retention drops whole old
+    # segments (retention_days, max_bytes; null keeps everything).
+    "archive": {
+        "auto": False,
+        "compression": "gzip",
+        "segment_bytes": 64 * 1024 * 1024,
+        "compact_every": 500,
+        "retention_days": None,
+        "max_bytes": None,
+    },
+    # Per-stage timings and counters. Written as JSON lines to `jsonl`
+    # and/or a Prometheus textfile to `prometheus`; stderr if neither.
+    "metrics": {
+        "enabled": False,
+        "jsonl": None,
+        "prometheus": None,
+    },
 }
 
+# Parsed copies of config files, under the default state folder (which
+# cannot depend on the config it is caching)
+CONFIG_SNAPSHOT_FOLDER = os.path.join(DEFAULT_CONFIG["inbox_folder"], ".state", "config")
+
+# Config keys holding paths that may start with ~
+PATH_KEYS = ("output_folder", "inbox_folder", "state_folder")
+
+NULL_METRICS = metrics.NullMetrics()
+
+# Bump whenever build_markdown's output changes for the same input, so
+# `rebuild` knows every idea needs re-rendering.
+RENDERER_VERSION = 1
+
+# Files handed to the worker pool at a time. Bounds memory on very large
+# inboxes while keeping every worker busy.
+BATCH_SIZE_PER_WORKER = 32
+
 
 def load_config(config_path=None):
     """Load config from YAML file, falling back to defaults."""
@@ -52,28 +165,99 @@ def load_config(config_path=None):
 
     if os.path.isfile(config_path):
         try:
-            if HAS_YAML:
-                with open(config_path, "r", encoding="utf-8") as f:
-                    user_config = yaml.safe_load(f) or {}
-            else:
-                # Simple key: value parsing for the most common settings
-                user_config = _parse_simple_yaml(config_path)
-
-            if "output_folder" in user_config:
-                config["output_folder"] = os.path.expanduser(user_config["output_folder"])
-            if "inbox_folder" in user_config:
-                config["inbox_folder"] = os.path.expanduser(user_config["inbox_folder"])
+            config = merge_config(config, read_user_config(config_path))
         except Exception:
             pass  # Use defaults on config parse failure
 
     return config
 
 
+def read_user_config(config_path):
+    """Parse config.yaml, reusing a JSON snapshot while it is unchanged.
+
+    The snapshot is kept in CONFIG_SNAPSHOT_FOLDER, named after the
+    config's path, and keyed by the file's mtime and size (and which
+    parser produced it), so an edit is picked up on the next run without
+    re-parsing YAML on every run in between.
+    """
+    config_path = os.path.abspath(config_path)
+    st = os.stat(config_path)
+    key = [config_path, st.st_mtime_ns, st.st_size, HAS_YAML]
+    name = hashlib.sha1(config_path.encode("utf-8")).hexdigest()[:16]
+    snapshot_path = os.path.join(CONFIG_SNAPSHOT_FOLDER, f"{name}.snapshot.json")
+
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot["key"] == key:
+            return snapshot["config"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    if HAS_YAML:
+        import yaml
+
+        with open(config_path, "r", encoding="utf-8") as f:
+            user_config = yaml.safe_load(f) or {}
+    else:
+        # Simple key: value parsing for the most common settings
+        user_config = _parse_simple_yaml(config_path)
+
+    try:
+        os.makedirs(CONFIG_SNAPSHOT_FOLDER, exist_ok=True)
+        durable.write_atomic(
+            snapshot_path, json.dumps({"key": key, "config": user_config})
+        )
+    except (OSError, TypeError, ValueError):
+        pass  # Read-only folder or values JSON cannot hold; parse next time
+    return user_config
+
+
+def merge_config(config, user_config):
+    """Overlay user settings on a config dict.
+
+    Sections (dict values) are merged one level deep so a user config can
+    set a single option without restating the whole section.
+    """
+    merged = dict(config)
+    for key, value in user_config.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            section = dict(merged[key])
+            section.update(value)
+            merged[key] = section
+        elif key in PATH_KEYS and isinstance(value, str):
+            merged[key] = os.path.expanduser(value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def config_section(config, name):
+    """Return a config section with defaults filled in for missing keys."""
+    section = dict(DEFAULT_CONFIG.get(name) or {})
+    section.update(config.get(name) or {})
+    return section
+
+
+def get_state_path(config):
+    """Folder for indexes and other processor bookkeeping."""
+    state_path = config.get("state_folder")
+    if state_path:
+        return os.path.expanduser(state_path)
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    return os.path.join(inbox_path, ".state")
+
+
 def _parse_simple_yaml(path):
-    """Minimal YAML parser for top-level key: value pairs."""
+    """Minimal YAML parser for top-level key: value pairs.
+
+    Indented lines belong to sections it cannot parse, and are skipped.
+    """
     result = {}
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
+            if line[:1].isspace():
+                continue
             line = line.strip()
             if ":" in line and not line.startswith("#"):
                 key, _, value = line.partition(":")
@@ -127,8 +311,17 @@ def generate_filename(capture):
     return f"{date_prefix}_{slug}.md"
 
 
-def build_markdown(capture, config):
-    """Build a markdown file with YAML frontmatter from a capture."""
+def _yaml_list(items):
+    return "[" + ", ".join(str(item) for item in items) + "]"
+
+
+def build_markdown(capture, config, annotations=None):
+    """Build a markdown file with YAML frontmatter from a capture.
+
+    `annotations` adds frontmatter: "themes" and "categories" fill those
+    lists, and any other keys are written after the summary.
+    """
+    annotations = annotations or {}
     content_type = capture.get("content_type", "unknown")
     source_url = capture.get("source_url", "")
     source_title = capture.get("source_title", "")
@@ -154,16 +347,24 @@ def build_markdown(capture, config):
         f"source: {source_url}",
         f"source_title: {source_title}",
         f"type: {content_type}",
-        "themes: []",
-        "categories: []",
+        f"themes: {_yaml_list(annotations.get('themes') or [])}",
+        f"categories: {_yaml_list(annotations.get('categories') or [])}",
         f"status: {status}",
         f"summary: {summary}",
+    ]
+    for key, value in annotations.items():
+        if key in ("themes", "categories"):
+            continue
+        if isinstance(value, (list, tuple)):
+            value = _yaml_list(value)
+        lines.append(f"{key}: {value}")
+    lines.extend([
         "---",
         "",
         f"# {title}",
         "",
         content,
-    ]
+    ])
 
     if user_note:
         lines.extend(["", f"---", f"*User note: {user_note}*"])
@@ -174,70 +375,1374 @@ def build_markdown(capture, config):
     return "\n".join(lines) + "\n"
 
 
-def process_inbox(config=None):
-    """Process all JSON files in the inbox folder.
+def is_capture_file(filename):
+    """Return True if an inbox entry name looks like a raw capture."""
+    return filename.endswith(".json")
+
+
+class InboxFile:
+    """A capture stored as its own JSON file in the inbox.
+
+    Sources give the pipeline a uniform way to claim and load a capture
+    and to mark it done or failed, whatever the inbox backend.
+    """
+
+    def __init__(self, inbox_path, filename, processed_path, claims=None):
+        self.name = filename
+        self.inbox_path = inbox_path
+        self.path = os.path.join(inbox_path, filename)
+        self.processed_path = processed_path
+        self.claims = claims
+        self.claimed = False
+
+    def claim(self):
+        """Take the file for this run. False if another worker has it."""
+        if self.claims is None or self.claimed:
+            return True
+        path = self.claims.claim(self.name)
+        if path is None:
+            return False
+        self.path, self.claimed = path, True
+        return True
+
+    def take_over(self, claimed_path):
+        """Take an expired claim from another worker."""
+        path = self.claims.take_over(claimed_path)
+        if path is None:
+            return False
+        self.path, self.claimed = path, True
+        return True
+
+    def renew(self):
+        """Extend our claim. False if another worker has taken it over."""
+        return not self.claimed or self.claims.renew(self.path)
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def load(self):
+        return capture_codec.loads(self.read())
+
+    def finish(self):
+        """Move the capture to processed/ and return that directory."""
+        durable.move(self.path, self.processed_path)
+        return self.processed_path
+
+    def fail(self):
+        # Left in the inbox for the next run
+        if self.claimed:
+            self.claims.release(self.path)
+            self.path, self.claimed = os.path.join(self.inbox_path, self.name), False
+
+
+def prepare_capture(source, config, metrics=NULL_METRICS):
+    """Load one capture and work out its preferred output name.
+
+    Returns (capture, out_filename). Safe to call from worker threads: it
+    touches nothing but the source.
+    """
+    with metrics.timer("read"):
+        data = source.read()
+    metrics.count("input_bytes", len(data))
+    with metrics.timer("parse"):
+        capture = capture_codec.loads(data)
+    return capture, generate_filename(capture)
+
+
+class FilenameRegistry:
+    """Allocates unique output file names without a stat per capture.
+
+    Each output directory is listed once, with a single scandir, the first
+    time a name in it is needed. After that names are handed out from
+    memory. A name that collides gets the first 8 characters of the
+    capture id appended, then a counter: name.md, name_<id8>.md,
+    name_<id8>_2.md, and so on.
+
+    Every allocated name is claimed on disk with an exclusive create, so
+    two processes sharing an output folder can never be given the same
+    file. Safe to share across threads.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _names_in(self, directory):
+        names = self._names.get(directory)
+        if names is None:
+            os.makedirs(directory, exist_ok=True)
+            with os.scandir(directory) as it:
+                names = {entry.name for entry in it}
+            self._names[directory] = names
+        return names
+
+    def allocate(self, directory, out_filename, capture):
+        """Claim a unique path in `directory` for the capture.
+
+        Leaves an empty placeholder file at the returned path.
+        """
+        directory = os.path.normpath(directory)  # Same key as os.path.split
+        with self._lock:
+            names = self._names_in(directory)
+            for candidate in layout.candidate_names(out_filename, capture.get("id")):
+                if candidate in names:
+                    continue
+                names.add(candidate)
+                path = os.path.join(directory, candidate)
+                try:
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                except FileExistsError:
+                    continue  # Created by another process since we listed
+                os.close(fd)
+                return path
+
+    def reserve(self, path):
+        """Hand out a known path again, such as one a crash left half done."""
+        directory, name = os.path.split(os.path.normpath(path))
+        with self._lock:
+            self._names_in(directory).add(name)
+        return os.path.join(directory, name)
+
+    def is_allocated(self, path):
+        directory, name = os.path.split(path)
+        with self._lock:
+            return name in self._names.get(directory, ())
+
+    def release(self, path):
+        """Give back a name whose write failed, removing its placeholder."""
+        directory, name = os.path.split(path)
+        with self._lock:
+            try:
+                if os.path.getsize(path) == 0:
+                    os.remove(path)
+            except OSError:
+                pass
+            self._names.get(directory, set()).discard(name)
+
+
+def render_fingerprint(capture, annotations, config):
+    """Hash of everything build_markdown's output depends on."""
+    material = json.dumps(
+        [RENDERER_VERSION, capture, annotations or {}, config_section(config, "defaults")],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def commit_capture(capture, annotations, out_filepath, config, writer, metrics=NULL_METRICS):
+    """Render and atomically write the markdown for one capture.
+
+    The source is retired separately, once the write is durable.
+    Returns (fingerprint, digest) for the render manifest.
+    """
+    with metrics.timer("render"):
+        data = build_markdown(capture, config, annotations).encode("utf-8")
+    with metrics.timer("write"):
+        writer.write(out_filepath, data)
+    metrics.count("output_bytes", len(data))
+    return render_fingerprint(capture, annotations, config), hashlib.sha256(data).hexdigest()
+
+
+def merge_duplicate(existing_path, capture, writer):
+    """Append a repeat capture's provenance to the idea it duplicates."""
+    captured_at = capture.get("captured_at", "")
+    source_url = capture.get("source_url", "")
+    user_note = capture.get("user_note", "")
+
+    lines = ["", "---", f"*Also captured {captured_at}*"]
+    if source_url:
+        lines.append(f"*Source: {source_url}*")
+    if user_note:
+        lines.append(f"*User note: {user_note}*")
+
+    with open(existing_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    writer.write(existing_path, text + "\n".join(lines) + "\n")
+
+
+def _call(fn, *args):
+    """Run fn(*args), returning (result, None) or (None, exception)."""
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+class Session:
+    """Resources shared by every batch of one processing run or daemon.
+
+    Holds the output name registry, the durable writer, metrics and
+    lazily opened indexes.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.metrics = metrics.from_config(config_section(config, "metrics"))
+        self.names = FilenameRegistry()
+        settings = config_section(config, "durability")
+        self.writer = durable.DurableWriter(
+            settings["mode"], settings["every_files"], settings["every_ms"]
+        )
+        self.duplicates = 0
+        self.unarchived = 0
+        self.cache_hits = 0  # Tagger cache totals, filled in by close()
+        self.cache_misses = 0
+        self._search_index = None
+        self._dedup_index = None
+        self._enricher = None
+        self._manifest = None
+        self._classifier = None
+        self._related_index = None
+        self._claims = None
+        self._journal = None
+
+    @property
+    def search_index(self):
+        """The full-text index, or None when search is disabled."""
+        if self._search_index is None and config_section(self.config, "search")["enabled"]:
+            import search_index
+
+            path = config_section(self.config, "search").get("index_path") or os.path.join(
+                get_state_path(self.config), "search.sqlite3"
+            )
+            self._search_index = search_index.SearchIndex(os.path.expanduser(path))
+        return self._search_index
+
+    @property
+    def dedup_index(self):
+        """The duplicate index, or None when dedup is disabled."""
+        settings = config_section(self.config, "dedup")
+        if self._dedup_index is None and settings["enabled"]:
+            import dedup_index
+
+            path = settings.get("index_path") or os.path.join(
+                get_state_path(self.config), "dedup.sqlite3"
+            )
+            self._dedup_index = dedup_index.DedupIndex(
+                os.path.expanduser(path), max_distance=settings["max_distance"]
+            )
+        return self._dedup_index
+
+    @property
+    def manifest(self):
+        """What each idea was rendered from; see render_manifest.py."""
+        if self._manifest is None:
+            import render_manifest
+
+            self._manifest = render_manifest.RenderManifest(
+                os.path.join(get_state_path(self.config), "render-manifest.sqlite3")
+            )
+        return self._manifest
+
+    @property
+    def claims(self):
+        """This worker's inbox claims, or None when claiming is disabled."""
+        settings = config_section(self.config, "claims")
+        if self._claims is None and settings["enabled"]:
+            import claims
+
+            self._claims = claims.Claims(
+                self.config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"]),
+                lease_seconds=settings["lease_seconds"],
+            )
+        return self._claims
+
+    @property
+    def journal(self):
+        """This run's write-ahead journal, with crashed runs' work adopted."""
+        if self._journal is None:
+            import journal
+
+            claims = self.claims
+            self._journal = journal.Journal(
+                os.path.join(get_state_path(self.config), "journal"),
+                owner=claims.owner if claims else None,
+                sync=config_section(self.config, "durability")["mode"] != "none",
+                lease_seconds=config_section(self.config, "claims")["lease_seconds"],
+            )
+            if self._journal.recover():
+                for path in self._journal.settle(
+                    lambda source: source_pending(self.config, source)
+                ):
+                    # A name claimed by a run that died before writing it
+                    self.names.release(path)
+        return self._journal
+
+    def resume(self, capture):
+        """The path a crash left this capture's idea at, or None."""
+        capture_id = capture.get("id")
+        return self.journal.resume(str(capture_id)) if capture_id else None
+
+    def rendered(self, captures):
+        """{capture id: idea path} for captures already rendered to an idea
+        that still exists: a capture the extension sent again after it was
+        processed."""
+        ids = [str(c["id"]) for c in captures if c.get("id")]
+        if not ids:
+            return {}
+        with self.metrics.timer("manifest"):
+            found = self.manifest.paths(ids)
+        return {i: path for i, path in found.items() if os.path.exists(path)}
+
+    def intend(self, jobs):
+        """Journal (source, capture, annotations, path) jobs before writing.
+
+        Returns {source: capture id} for the jobs journaled.
+        """
+        intents = {}
+        entries = []
+        for source, capture, _, out_filepath in jobs:
+            if capture.get("id"):
+                intents[source] = str(capture["id"])
+                entries.append((intents[source], out_filepath, source.name))
+        self.journal.intend(entries)
+        return intents
+
+    @property
+    def related_index(self):
+        """The similarity index for related links, or None when disabled."""
+        settings = config_section(self.config, "related")
+        if self._related_index is None and settings["enabled"]:
+            import related
+
+            self._related_index = related.RelatedIndex(
+                os.path.join(get_state_path(self.config), "related.sqlite3"),
+                max_terms=settings["max_terms"],
+                max_postings=settings["max_postings"],
+                max_df=settings["max_df"],
+            )
+        return self._related_index
+
+    @property
+    def classifier(self):
+        """The offline taxonomy classifier, or None when disabled."""
+        settings = config_section(self.config, "classify")
+        if self._classifier is None and settings["enabled"]:
+            import classifier
+
+            self._classifier = classifier.from_config(
+                settings, config_section(self.config, "taxonomy")
+            )
+        return self._classifier
+
+    @property
+    def enricher(self):
+        """The tagger client, or None when enrichment is disabled."""
+        settings = config_section(self.config, "enrich")
+        if self._enricher is None and settings["enabled"]:
+            import enrich
+
+            cache = None
+            if settings["cache"]:
+                import enrich_cache
+
+                cache = enrich_cache.EnrichCache(
+                    os.path.join(get_state_path(self.config), "enrich-cache.sqlite3"),
+                    max_entries=settings["cache_max_entries"],
+                    max_bytes=settings["cache_max_bytes"],
+                )
+            self._enricher = enrich.from_config(
+                settings, taxonomy=config_section(self.config, "taxonomy"), cache=cache
+            )
+        return self._enricher
+
+    def enrich(self, jobs):
+        """Add tagger annotations to (source, capture, annotations, path) jobs.
+
+        The external tagger goes first; the built-in classifier fills in
+        whatever it left empty.
+        """
+        if not jobs:
+            return
+        if self.enricher is not None:
+            self._tag(jobs)
+        classifier = self.classifier
+        if classifier is not None:
+            with self.metrics.timer("classify"):
+                tags = classifier.classify([capture for _, capture, _, _ in jobs])
+            for (_, _, annotations, _), extra in zip(jobs, tags):
+                for key, value in extra.items():
+                    if not annotations.get(key):
+                        annotations[key] = value
+
+    def _tag(self, jobs):
+        enricher = self.enricher
+        cache = enricher.cache
+        failures = enricher.failures
+        hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+        with self.metrics.timer("enrich"):
+            tags = enricher.tag([capture for _, capture, _, _ in jobs])
+        for (_, _, annotations, _), extra in zip(jobs, tags):
+            for key, value in extra.items():
+                annotations.setdefault(key, value)
+        self.metrics.count("enrich_failures", enricher.failures - failures)
+        if cache:
+            self.metrics.count("enrich_cache_hits", cache.hits - hits)
+            self.metrics.count("enrich_cache_misses", cache.misses - misses)
+
+    def link(self, jobs):
+        """Add `related:` links to (source, capture, annotations, path) jobs.
+
+        Jobs are linked and indexed in order, so a capture can link to one
+        earlier in the same batch.
+        """
+        index = self.related_index
+        if index is None or not jobs:
+            return
+        settings = config_section(self.config, "related")
+        output_path = self.config.get("output_folder", DEFAULT_CONFIG["output_folder"])
+        with self.metrics.timer("related"):
+            for _, capture, annotations, out_filepath in jobs:
+                doc = related_document(capture)
+                exclude = ()
+                if "duplicate_of" in annotations:  # Already linked
+                    exclude = (os.path.normpath(
+                        os.path.join(output_path, annotations["duplicate_of"])
+                    ),)
+                neighbours = index.neighbours(
+                    doc, k=settings["k"], min_score=settings["min_score"], exclude=exclude
+                )
+                # Skip ideas deleted since they were indexed
+                links = [
+                    os.path.relpath(n.path, output_path) for n in neighbours
+                    if self.names.is_allocated(n.path) or os.path.exists(n.path)
+                ]
+                if links:
+                    annotations["related"] = links
+                index.add(str(capture.get("id", out_filepath)), doc, out_filepath)
+
+    def check_duplicate(self, capture):
+        """Decide what to do with a capture that repeats an existing idea.
+
+        Returns (action, match); action is None when the capture is new or
+        the idea it matched has since been deleted.
+        """
+        index = self.dedup_index
+        if index is None:
+            return None, None
+        match = index.find(capture.get("content", ""))
+        if match is None or match.capture_id == str(capture.get("id")):
+            return None, None  # New, or this capture's own idea from a crashed run
+        # The original may be allocated earlier in this batch but unwritten
+        if not self.names.is_allocated(match.path) and not os.path.exists(match.path):
+            return None, None
+        action = config_section(self.config, "dedup").get(match.kind, "keep")
+        if action not in ("skip", "link", "merge"):
+            return None, None
+        return action, match
+
+    def remember(self, capture, out_filepath):
+        """Make a newly allocated idea visible to duplicate checks."""
+        index = self.dedup_index
+        if index is not None:
+            index.add(str(capture.get("id", out_filepath)), capture.get("content", ""), out_filepath)
+
+    def forget(self, capture, out_filepath):
+        """Undo allocation and remember() for an idea whose write failed."""
+        self.names.release(out_filepath)
+        for index in (self.dedup_index, self.related_index):
+            if index is not None:
+                index.discard(str(capture.get("id", out_filepath)))
+        if self._journal is not None and capture.get("id"):
+            self._journal.done([str(capture["id"])])
+
+    def after_commit(self, written, rendered=(), merged=()):
+        """Update indexes for (capture, out_filepath) pairs just written.
+
+        `rendered` holds their render manifest rows, and `merged` the
+        paths of ideas that had a duplicate appended.
+        """
+        if self._dedup_index is not None:
+            self._dedup_index.commit()
+        if self._related_index is not None:
+            self._related_index.commit()
+        if rendered or merged:
+            self.manifest.record_many(rendered)
+            for path in merged:
+                self.manifest.release(path)
+        if not written:
+            return
+        index = self.search_index
+        if index is not None:
+            with self.metrics.timer("index"):
+                index.add_many(search_document(capture, path) for capture, path in written)
+
+    def maybe_compact(self, processed, force=False):
+        """Archive processed captures if auto compaction is due."""
+        settings = config_section(self.config, "archive")
+        if not settings["auto"]:
+            return
+        self.unarchived += processed
+        if force or self.unarchived >= settings["compact_every"]:
+            try:
+                with self.metrics.timer("compact"):
+                    compact_processed(self.config)
+            except Exception as e:
+                print(f"Error compacting processed captures: {e}", file=sys.stderr)
+            self.unarchived = 0
+
+    def close(self):
+        self.metrics.emit()
+        if self._search_index is not None:
+            self._search_index.close()
+            self._search_index = None
+        if self._dedup_index is not None:
+            self._dedup_index.close()
+            self._dedup_index = None
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+        if self._related_index is not None:
+            self._related_index.close()
+            self._related_index = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._claims is not None:
+            self._claims.close()
+            self._claims = None
+        if self._enricher is not None and self._enricher.cache is not None:
+            self.cache_hits = self._enricher.cache.hits
+            self.cache_misses = self._enricher.cache.misses
+            self._enricher.cache.close()
+            self._enricher = None
+
+
+def search_document(capture, out_filepath):
+    """Fields indexed for full-text search."""
+    return {
+        "capture_id": str(capture.get("id", out_filepath)),
+        "path": out_filepath,
+        "title": generate_title(capture),
+        "summary": generate_summary(capture.get("content", "")),
+        "content": capture.get("content", ""),
+        "source_url": capture.get("source_url", ""),
+        "user_note": capture.get("user_note", ""),
+    }
+
+
+def related_document(capture):
+    """Fields compared to find related ideas."""
+    return {
+        "title": capture.get("source_title", ""),
+        "content": capture.get("content", ""),
+        "user_note": capture.get("user_note", ""),
+        "source_url": capture.get("source_url", ""),
+    }
+
+
+def source_pending(config, name):
+    """True if the inbox source called `name` may still come round again."""
+    if not name:
+        return False
+    import capture_log
+
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    if name.startswith(capture_log.LOG_DIRNAME + "/"):
+        log_dir = os.path.join(inbox_path, capture_log.LOG_DIRNAME)
+        segment, _, offset = name[len(capture_log.LOG_DIRNAME) + 1:].partition("@")
+        if not os.path.exists(os.path.join(log_dir, segment)):
+            return False  # Consumed and deleted
+        checkpoint = capture_log.load_checkpoint(log_dir)
+        return checkpoint is None or (segment, int(offset or 0)) >= (
+            checkpoint["segment"], checkpoint["offset"]
+        )
+    if os.path.exists(os.path.join(inbox_path, name)):
+        return True
+    import claims
+
+    root = os.path.join(inbox_path, claims.CLAIMS_DIRNAME)
+    try:
+        owners = os.listdir(root)
+    except FileNotFoundError:
+        return False
+    return any(os.path.exists(os.path.join(root, owner, name)) for owner in owners)
+
+
+def process_inbox(config=None, workers=1, session=None):
+    """Process all captures in the inbox folder.
+
+    Handles individual JSON files and, if the host writes one, the
+    segmented capture log in inbox/log/.
+
+    With workers > 1, parsing, rendering and writing run on a thread pool.
+    Output names are still allocated one file at a time in sorted inbox
+    order, so the result is identical to a serial run.
 
     Returns (processed_count, error_count).
     """
     if config is None:
         config = load_config()
 
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    if not os.path.isdir(inbox_path):
+        _ensure_dirs(config)
+        return 0, 0
+
+    own_session = session is None
+    if own_session:
+        session = Session(config)
+    try:
+        recovered, recover_errors = process_expired_claims(
+            config, workers=workers, session=session
+        )
+        processed, errors = process_files(
+            config, sorted(os.listdir(inbox_path)), workers=workers, session=session
+        )
+        log_processed, log_errors = process_log(config, workers=workers, session=session)
+    finally:
+        if own_session:
+            session.close()
+    return (recovered + processed + log_processed,
+            recover_errors + errors + log_errors)
+
+
+def _ensure_dirs(config):
+    """Create the output and processed folders, returning their paths."""
     inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
     output_path = config.get("output_folder", DEFAULT_CONFIG["output_folder"])
     processed_path = os.path.join(inbox_path, "processed")
 
-    # Ensure directories exist
     os.makedirs(output_path, exist_ok=True)
     os.makedirs(processed_path, exist_ok=True)
+    return output_path, processed_path
+
+
+def process_files(config, filenames, workers=1, session=None):
+    """Process the given inbox entries, in the order given.
+
+    Names that are not capture files or no longer exist are skipped, so
+    callers such as the watch daemon can pass raw event names. `session`
+    may be shared across calls to keep name allocation consistent.
+
+    Returns (processed_count, error_count).
+    """
+    if session is None:
+        session = Session(config)
+        try:
+            return process_files(config, filenames, workers=workers, session=session)
+        finally:
+            session.close()
+
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    _, processed_path = _ensure_dirs(config)
+
+    sources = [
+        InboxFile(inbox_path, filename, processed_path, session.claims)
+        for filename in filenames
+        if is_capture_file(filename)
+        and os.path.isfile(os.path.join(inbox_path, filename))
+    ]
+    return process_sources(config, sources, workers=workers, session=session)
+
+
+def process_expired_claims(config, workers=1, session=None):
+    """Take over and process captures claimed by workers that died or hung.
+
+    Returns (processed_count, error_count).
+    """
+    if session is None:
+        session = Session(config)
+        try:
+            return process_expired_claims(config, workers=workers, session=session)
+        finally:
+            session.close()
+
+    claims = session.claims
+    if claims is None:
+        return 0, 0
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    _, processed_path = _ensure_dirs(config)
+    sources = []
+    for path in claims.expired():
+        source = InboxFile(inbox_path, os.path.basename(path), processed_path, claims)
+        if source.take_over(path):
+            sources.append(source)
+    if sources:
+        session.metrics.count("claims_recovered", len(sources))
+    return process_sources(config, sources, workers=workers, session=session)
+
+
+def process_log(config, workers=1, session=None):
+    """Consume any records waiting in the segmented capture log.
+
+    Returns (processed_count, error_count).
+    """
+    import capture_log
+
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    log_dir = os.path.join(inbox_path, capture_log.LOG_DIRNAME)
+    if not os.path.isdir(log_dir):
+        return 0, 0
+
+    batch_size = max(1, int(workers or 1)) * BATCH_SIZE_PER_WORKER
+    return capture_log.consume(
+        log_dir,
+        lambda sources: process_sources(config, sources, workers=workers, session=session),
+        failed_path=os.path.join(inbox_path, "failed"),
+        batch_size=batch_size,
+    )
+
+
+def process_sources(config, sources, workers=1, session=None):
+    """Run capture sources through parse, render and write.
+
+    Returns (processed_count, error_count).
+    """
+    if session is None:
+        session = Session(config)
+        try:
+            return process_sources(config, sources, workers=workers, session=session)
+        finally:
+            session.close()
+
+    output_path, _ = _ensure_dirs(config)
+    output_layout = config.get("output_layout", DEFAULT_CONFIG["output_layout"])
+    layout.output_subdir("", output_layout)  # Fail fast on a bad setting
 
     processed_count = 0
     error_count = 0
 
-    if not os.path.isdir(inbox_path):
-        return 0, 0
+    workers = max(1, int(workers or 1))
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
 
-    for filename in sorted(os.listdir(inbox_path)):
-        if not filename.endswith(".json"):
-            continue
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = None
+    run = pool.map if pool else map
+    batch_size = workers * BATCH_SIZE_PER_WORKER
+    if session.enricher is not None:
+        # Give the tagger enough captures per batch to fill its concurrency
+        settings = config_section(config, "enrich")
+        batch_size = max(batch_size, settings["batch_size"] * settings["concurrency"])
 
-        filepath = os.path.join(inbox_path, filename)
-        if not os.path.isfile(filepath):
-            continue
+    stats = session.metrics
+
+    def failed(source, err):
+        print(f"Error processing {source.name}: {err}", file=sys.stderr)
+        stats.count("errors")
+        directory = source.fail()
+        if directory:
+            session.writer.touched(directory)
 
+    def retire(sources):
+        """Sync outstanding writes, then mark their sources done.
+
+        A source is only moved out of the inbox (or past the log
+        checkpoint) once its idea is on disk, so a crash at worst
+        reprocesses it.
+        """
+        try:
+            with stats.timer("sync"):
+                session.writer.sync()
+        except OSError as e:
+            for source in sources:
+                failed(source, f"cannot sync output: {e}")
+            return 0, len(sources)
+        processed = errors = 0
+        finished = []
+        for source in sources:
+            try:
+                with stats.timer("finish"):
+                    directory = source.finish()
+                if directory:
+                    session.writer.touched(directory)
+                processed += 1
+                if source in intents:
+                    finished.append(intents.pop(source))
+            except Exception as e:
+                failed(source, e)
+                errors += 1
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                capture = json.load(f)
+            # Make the moves into processed/ and failed/ durable too
+            with stats.timer("sync"):
+                session.writer.sync()
+        except OSError as e:
+            # Their ideas are safe; at worst the sources are seen again
+            print(f"Cannot sync retired captures: {e}", file=sys.stderr)
+        session.journal.done(finished)
+        stats.count("processed", processed)
+        return processed, errors
+
+    unretired = []
+    intents = {}  # source -> capture id with an unfinished journal intent
+    try:
+        for start in range(0, len(sources), batch_size):
+            stats.gauge("queue_depth", len(sources) - start)
+            # Captures another worker claimed first are its to process
+            batch = [source for source in sources[start:start + batch_size] if source.claim()]
+            stats.count("claim_conflicts", min(batch_size, len(sources) - start) - len(batch))
+            for source in unretired:
+                source.renew()
+
+            prepared = list(run(
+                lambda source: _call(prepare_capture, source, config, stats), batch
+            ))
+
+            # Decide duplicates and allocate output names serially, in
+            # inbox order, so results never depend on thread timing
+            jobs = []
+            settled = []  # (source, merge_target) retired without a new file
+            rendered_before = session.rendered(
+                result[0] for result, err in prepared if err is None
+            )
+            for source, (result, err) in zip(batch, prepared):
+                if err is not None:
+                    failed(source, err)
+                    error_count += 1
+                    continue
+                capture, out_filename = result
+                try:
+                    resumed = session.resume(capture)
+                    if not resumed and str(capture.get("id")) in rendered_before:
+                        # A replayed send; its idea is already written
+                        session.duplicates += 1
+                        stats.count("duplicates")
+                        stats.count("replays")
+                        settled.append((source, capture, None))
+                        continue
+                    with stats.timer("dedup"):
+                        action, match = session.check_duplicate(capture)
+                    if action in ("skip", "merge"):
+                        if resumed:
+                            # Drop the name a crash left allocated, if still empty
+                            session.forget(capture, resumed)
+                        session.duplicates += 1
+                        stats.count("duplicates")
+                        settled.append((source, capture, match.path if action == "merge" else None))
+                        continue
+                    annotations = {}
+                    if action == "link":
+                        session.duplicates += 1
+                        stats.count("duplicates")
+                        annotations["duplicate_of"] = os.path.relpath(
+                            match.path, output_path
+                        )
+                    with stats.timer("allocate"):
+                        if resumed:
+                            # Written before a crash: overwrite, don't duplicate
+                            out_filepath = session.names.reserve(resumed)
+                            stats.count("resumed")
+                        else:
+                            subdir = layout.output_subdir(out_filename, output_layout)
+                            out_filepath = session.names.allocate(
+                                os.path.join(output_path, subdir), out_filename, capture
+                            )
+                    with stats.timer("dedup"):
+                        session.remember(capture, out_filepath)
+                except Exception as e:
+                    failed(source, e)
+                    error_count += 1
+                    continue
+                jobs.append((source, capture, annotations, out_filepath))
 
-            markdown = build_markdown(capture, config)
-            out_filename = generate_filename(capture)
+            # Journal the names now: a crash while tagging must not leave
+            # a placeholder that the rerun steps around with `_<id>`
+            with stats.timer("journal"):
+                intents.update(session.intend(jobs))
 
-            # Avoid overwriting: append capture ID if file exists
-            out_filepath = os.path.join(output_path, out_filename)
-            if os.path.exists(out_filepath):
-                base, ext = os.path.splitext(out_filename)
-                capture_id = capture.get("id", "dup")[:8]
-                out_filepath = os.path.join(output_path, f"{base}_{capture_id}{ext}")
+            session.enrich(jobs)
+            session.link(jobs)
 
-            with open(out_filepath, "w", encoding="utf-8") as f:
-                f.write(markdown)
+            # Tagging can be slow. Write only captures whose claim is
+            # still ours, so one taken over after expiry is written once.
+            kept = []
+            for job in jobs:
+                if job[0].renew():
+                    kept.append(job)
+                else:
+                    session.forget(job[1], job[3])
+                    intents.pop(job[0], None)
+                    stats.count("claims_lost")
+            jobs = kept
 
-            # Move processed JSON to processed/ subfolder
-            shutil.move(filepath, os.path.join(processed_path, filename))
-            processed_count += 1
+            committed = list(run(
+                lambda job: _call(commit_capture, *job[1:], config, session.writer, stats),
+                jobs,
+            ))
 
-        except Exception as e:
-            print(f"Error processing {filename}: {e}", file=sys.stderr)
-            error_count += 1
+            written = []
+            rendered = []
+            for (source, capture, annotations, out_filepath), (result, err) in zip(jobs, committed):
+                if err is not None:
+                    session.forget(capture, out_filepath)
+                    intents.pop(source, None)
+                    failed(source, err)
+                    error_count += 1
+                else:
+                    written.append((capture, out_filepath))
+                    rendered.append((str(capture.get("id", out_filepath)), out_filepath,
+                                     *result, annotations))
+                    unretired.append(source)
+
+            # Duplicates go last: a merge target may have been written above
+            merged = []
+            for source, capture, merge_target in settled:
+                try:
+                    if merge_target:
+                        merge_duplicate(merge_target, capture, session.writer)
+                        merged.append(merge_target)
+                    unretired.append(source)
+                except Exception as e:
+                    failed(source, e)
+                    error_count += 1
+
+            try:
+                session.after_commit(written, rendered, merged)
+            except Exception as e:
+                # The ideas are safely written; a stale index can be rebuilt
+                print(f"Error updating indexes: {e}", file=sys.stderr)
+
+            if session.writer.due():
+                processed, errors = retire(unretired)
+                processed_count += processed
+                error_count += errors
+                unretired = []
+
+        processed, errors = retire(unretired)
+        processed_count += processed
+        error_count += errors
+        stats.gauge("queue_depth", 0)
+    finally:
+        if pool:
+            pool.shutdown()
 
     return processed_count, error_count
 
 
-def main():
-    config = load_config()
-    processed, errors = process_inbox(config)
+def parse_args(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert raw IdeaShelf captures into markdown ideas."
+    )
+    parser.add_argument(
+        "--config",
+        help="Path to config.yaml (default: ~/IdeaShelf/config.yaml)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, metavar="N",
+        help="Parse, render and write captures on N threads (default: 1)",
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and process new captures as they arrive",
+    )
+    parser.add_argument(
+        "--debounce-ms", type=int, default=50, metavar="MS",
+        help="Watch mode: quiet period that ends a burst of captures (default: 50)",
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=0.2, metavar="SECONDS",
+        help="Watch mode: polling interval when inotify is unavailable (default: 0.2)",
+    )
+
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    search = commands.add_parser("search", help="Full-text search of processed ideas")
+    search.add_argument("query", nargs="+", help="Words to search for")
+    search.add_argument(
+        "--limit", type=int, default=10, metavar="N",
+        help="Maximum number of results (default: 10)",
+    )
+    search.add_argument(
+        "--raw", action="store_true",
+        help="Treat the query as FTS5 syntax (phrases, OR, NEAR, column:term)",
+    )
+
+    commands.add_parser(
+        "reindex",
+        help="Rebuild the search and related-ideas indexes from the output folder",
+    )
+
+    compact = commands.add_parser(
+        "compact",
+        help="Pack inbox/processed/ into compressed archive segments",
+    )
+    compact.add_argument(
+        "--limit", type=int, metavar="N",
+        help="Archive at most N captures this run",
+    )
+    archived = commands.add_parser(
+        "archived", help="Print a processed capture by id, from processed/ or the archive"
+    )
+    archived.add_argument("capture_id", help="Capture id (the inbox file name without .json)")
+
+    rebuild = commands.add_parser(
+        "rebuild",
+        help="Re-render ideas whose capture, config or renderer changed",
+    )
+    rebuild.add_argument(
+        "--force", action="store_true",
+        help="Re-render every tracked idea, even if its fingerprint is unchanged",
+    )
+    rebuild.add_argument(
+        "--adopt", action="store_true",
+        help="Also re-render ideas written before rebuild tracking existed",
+    )
+
+    migrate = commands.add_parser(
+        "migrate-layout",
+        help="Move existing ideas into the configured output_layout",
+    )
+    migrate.add_argument(
+        "--layout", choices=layout.LAYOUTS,
+        help="Target layout (default: output_layout from config.yaml)",
+    )
+    migrate.add_argument(
+        "--batch-size", type=int, default=500, metavar="N",
+        help="Files moved per journaled batch (default: 500)",
+    )
+    migrate.add_argument(
+        "--limit", type=int, metavar="N",
+        help="Stop after moving N files; run again to continue",
+    )
+    return parser.parse_args(argv)
+
+
+def search_ideas(config, query, limit=10, raw=False):
+    """Query the full-text index. Returns a list of result dicts."""
+    session = Session(config)
+    try:
+        index = session.search_index
+        if index is None:
+            return []
+        return index.search(query, limit=limit, raw=raw)
+    finally:
+        session.close()
+
+
+def reindex_output(config):
+    """Index every markdown file in the output folder and its subfolders.
+
+    Rebuilds the search index and, when enabled, the related-ideas index.
+    Returns the number of files indexed.
+    """
+    import search_index
+
+    output_path = config.get("output_folder", DEFAULT_CONFIG["output_folder"])
+    session = Session(config)
+    try:
+        index = session.search_index
+        related_index = session.related_index
+        if (index is None and related_index is None) or not os.path.isdir(output_path):
+            return 0
+        known = related_index.capture_ids_by_path() if related_index is not None else {}
+        if index is not None:
+            known.update(index.capture_ids_by_path())
+        docs = []
+        for path in layout.iter_ideas(output_path):
+            try:
+                doc = search_index.parse_markdown(path)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Error indexing {os.path.basename(path)}: {e}", file=sys.stderr)
+                continue
+            # Keep the capture id of files indexed at processing time
+            doc["capture_id"] = known.get(path, doc["capture_id"])
+            docs.append(doc)
+        if index is not None:
+            index.add_many(docs)
+        if related_index is not None:
+            related_index.rebuild((doc["capture_id"], doc, doc["path"]) for doc in docs)
+        return len(docs)
+    finally:
+        session.close()
+
+
+def migrate_output_layout(config, layout_name=None, batch_size=500, limit=None,
+                          progress=None):
+    """Move existing ideas into the configured (or given) output layout.
+
+    Updates the indexes and the links between ideas as files move. Safe
+    to interrupt and re-run. Returns the number of files moved.
+    """
+    output_path = config.get("output_folder", DEFAULT_CONFIG["output_folder"])
+    layout_name = layout_name or config.get("output_layout", DEFAULT_CONFIG["output_layout"])
+    if not os.path.isdir(output_path):
+        return 0
+    state_path = get_state_path(config)
+    os.makedirs(state_path, exist_ok=True)
+    session = Session(config)
+    try:
+        indexes = [
+            i for i in (session.search_index, session.dedup_index, session.related_index,
+                        session.manifest)
+            if i is not None
+        ]
+        return layout.migrate(
+            output_path, layout_name, state_path, indexes=indexes,
+            batch_size=batch_size, limit=limit, progress=progress,
+            capture_ids=session.manifest.capture_ids_by_path(),
+            relinked=session.manifest.relink,
+        )
+    finally:
+        session.close()
+
+
+def iter_processed_captures(config):
+    """Yield every processed capture, from processed/ then the archive."""
+    import archive
+
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    processed_path = os.path.join(inbox_path, "processed")
+    if os.path.isdir(processed_path):
+        for name in sorted(os.listdir(processed_path)):
+            if not is_capture_file(name):
+                continue
+            try:
+                yield capture_codec.load_file(os.path.join(processed_path, name))
+            except (OSError, ValueError) as e:
+                print(f"Error reading {name}: {e}", file=sys.stderr)
+    if os.path.isdir(os.path.join(inbox_path, archive.ARCHIVE_DIRNAME)):
+        with open_archive(config) as store:
+            yield from store.iter_captures()
+
+
+def _rebuild_one(job, config, writer, force):
+    """Re-render one idea if its fingerprint changed and nobody edited it.
+
+    Returns (outcome, manifest_row).
+    """
+    capture, annotations, path, entry = job
+    fingerprint = render_fingerprint(capture, annotations, config)
+    if entry is not None and fingerprint == entry.fingerprint and not force:
+        return "unchanged", None
+    try:
+        with open(path, "rb") as f:
+            current = hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return "missing", None  # Deleted on purpose; leave it deleted
+    if entry is not None and (entry.digest is None or current != entry.digest):
+        return "edited", None
+    data = build_markdown(capture, config, annotations).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    if digest != current:
+        writer.write(path, data)
+    row = (str(capture.get("id")), path, fingerprint, digest, annotations)
+    return ("rewritten" if digest != current else "unchanged"), row
+
+
+def rebuild_output(config, workers=1, force=False, adopt=False):
+    """Re-render ideas from their processed captures where inputs changed.
+
+    Only ideas recorded in the render manifest are touched, and only if
+    their file still has the exact bytes the processor wrote: edited,
+    merged and deleted ideas are left alone. `force` re-renders even
+    when the fingerprint is unchanged. `adopt` also takes over ideas
+    written before the manifest existed, found through the search index.
+    Never creates new ideas.
+
+    Returns a dict of counts: rewritten, unchanged, edited, missing,
+    untracked.
+    """
+    import enrich
+
+    counts = dict.fromkeys(("rewritten", "unchanged", "edited", "missing", "untracked"), 0)
+    workers = max(1, int(workers or 1))
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = None
+    run = pool.map if pool else map
+    batch_size = workers * BATCH_SIZE_PER_WORKER
+
+    session = Session(config)
+    try:
+        manifest = session.manifest
+        legacy = {}
+        if adopt and session.search_index is not None:
+            legacy = {cid: path for path, cid in session.search_index.capture_ids_by_path().items()}
+        if session.enricher is not None:
+            settings = config_section(config, "enrich")
+            batch_size = max(batch_size, settings["batch_size"] * settings["concurrency"])
+
+        def rebuild_batch(captures):
+            jobs = []
+            for capture in captures:
+                capture_id = str(capture.get("id"))
+                entry = manifest.get(capture_id)
+                if entry is not None:
+                    # Keep annotations such as duplicate_of; tags are redone
+                    base = {
+                        key: value for key, value in entry.annotations.items()
+                        if key not in enrich.TAG_KEYS
+                    }
+                    jobs.append((None, capture, base, entry.path, entry))
+                elif capture_id in legacy:
+                    jobs.append((None, capture, {}, legacy[capture_id], None))
+                else:
+                    counts["untracked"] += 1
+            session.enrich([job[:4] for job in jobs])
+            results = list(run(
+                lambda job: _rebuild_one(job[1:], config, session.writer, force), jobs
+            ))
+            rows = []
+            written = []
+            for (_, capture, _, path, _), (outcome, row) in zip(jobs, results):
+                counts[outcome] += 1
+                if row is not None:
+                    rows.append(row)
+                    if outcome == "rewritten":
+                        written.append((capture, path))
+            session.writer.sync()
+            manifest.record_many(rows)
+            if written and session.search_index is not None:
+                session.search_index.add_many(
+                    search_document(capture, path) for capture, path in written
+                )
+
+        batch = []
+        for capture in iter_processed_captures(config):
+            batch.append(capture)
+            if len(batch) >= batch_size:
+                rebuild_batch(batch)
+                batch = []
+        if batch:
+            rebuild_batch(batch)
+    finally:
+        if pool:
+            pool.shutdown()
+        session.close()
+    return counts
+
+
+def open_archive(config):
+    """Open the archive of processed captures in <inbox_folder>/archive/."""
+    import archive
+
+    settings = config_section(config, "archive")
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    return archive.Archive(
+        os.path.join(inbox_path, archive.ARCHIVE_DIRNAME),
+        compression=settings["compression"],
+        segment_bytes=settings["segment_bytes"],
+    )
+
+
+def compact_processed(config, limit=None):
+    """Pack inbox/processed/ into the archive and apply retention.
+
+    Returns (archived, failed, expired) capture counts.
+    """
+    import archive
+
+    settings = config_section(config, "archive")
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    with open_archive(config) as store:
+        archived, failed = archive.compact(
+            os.path.join(inbox_path, "processed"), store, limit=limit
+        )
+        expired = store.apply_retention(settings["retention_days"], settings["max_bytes"])
+    return archived, failed, expired
+
+
+def find_capture(config, capture_id):
+    """Return a processed capture by id from processed/ or the archive."""
+    inbox_path = config.get("inbox_folder", DEFAULT_CONFIG["inbox_folder"])
+    path = os.path.join(inbox_path, "processed", f"{capture_id}.json")
+    if os.path.exists(path):
+        return capture_codec.load_file(path)
+    with open_archive(config) as store:
+        return store.get(capture_id)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+
+    if args.command == "search":
+        import time
+
+        started = time.perf_counter()
+        results = search_ideas(config, " ".join(args.query), limit=args.limit, raw=args.raw)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for rank, result in enumerate(results, 1):
+            print(f"{rank}. {os.path.basename(result['path'])}  ({result['score']:.2f})")
+            print(f"   {result['title']}")
+            print(f"   {result['snippet']}")
+        print(f"{len(results)} results in {elapsed_ms:.1f} ms")
+        return
+
+    if args.command == "reindex":
+        count = reindex_output(config)
+        print(f"Indexed {count} ideas")
+        return
+
+    if args.command == "compact":
+        archived, failed, expired = compact_processed(config, limit=args.limit)
+        print(f"Archived {archived} captures")
+        if expired:
+            print(f"  Removed {expired} captures past retention")
+        if failed:
+            print(f"  Errors: {failed} files left in processed/")
+        return
+
+    if args.command == "archived":
+        capture = find_capture(config, args.capture_id)
+        if capture is None:
+            sys.exit(f"No processed capture with id {args.capture_id}")
+        print(json.dumps(capture, indent=2, ensure_ascii=False))
+        return
+
+    if args.command == "rebuild":
+        counts = rebuild_output(config, workers=args.workers, force=args.force, adopt=args.adopt)
+        print(f"Rebuilt {counts['rewritten']} ideas ({counts['unchanged']} unchanged)")
+        if counts["edited"]:
+            print(f"  Left {counts['edited']} edited ideas untouched")
+        if counts["missing"]:
+            print(f"  Skipped {counts['missing']} deleted ideas")
+        if counts["untracked"]:
+            print(f"  {counts['untracked']} captures have no tracked idea"
+                  + ("" if args.adopt else " (see --adopt)"))
+        return
+
+    if args.command == "migrate-layout":
+        count = migrate_output_layout(
+            config, args.layout, batch_size=args.batch_size, limit=args.limit,
+            progress=lambda moved: print(f"  moved {moved} ideas", flush=True),
+        )
+        print(f"Moved {count} ideas")
+        return
+
+    if args.watch:
+        import inbox_watch
+
+        def report(processed, errors):
+            line = f"Processed {processed} items"
+            if errors:
+                line += f", {errors} errors"
+            print(line, flush=True)
+
+        print("IdeaShelf Inbox Processor: watching for captures (Ctrl+C to stop)")
+        try:
+            inbox_watch.watch_inbox(
+                config,
+                workers=args.workers,
+                debounce=args.debounce_ms / 1000.0,
+                poll_interval=args.poll_interval,
+                on_batch=report,
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    session = Session(config)
+    try:
+        processed, errors = process_inbox(config, workers=args.workers, session=session)
+        session.maybe_compact(processed, force=True)
+    finally:
+        session.close()
 
     print(f"IdeaShelf Inbox Processor")
     print(f"  Processed: {processed} items")
+    if session.duplicates:
+        print(f"  Duplicates: {session.duplicates} items")
+    if session.cache_hits or session.cache_misses:
+        print(f"  Tagger cache: {session.cache_hits} hits, {session.cache_misses} misses")
     if errors:
         print(f"  Errors:    {errors} items")
     if processed == 0 and errors == 0:
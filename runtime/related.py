@@ -0,0 +1,267 @@
+"""
+IdeaShelf Related Ideas
+
+Finds the ideas most similar to a new capture so the processor can link
+them in a `related:` frontmatter list. Enable it with:
+
+    related:
+      enabled: true
+      k: 5               # links per idea
+      min_score: 0.15    # cosine similarity, 0-1
+
+Each idea is a sparse TF-IDF vector over its title, content and note,
+plus one `site:` term for the source's host, so captures from the same
+site lean towards each other. Vectors are unit length, so a dot product
+is their cosine similarity.
+
+The index is an inverted file in SQLite: a posting (term, idea, weight)
+per distinct term of each idea, ordered by weight within each term. A
+query looks only at its own `max_terms` heaviest terms, skips terms found
+in more than `max_df` of all ideas, and reads at most `max_postings` of
+the heaviest postings per term. The work per query is bounded by
+max_terms x max_postings however large the shelf grows, and adding an
+idea touches only its own terms.
+
+Weights use the document frequencies at the time an idea is added; they
+are not recomputed as the shelf grows. `process_inbox.py reindex`
+rebuilds the index from the output folder with current frequencies.
+"""
+
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from urllib.parse import urlsplit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ideas (
+    id INTEGER PRIMARY KEY,
+    capture_id TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE,
+    df INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    idea INTEGER NOT NULL,
+    weight REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_term ON postings (term, weight DESC);
+CREATE INDEX IF NOT EXISTS postings_idea ON postings (idea);
+"""
+
+TEXT_FIELDS = ("title", "content", "user_note")
+
+# Too common to say what an idea is about
+STOPWORDS = frozenset("""
+about above after again against also among because been before being
+below between both could does doing down during each even every from
+further have having here into itself just like made make many more most
+much must only other over same should some such than that their them
+then there these they this those through under until very were what
+when where which while whom will with would your yours
+""".split())
+
+_WORD = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+
+
+def terms(doc):
+    """Term counts for a document dict (title, content, user_note, source_url)."""
+    counts = Counter()
+    for field in TEXT_FIELDS:
+        for word in _WORD.findall(str(doc.get(field) or "").lower()):
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            if word not in STOPWORDS:
+                counts[word] += 1
+    host = urlsplit(str(doc.get("source_url") or "")).hostname
+    if host:
+        if host.startswith("www."):
+            host = host[4:]
+        counts["site:" + host] += 1
+    return counts
+
+
+class Neighbour:
+    """An indexed idea similar to a query."""
+
+    __slots__ = ("capture_id", "path", "score")
+
+    def __init__(self, capture_id, path, score):
+        self.capture_id = capture_id
+        self.path = path
+        self.score = score
+
+    def __repr__(self):
+        return f"Neighbour({self.capture_id!r}, {self.path!r}, {self.score:.3f})"
+
+
+class RelatedIndex:
+    """Incremental TF-IDF similarity index over processed ideas."""
+
+    def __init__(self, path, max_terms=24, max_postings=256, max_df=0.1):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_terms = int(max_terms)
+        self.max_postings = int(max_postings)
+        self.max_df = float(max_df)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._count = self.count()
+
+    def _stats(self, counts):
+        """{term: (term id, document frequency)} for the indexed terms."""
+        stats = {}
+        words = list(counts)
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(words), 500):
+            chunk = words[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for term_id, term, df in self.conn.execute(
+                f"SELECT id, term, df FROM terms WHERE term IN ({marks})", chunk
+            ):
+                stats[term] = (term_id, df)
+        return stats
+
+    @staticmethod
+    def _vector(counts, dfs, total):
+        """Unit-length TF-IDF weights from term counts and frequencies."""
+        vector = {
+            term: (1 + math.log(tf)) * (math.log((1 + total) / (1 + dfs.get(term, 0))) + 1)
+            for term, tf in counts.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def neighbours(self, doc, k=5, min_score=0.0, exclude=()):
+        """The k indexed ideas most similar to doc, best first."""
+        counts = terms(doc)
+        if not counts or not self._count:
+            return []
+        stats = self._stats(counts)
+        dfs = {term: df for term, (_, df) in stats.items()}
+        vector = self._vector(counts, dfs, self._count)
+
+        # Common terms have long posting lists and say little; skip them
+        # once the shelf is big enough for frequencies to mean something
+        limit = max(2, self.max_df * self._count) if self._count >= 20 else None
+        query = sorted(
+            ((weight, stats[term][0]) for term, weight in vector.items()
+             if term in stats and (limit is None or dfs[term] <= limit)),
+            reverse=True,
+        )[:self.max_terms]
+
+        scores = Counter()
+        for weight, term_id in query:
+            for idea, posting in self.conn.execute(
+                "SELECT idea, weight FROM postings WHERE term = ? "
+                "ORDER BY weight DESC LIMIT ?",
+                (term_id, self.max_postings),
+            ):
+                scores[idea] += weight * posting
+        if not scores:
+            return []
+
+        excluded = set(exclude)
+        result = []
+        for idea, score in scores.most_common():
+            if score < min_score or len(result) >= k:
+                break
+            capture_id, path = self.conn.execute(
+                "SELECT capture_id, path FROM ideas WHERE id = ?", (idea,)
+            ).fetchone()
+            if capture_id not in excluded and path not in excluded:
+                result.append(Neighbour(capture_id, path, score))
+        return result
+
+    def add(self, capture_id, doc, path):
+        """Index an idea. Call commit() to persist a batch."""
+        self.discard(capture_id)
+        counts = terms(doc)
+        idea = self.conn.execute(
+            "INSERT INTO ideas (capture_id, path) VALUES (?, ?)", (capture_id, path)
+        ).lastrowid
+        self._count += 1
+        if not counts:
+            return
+        rows = [(term,) for term in counts]
+        self.conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", rows)
+        self.conn.executemany("UPDATE terms SET df = df + 1 WHERE term = ?", rows)
+        stats = self._stats(counts)
+        vector = self._vector(counts, {t: df for t, (_, df) in stats.items()}, self._count)
+        self.conn.executemany(
+            "INSERT INTO postings (term, idea, weight) VALUES (?, ?, ?)",
+            [(stats[term][0], idea, weight) for term, weight in vector.items()],
+        )
+
+    def discard(self, capture_id):
+        row = self.conn.execute(
+            "SELECT id FROM ideas WHERE capture_id = ?", (capture_id,)
+        ).fetchone()
+        if row:
+            self.conn.execute(
+                "UPDATE terms SET df = df - 1 WHERE id IN "
+                "(SELECT term FROM postings WHERE idea = ?)",
+                row,
+            )
+            self.conn.execute("DELETE FROM postings WHERE idea = ?", row)
+            self.conn.execute("DELETE FROM ideas WHERE id = ?", row)
+            self._count -= 1
+
+    def rebuild(self, docs):
+        """Replace the index with (capture_id, doc, path) triples.
+
+        Document frequencies are counted over all of them first, so every
+        weight reflects the whole shelf. Commits.
+        """
+        docs = {capture_id: (terms(doc), path) for capture_id, doc, path in docs}
+        dfs = Counter()
+        for counts, _ in docs.values():
+            dfs.update(counts.keys())
+        with self.conn:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.execute("DELETE FROM ideas")
+            self.conn.execute("DELETE FROM terms")
+            self.conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?)", dfs.items()
+            )
+            term_ids = dict(self.conn.execute("SELECT term, id FROM terms"))
+            total = len(docs)
+            for capture_id, (counts, path) in docs.items():
+                idea = self.conn.execute(
+                    "INSERT INTO ideas (capture_id, path) VALUES (?, ?)",
+                    (capture_id, path),
+                ).lastrowid
+                vector = self._vector(counts, dfs, total)
+                self.conn.executemany(
+                    "INSERT INTO postings (term, idea, weight) VALUES (?, ?, ?)",
+                    [(term_ids[term], idea, weight) for term, weight in vector.items()],
+                )
+        self._count = self.count()
+
+    def capture_ids_by_path(self):
+        return {path: capture_id for capture_id, path in
+                self.conn.execute("SELECT capture_id, path FROM ideas")}
+
+    def rename_paths(self, pairs):
+        """Repoint many moved files and commit."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE ideas SET path = ? WHERE path = ?",
+                [(new_path, old_path) for old_path, new_path in pairs],
+            )
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM ideas").fetchone()[0]
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,138 @@
+"""
+IdeaShelf Render Manifest
+
+Records, for every idea the processor writes, what it was rendered from
+and what it wrote:
+
+- capture_id: the capture the idea came from
+- path: where the idea is
+- fingerprint: hash of the capture, annotations, config and renderer
+  version that produced it (see process_inbox.render_fingerprint)
+- digest: SHA-256 of the bytes written, or NULL once the processor no
+  longer owns the exact contents (after a duplicate was merged into it)
+- annotations: the frontmatter annotations used, as JSON
+
+`process_inbox.py rebuild` uses it to re-render only ideas whose
+fingerprint changed, and to leave alone any file whose bytes no longer
+match the digest because someone edited it.
+
+The manifest is a SQLite file in the processor's state folder.
+"""
+
+import json
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    capture_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    fingerprint TEXT,
+    digest TEXT,
+    annotations TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS renders_path ON renders (path);
+"""
+
+
+class Entry:
+    __slots__ = ("capture_id", "path", "fingerprint", "digest", "annotations")
+
+    def __init__(self, capture_id, path, fingerprint, digest, annotations):
+        self.capture_id = capture_id
+        self.path = path
+        self.fingerprint = fingerprint
+        self.digest = digest
+        self.annotations = annotations
+
+
+class RenderManifest:
+    """Capture id -> rendered idea, with fingerprints and digests."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def get(self, capture_id):
+        row = self.conn.execute(
+            "SELECT capture_id, path, fingerprint, digest, annotations "
+            "FROM renders WHERE capture_id = ?",
+            (capture_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Entry(*row[:4], json.loads(row[4]))
+
+    def paths(self, capture_ids):
+        """{capture id: rendered path} for the ids that have been rendered."""
+        found = {}
+        capture_ids = list(capture_ids)
+        for start in range(0, len(capture_ids), 500):
+            chunk = capture_ids[start:start + 500]
+            found.update(self.conn.execute(
+                "SELECT capture_id, path FROM renders WHERE capture_id IN (%s)"
+                % ",".join("?" * len(chunk)),
+                chunk,
+            ))
+        return found
+
+    def record_many(self, rows):
+        """Store (capture_id, path, fingerprint, digest, annotations) rows."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO renders "
+                "(capture_id, path, fingerprint, digest, annotations) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (capture_id, path, fingerprint, file_hash,
+                     json.dumps(annotations, ensure_ascii=False, sort_keys=True))
+                    for capture_id, path, fingerprint, file_hash, annotations in rows
+                ],
+            )
+
+    def release(self, path):
+        """Stop owning the contents of `path`, so rebuild leaves it alone."""
+        with self.conn:
+            self.conn.execute("UPDATE renders SET digest = NULL WHERE path = ?", (path,))
+
+    def rename_paths(self, pairs):
+        """Point entries at many moved files in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE renders SET path = ? WHERE path = ?",
+                [(new_path, old_path) for old_path, new_path in pairs],
+            )
+
+    def capture_ids_by_path(self):
+        return {path: capture_id for capture_id, path in
+                self.conn.execute("SELECT capture_id, path FROM renders")}
+
+    def relink(self, path, moved, old_digest, new_digest):
+        """Follow an idea whose links were rewritten for moved ideas.
+
+        `moved` maps old link targets to new ones. The digest is only
+        advanced if the file was ours before the rewrite.
+        """
+        row = self.conn.execute(
+            "SELECT capture_id, digest, annotations FROM renders WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return
+        capture_id, digest, annotations = row
+        annotations = json.loads(annotations)
+        if "duplicate_of" in annotations:
+            annotations["duplicate_of"] = moved.get(annotations["duplicate_of"],
+                                                    annotations["duplicate_of"])
+        if "related" in annotations:
+            annotations["related"] = [moved.get(t, t) for t in annotations["related"]]
+        with self.conn:
+            self.conn.execute(
+                "UPDATE renders SET digest = ?, annotations = ? WHERE capture_id = ?",
+                (new_digest if digest == old_digest else digest,
+                 json.dumps(annotations, ensure_ascii=False, sort_keys=True), capture_id),
+            )
+
+    def close(self):
+        self.conn.close()
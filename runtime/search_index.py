@@ -0,0 +1,186 @@
+"""
+IdeaShelf Search Index
+
+A SQLite FTS5 full-text index over processed ideas (title, summary,
+content, source URL and user note). The inbox processor updates it
+incrementally as each capture is written, so searching never has to read
+the markdown files themselves.
+
+Needs sqlite3 with FTS5, which ships with the standard Python builds.
+"""
+
+import os
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    capture_id TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS ideas USING fts5(
+    title, summary, content, source_url, user_note,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# bm25 column weights: title, summary, content, source_url, user_note
+RANK_WEIGHTS = (10.0, 4.0, 1.0, 2.0, 3.0)
+
+FIELDS = ("title", "summary", "content", "source_url", "user_note")
+
+
+class SearchIndex:
+    """Full-text index of ideas, keyed by capture id."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def add_many(self, docs):
+        """Insert or replace documents in one transaction.
+
+        Each doc is a dict with capture_id, path and the FIELDS.
+        """
+        with self.conn:
+            for doc in docs:
+                self._upsert(doc)
+
+    def add(self, doc):
+        self.add_many([doc])
+
+    def _upsert(self, doc):
+        row = self.conn.execute(
+            "SELECT rowid FROM documents WHERE capture_id = ?", (doc["capture_id"],)
+        ).fetchone()
+        if row:
+            rowid = row[0]
+            self.conn.execute("DELETE FROM ideas WHERE rowid = ?", (rowid,))
+            self.conn.execute(
+                "UPDATE documents SET path = ? WHERE rowid = ?", (doc["path"], rowid)
+            )
+        else:
+            rowid = self.conn.execute(
+                "INSERT INTO documents (capture_id, path) VALUES (?, ?)",
+                (doc["capture_id"], doc["path"]),
+            ).lastrowid
+        self.conn.execute(
+            "INSERT INTO ideas (rowid, title, summary, content, source_url, user_note) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (rowid,) + tuple(doc.get(field) or "" for field in FIELDS),
+        )
+
+    def remove(self, capture_id):
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT rowid FROM documents WHERE capture_id = ?", (capture_id,)
+            ).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM ideas WHERE rowid = ?", row)
+                self.conn.execute("DELETE FROM documents WHERE rowid = ?", row)
+
+    def rename_paths(self, pairs):
+        """Point documents at many moved files in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE documents SET path = ? WHERE path = ?",
+                [(new_path, old_path) for old_path, new_path in pairs],
+            )
+
+    def capture_ids_by_path(self):
+        """Map each indexed markdown path to its capture id."""
+        return dict(self.conn.execute("SELECT path, capture_id FROM documents"))
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM documents").fetchone()[0]
+
+    def search(self, query, limit=10, raw=False):
+        """Return ranked matches as dicts with path, title, snippet, score.
+
+        Plain queries match documents containing every word. Pass raw=True
+        to use FTS5 query syntax (phrases, OR, NEAR, column filters).
+        """
+        match = query if raw else to_match_expression(query)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+        rows = self.conn.execute(
+            f"""
+            SELECT d.capture_id, d.path, i.title,
+                   snippet(ideas, -1, '[', ']', '...', 12),
+                   bm25(ideas, {weights}) AS score
+            FROM ideas AS i JOIN documents AS d ON d.rowid = i.rowid
+            WHERE ideas MATCH ?
+            ORDER BY score
+            LIMIT ?
+            """,
+            (match, limit),
+        ).fetchall()
+        return [
+            {
+                "capture_id": capture_id,
+                "path": path,
+                "title": title,
+                "snippet": snippet,
+                # bm25() is lower-is-better; flip it for display
+                "score": -score,
+            }
+            for capture_id, path, title, snippet, score in rows
+        ]
+
+    def close(self):
+        self.conn.close()
+
+
+def to_match_expression(query):
+    """Turn free text into an FTS5 query that ANDs quoted terms."""
+    terms = re.findall(r"\w+", query, flags=re.UNICODE)
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def parse_markdown(path):
+    """Recover index fields from a markdown file written by the processor.
+
+    Used to index ideas that predate the index. Returns a dict of FIELDS
+    plus capture_id (the file name, since ids are not stored in the
+    markdown) and path.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    doc = {field: "" for field in FIELDS}
+    doc["capture_id"] = "file:" + os.path.basename(path)
+    doc["path"] = path
+
+    body = text
+    if text.startswith("---\n"):
+        end = text.find("\n---\n", 4)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, _, value = line.partition(":")
+                if key == "summary":
+                    doc["summary"] = value.strip()
+                elif key == "source":
+                    doc["source_url"] = value.strip()
+                elif key == "id":
+                    doc["capture_id"] = value.strip()
+            body = text[end + 5:]
+
+    lines = body.strip("\n").split("\n")
+    if lines and lines[0].startswith("# "):
+        doc["title"] = lines[0][2:].strip()
+        lines = lines[1:]
+
+    content = []
+    for line in lines:
+        if line.startswith("*User note: ") and line.endswith("*"):
+            doc["user_note"] = line[len("*User note: "):-1]
+        elif not (line.startswith("*Source: ") or line == "---"):
+            content.append(line)
+    doc["content"] = "\n".join(content).strip()
+    return doc
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+IdeaShelf Stub Tagger
+
+A stand-in for a real model behind the enrichment stage. It tags a
+capture with every taxonomy category and theme whose words appear in its
+content, title or note, and picks the first taxonomy type mentioned as
+its idea_type. Useful for trying the pipeline end to end and for tests.
+
+Usage:
+    python3 stub_tagger.py < request.json          # one batch, as a command
+    python3 stub_tagger.py --serve 8765            # HTTP on 127.0.0.1:8765
+    python3 stub_tagger.py --delay 0.5 ...         # pretend to be a slow model
+
+See enrich.py for the request and reply format.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def _mentioned(terms, words):
+    """Terms all of whose words (split on - and _) appear in `words`."""
+    found = []
+    for term in terms or []:
+        parts = [p for p in re.split(r"[-_\s]+", str(term).lower()) if p]
+        if parts and all(p in words for p in parts):
+            found.append(term)
+    return found
+
+
+def tag(request):
+    """Answer one request dict with a reply dict."""
+    taxonomy = request.get("taxonomy") or {}
+    results = []
+    for item in request.get("items", []):
+        words = _words(" ".join(
+            str(item.get(field) or "") for field in ("content", "source_title", "user_note")
+        ))
+        result = {
+            "id": item.get("id"),
+            "categories": _mentioned(taxonomy.get("categories"), words),
+            "themes": _mentioned(taxonomy.get("themes"), words),
+        }
+        types = _mentioned(taxonomy.get("types"), words)
+        if types:
+            result["idea_type"] = types[0]
+        results.append(result)
+    return {"results": results}
+
+
+def make_server(port, delay=0.0):
+    """An HTTP server answering POSTed requests on 127.0.0.1:port."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_error(400, "Invalid JSON")
+                return
+            time.sleep(delay)
+            body = json.dumps(tag(request)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+
+def serve(port, delay):
+    server = make_server(port, delay)
+    print(f"Stub tagger listening on http://127.0.0.1:{server.server_port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyword tagger for testing enrichment.")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve HTTP on this port")
+    parser.add_argument("--delay", type=float, default=0.0, metavar="SECONDS",
+                        help="Sleep this long per batch (default: 0)")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        serve(args.serve, args.delay)
+        return
+
+    request = json.load(sys.stdin)
+    time.sleep(args.delay)
+    json.dump(tag(request), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
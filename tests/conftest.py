@@ -0,0 +1,39 @@
+"""
+Shared helpers for the IdeaShelf tests.
+
+Test modules import these directly (`from conftest import make_capture`);
+pytest puts this folder on the import path.
+"""
+
+import json
+import os
+import uuid
+
+
+def make_capture(**overrides):
+    """Create a valid capture dict with optional overrides."""
+    capture = {
+        "id": str(uuid.uuid4()),
+        "captured_at": "2026-02-27T14:30:00Z",
+        "source_url": "https://example.com/article",
+        "source_title": "Test Article Title",
+        "content_type": "text_selection",
+        "content": "This is a test capture for processing.",
+        "context": {
+            "preceding_text": "Before",
+            "following_text": "After",
+        },
+        "user_note": "",
+    }
+    capture.update(overrides)
+    return capture
+
+
+def write_capture_to_inbox(capture, inbox_path):
+    """Write a capture the way the host does: temp file, then rename."""
+    filepath = os.path.join(inbox_path, f"{capture['id']}.json")
+    tmp = filepath + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(capture, f, indent=2)
+    os.replace(tmp, filepath)
+    return filepath
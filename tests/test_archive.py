@@ -0,0 +1,126 @@
+"""
+Tests for the IdeaShelf capture archive.
+
+Run with: python -m pytest tests/test_archive.py -v
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import archive
+
+
+def make_processed(directory, count, start=0, content="Archived capture"):
+    os.makedirs(directory, exist_ok=True)
+    for i in range(start, start + count):
+        capture = {"id": f"id-{i:05d}", "content": f"{content} {i}"}
+        with open(os.path.join(directory, f"id-{i:05d}.json"), "w") as f:
+            json.dump(capture, f, indent=2)
+
+
+class TestArchive:
+    """Tests for storing and fetching archived captures."""
+
+    @pytest.mark.parametrize("compression", ["gzip", "lzma"])
+    def test_get_returns_stored_capture(self, tmp_path, compression):
+        with archive.Archive(str(tmp_path), compression=compression) as store:
+            store.add_many([{"id": "a", "content": "first"}, {"id": "b", "content": "ü"}])
+            assert store.get("b") == {"id": "b", "content": "ü"}
+            assert store.get("a")["content"] == "first"
+            assert store.get("missing") is None
+
+    def test_segment_is_plain_gzipped_jsonl(self, tmp_path):
+        with archive.Archive(str(tmp_path)) as store:
+            store.add_many([{"id": "a"}])
+            store.add_many([{"id": "b"}])
+        (segment,) = [n for n in os.listdir(tmp_path) if n.endswith(".jsonl.gz")]
+        with gzip.open(tmp_path / segment, "rt") as f:
+            assert [json.loads(line)["id"] for line in f] == ["a", "b"]
+
+    def test_duplicates_are_skipped(self, tmp_path):
+        with archive.Archive(str(tmp_path)) as store:
+            assert store.add_many([{"id": "a"}, {"id": "a"}]) == 1
+            assert store.add_many([{"id": "a"}]) == 0
+            assert store.count() == 1
+
+    def test_rolls_over_to_new_segments(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(archive, "BLOCK_BYTES", 100)
+        with archive.Archive(str(tmp_path), segment_bytes=200) as store:
+            store.add_many([{"id": str(i), "content": os.urandom(40).hex()} for i in range(20)])
+            segments = [n for n in os.listdir(tmp_path) if n.endswith(".jsonl.gz")]
+            assert len(segments) > 1
+            assert all(store.get(str(i)) for i in range(20))
+
+    def test_torn_block_is_cut_off(self, tmp_path):
+        with archive.Archive(str(tmp_path)) as store:
+            store.add_many([{"id": "a"}])
+        (segment,) = [n for n in os.listdir(tmp_path) if n.endswith(".jsonl.gz")]
+        with open(tmp_path / segment, "ab") as f:
+            f.write(b"\x1f\x8b half a block")
+
+        with archive.Archive(str(tmp_path)) as store:
+            store.add_many([{"id": "b"}])
+            assert store.get("b") == {"id": "b"}
+        with gzip.open(tmp_path / segment, "rt") as f:
+            assert [json.loads(line)["id"] for line in f] == ["a", "b"]
+
+
+class TestRetention:
+    """Tests for dropping old segments."""
+
+    def _store(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(archive, "BLOCK_BYTES", 1)
+        store = archive.Archive(str(tmp_path), segment_bytes=1)
+        for i in range(3):
+            store.add_many([{"id": str(i)}])
+        return store
+
+    def test_max_bytes_drops_oldest_segments(self, tmp_path, monkeypatch):
+        with self._store(tmp_path, monkeypatch) as store:
+            one = store.size() // 3
+            assert store.apply_retention(max_bytes=one * 2) == 1
+            assert store.get("0") is None
+            assert store.get("2") == {"id": "2"}
+
+    def test_retention_days_drops_expired_but_keeps_newest(self, tmp_path, monkeypatch):
+        with self._store(tmp_path, monkeypatch) as store:
+            store.conn.execute("UPDATE segments SET archived_at = ?", (time.time() - 10 * 86400,))
+            assert store.apply_retention(retention_days=7) == 2
+            assert store.count() == 1
+            assert store.get("2") == {"id": "2"}
+
+
+class TestCompact:
+    """Tests for packing processed/ into the archive."""
+
+    def test_moves_files_into_archive(self, tmp_path):
+        processed = str(tmp_path / "processed")
+        make_processed(processed, 5)
+        with archive.Archive(str(tmp_path / "archive")) as store:
+            assert archive.compact(processed, store, batch_size=2) == (5, 0)
+            assert os.listdir(processed) == []
+            assert store.get("id-00003")["content"] == "Archived capture 3"
+
+    def test_unreadable_files_stay(self, tmp_path):
+        processed = str(tmp_path / "processed")
+        make_processed(processed, 1)
+        with open(os.path.join(processed, "broken.json"), "w") as f:
+            f.write("{not json")
+        with archive.Archive(str(tmp_path / "archive")) as store:
+            assert archive.compact(processed, store) == (1, 1)
+        assert os.listdir(processed) == ["broken.json"]
+
+    def test_limit(self, tmp_path):
+        processed = str(tmp_path / "processed")
+        make_processed(processed, 5)
+        with archive.Archive(str(tmp_path / "archive")) as store:
+            assert archive.compact(processed, store, limit=3) == (3, 0)
+        assert len(os.listdir(processed)) == 2
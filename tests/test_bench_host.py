@@ -0,0 +1,45 @@
+"""
+Smoke tests for the native host latency benchmark.
+
+Run with: python -m pytest tests/test_bench_host.py -v
+"""
+
+import os
+import struct
+import sys
+
+import pytest
+
+# Add benchmarks to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_host
+
+
+class TestFraming:
+    """The benchmark must speak the host's exact wire format."""
+
+    def test_frame_is_little_endian_length_prefixed(self):
+        data = bench_host.frame({"a": 1})
+        assert struct.unpack("<I", data[:4])[0] == len(data) - 4
+
+    def test_budget_comes_from_extension(self):
+        assert bench_host.native_host_timeout_ms(default=-1) == 5000
+
+
+class TestRun:
+    """End-to-end runs against the real host."""
+
+    @pytest.mark.parametrize("mode", ["spawn", "persistent"])
+    def test_every_capture_is_answered_and_visible(self, mode, tmp_path):
+        samples, spawns, elapsed = bench_host.run(
+            bench_host.DEFAULT_HOST, mode, count=4, rate=0, concurrency=2,
+            content_chars=100, inbox=str(tmp_path),
+        )
+        summary = bench_host.summarize(samples, spawns, elapsed, budget_ms=5000)
+
+        assert summary["succeeded"] == 4, summary["first_error"]
+        assert summary["response_ms"]["count"] == 4
+        assert summary["visible_ms"]["count"] == 4
+        assert summary["over_budget"] == 0
+        assert len(list(tmp_path.glob("*.json"))) == 4
@@ -0,0 +1,46 @@
+"""
+Smoke tests for the inbox benchmark suite.
+
+Run with: python -m pytest tests/test_bench_inbox.py -v
+"""
+
+import json
+import os
+import sys
+
+# Add benchmarks to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_inbox
+
+
+class TestGenerate:
+    """Tests for synthetic inbox generation."""
+
+    def test_generated_captures_are_valid_and_reproducible(self, tmp_path):
+        bench_inbox.generate(str(tmp_path / "a"), 50, seed=7)
+        bench_inbox.generate(str(tmp_path / "b"), 50, seed=7)
+
+        names = sorted(os.listdir(tmp_path / "a"))
+        assert names == sorted(os.listdir(tmp_path / "b"))
+        assert len(names) == 50
+        with open(tmp_path / "a" / names[0], encoding="utf-8") as f:
+            capture = json.load(f)
+        for field in ("id", "captured_at", "content_type", "content", "context"):
+            assert field in capture
+        assert capture["content"].strip()
+
+
+class TestRunSuite:
+    """End-to-end run at a tiny size."""
+
+    def test_report_is_machine_readable(self, tmp_path):
+        report = bench_inbox.run_suite([20], ["serial", "log"], workers=2, scratch=str(tmp_path))
+        json.dumps(report)
+        assert report["meta"]["benchmark"] == "inbox"
+        assert [r["mode"] for r in report["results"]] == ["serial", "log"]
+        for result in report["results"]:
+            assert result["processed"] == 20
+            assert result["errors"] == 0
+            assert result["captures_per_sec"] > 0
+            assert result["peak_rss_kb"] > 0
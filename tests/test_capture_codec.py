@@ -0,0 +1,124 @@
+"""
+Tests for IdeaShelf capture encodings.
+
+Tests that captures the native host stores in its compact encoding, as
+files or log records, are read back transparently by the processor, the
+archive and `archived <id>`.
+"""
+
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+# Add runtime and native-host to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "native-host"))
+
+import capture_codec
+import ideashelf_host
+import process_inbox
+from conftest import make_capture
+
+
+LONG = "Interleaving topics while practising improves retention. " * 200
+
+
+@pytest.fixture
+def compact(monkeypatch):
+    monkeypatch.setattr(ideashelf_host, "CAPTURE_ENCODING", "compact")
+    monkeypatch.setattr(ideashelf_host, "DURABILITY", "none")
+    monkeypatch.delenv("IDEASHELF_CAPTURE_ENCODING", raising=False)
+
+
+@pytest.fixture
+def config(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    return {"inbox_folder": str(inbox), "output_folder": str(tmp_path / "ideas")}
+
+
+class TestDecode:
+    def test_plain_json_passes_through(self):
+        assert capture_codec.decode(b'{"id": "a"}') == b'{"id": "a"}'
+
+    def test_gzip_is_detected(self):
+        data = gzip.compress(b'{"id": "a"}')
+        assert capture_codec.is_compressed(data)
+        assert capture_codec.loads(data) == {"id": "a"}
+
+    def test_corrupt_gzip_is_a_value_error(self):
+        with pytest.raises(ValueError):
+            capture_codec.decode(capture_codec.GZIP_MAGIC + b"garbage")
+
+
+class TestProcessCompact:
+    def _ideas(self, config):
+        return sorted(os.listdir(config["output_folder"]))
+
+    def test_files_in_every_encoding_render_the_same(self, config, monkeypatch, compact):
+        inbox = config["inbox_folder"]
+        small, large = make_capture(), make_capture(content=LONG)
+        for capture in (small, large):
+            ok, err, _ = ideashelf_host.write_capture(capture, inbox)
+            assert ok, err
+        with open(os.path.join(inbox, f"{large['id']}.json"), "rb") as f:
+            assert capture_codec.is_compressed(f.read())
+        with open(os.path.join(inbox, f"{small['id']}.json"), "rb") as f:
+            assert f.read() == json.dumps(small, ensure_ascii=False, separators=(",", ":")).encode()
+
+        assert process_inbox.process_inbox(config) == (2, 0)
+        compact_ideas = {}
+        for name in self._ideas(config):
+            with open(os.path.join(config["output_folder"], name), encoding="utf-8") as f:
+                compact_ideas[name] = f.read()
+
+        # The same captures written pretty render identically
+        monkeypatch.setattr(ideashelf_host, "CAPTURE_ENCODING", "pretty")
+        pretty_config = dict(
+            config,
+            output_folder=config["output_folder"] + "-pretty",
+            state_folder=config["output_folder"] + "-state",  # Not replays of the above
+        )
+        for capture in (small, large):
+            ideashelf_host.write_capture(capture, inbox)
+        assert process_inbox.process_inbox(pretty_config) == (2, 0)
+        for name, text in compact_ideas.items():
+            with open(os.path.join(pretty_config["output_folder"], name), encoding="utf-8") as f:
+                assert f.read() == text
+
+    def test_compressed_log_records(self, config, compact):
+        captures = [make_capture(content=LONG), make_capture()]
+        ok, err, _ = ideashelf_host.append_captures(captures, config["inbox_folder"])
+        assert ok, err
+        assert process_inbox.process_inbox(config) == (2, 0)
+        assert len(self._ideas(config)) == 2
+
+    def test_chunked_upload_is_compressed(self, config, compact, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: config["inbox_folder"])
+        capture = make_capture(content=LONG)
+        uploads = ideashelf_host.ChunkedUploads()
+        metadata = {k: v for k, v in capture.items() if k != "content"}
+        uploads.handle({"type": "chunk_start", "id": capture["id"], "capture": metadata})
+        for seq, start in enumerate(range(0, len(LONG), 4000)):
+            uploads.handle({"type": "chunk", "id": capture["id"], "seq": seq,
+                            "data": LONG[start:start + 4000]})
+        end = uploads.handle({"type": "chunk_end", "id": capture["id"], "chunks": seq + 1})
+        assert end["success"] is True, end
+
+        with open(end["path"], "rb") as f:
+            data = f.read()
+        assert len(data) < len(LONG) // 10
+        assert capture_codec.loads(data) == capture
+
+    def test_processed_and_archived_captures_stay_readable(self, config, compact):
+        capture = make_capture(content=LONG)
+        ideashelf_host.write_capture(capture, config["inbox_folder"])
+        assert process_inbox.process_inbox(config) == (1, 0)
+        assert process_inbox.find_capture(config, capture["id"]) == capture
+        assert [c["id"] for c in process_inbox.iter_processed_captures(config)] == [capture["id"]]
+
+        assert process_inbox.compact_processed(config)[:2] == (1, 0)
+        assert process_inbox.find_capture(config, capture["id"]) == capture
@@ -0,0 +1,147 @@
+"""
+Tests for the IdeaShelf capture log reader.
+
+Tests record parsing, checkpointed consumption, segment cleanup and
+recovery from damaged records, using segments written by the host.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Add runtime and native-host to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "native-host"))
+
+import capture_log
+import ideashelf_host
+import process_inbox
+from conftest import make_capture
+
+
+@pytest.fixture
+def dirs():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbox = os.path.join(tmpdir, "inbox")
+        output = os.path.join(tmpdir, "ideas")
+        os.makedirs(inbox)
+        config = {
+            "inbox_folder": inbox,
+            "output_folder": output,
+            "defaults": {"status": "raw"},
+        }
+        yield inbox, output, config
+
+
+def log_dir_of(inbox):
+    return os.path.join(inbox, "log")
+
+
+class TestParseRecords:
+    """Tests for splitting segment bytes into records."""
+
+    def test_intact_records_round_trip(self):
+        captures = [make_capture() for _ in range(3)]
+        data = b"".join(ideashelf_host.encode_record(c) for c in captures)
+        records, consumed = capture_log.parse_records(data)
+        assert consumed == len(data)
+        assert [json.loads(r[2]) for r in records] == captures
+        assert all(r[4] for r in records)
+
+    def test_incomplete_tail_is_left_for_later(self):
+        first = ideashelf_host.encode_record(make_capture())
+        second = ideashelf_host.encode_record(make_capture())
+        records, consumed = capture_log.parse_records(first + second[:-5])
+        assert len(records) == 1
+        assert consumed == len(first)
+
+    def test_damaged_region_is_skipped_to_next_record(self):
+        good = [ideashelf_host.encode_record(make_capture()) for _ in range(2)]
+        torn = good[0][:20]  # A write cut short by a crash
+        records, consumed = capture_log.parse_records(torn + good[1])
+        assert [r[4] for r in records] == [False, True]
+        assert records[0][2] == torn
+        assert consumed == len(torn) + len(good[1])
+
+
+class TestConsume:
+    """Tests for processing the log through process_inbox."""
+
+    def test_log_records_become_markdown(self, dirs):
+        inbox, output, config = dirs
+        for i in range(5):
+            ideashelf_host.append_capture(make_capture(content=f"Logged {i}"), inbox)
+
+        processed, errors = process_inbox.process_inbox(config)
+
+        assert (processed, errors) == (5, 0)
+        assert len(os.listdir(output)) == 5
+        checkpoint = capture_log.load_checkpoint(log_dir_of(inbox))
+        segment = os.path.join(log_dir_of(inbox), checkpoint["segment"])
+        assert checkpoint["offset"] == os.path.getsize(segment)
+
+    def test_only_new_records_are_processed_on_next_run(self, dirs):
+        inbox, output, config = dirs
+        ideashelf_host.append_capture(make_capture(content="First"), inbox)
+        assert process_inbox.process_inbox(config) == (1, 0)
+
+        ideashelf_host.append_capture(make_capture(content="Second"), inbox)
+        assert process_inbox.process_inbox(config) == (1, 0)
+        assert process_inbox.process_inbox(config) == (0, 0)
+        assert len(os.listdir(output)) == 2
+
+    def test_consumed_segments_are_deleted(self, dirs, monkeypatch):
+        inbox, output, config = dirs
+        monkeypatch.setattr(ideashelf_host, "SEGMENT_MAX_BYTES", 1024)
+        for i in range(10):
+            ideashelf_host.append_capture(
+                make_capture(content=f"Rotating capture {i} " + "z" * 300), inbox
+            )
+        assert len(capture_log.list_segments(log_dir_of(inbox))) > 2
+
+        processed, errors = process_inbox.process_inbox(config)
+
+        assert (processed, errors) == (10, 0)
+        # Only the active segment survives; the host may still append to it
+        assert len(capture_log.list_segments(log_dir_of(inbox))) == 1
+
+    def test_corrupt_record_is_saved_to_failed(self, dirs):
+        inbox, output, config = dirs
+        ideashelf_host.append_capture(make_capture(content="Good one"), inbox)
+        segment = os.path.join(log_dir_of(inbox), "000000000001.seg")
+        with open(segment, "ab") as f:
+            f.write(b"\x05\x00\x00\x00garbage-bytes")
+        ideashelf_host.append_capture(make_capture(content="Good two"), inbox)
+
+        processed, errors = process_inbox.process_inbox(config)
+
+        assert (processed, errors) == (2, 1)
+        failed = os.listdir(os.path.join(inbox, "failed"))
+        assert len(failed) == 1
+
+    def test_crash_after_batch_does_not_replay_it(self, dirs):
+        inbox, output, config = dirs
+        for i in range(4):
+            ideashelf_host.append_capture(make_capture(content=f"Batch {i}"), inbox)
+
+        calls = []
+
+        def process(batch):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise RuntimeError("simulated crash")
+            return len(batch), 0
+
+        with pytest.raises(RuntimeError):
+            capture_log.consume(log_dir_of(inbox), process, "unused", batch_size=2)
+
+        replayed = []
+        capture_log.consume(
+            log_dir_of(inbox),
+            lambda batch: (replayed.extend(batch), (len(batch), 0))[1],
+            "unused",
+        )
+        assert [json.loads(r.data)["content"] for r in replayed] == ["Batch 2", "Batch 3"]
@@ -0,0 +1,163 @@
+"""
+Tests for IdeaShelf inbox claims.
+
+Tests claiming, lease renewal and expiry, take-over of abandoned claims,
+and several processor runs draining one inbox concurrently.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import claims
+import process_inbox
+from conftest import make_capture, write_capture_to_inbox
+
+
+def make_inbox(tmpdir, count=0):
+    inbox = os.path.join(tmpdir, "inbox")
+    os.makedirs(inbox)
+    ids = []
+    for n in range(count):
+        capture = make_capture(
+            source_title=f"Article {n}", content=f"Capture number {n} about something"
+        )
+        write_capture_to_inbox(capture, inbox)
+        ids.append(capture["id"])
+    return inbox, ids
+
+
+class TestClaims:
+    def test_only_one_worker_wins(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, (capture_id,) = make_inbox(tmpdir, 1)
+            name = f"{capture_id}.json"
+            first = claims.Claims(inbox, owner="host-1-a")
+            second = claims.Claims(inbox, owner="host-2-b")
+            path = first.claim(name)
+            assert path == os.path.join(inbox, ".claims", "host-1-a", name)
+            assert second.claim(name) is None
+            assert not os.path.exists(os.path.join(inbox, name))
+
+    def test_release_returns_file_to_inbox(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, (capture_id,) = make_inbox(tmpdir, 1)
+            worker = claims.Claims(inbox, owner="host-1-a")
+            path = worker.claim(f"{capture_id}.json")
+            worker.release(path)
+            assert os.path.exists(os.path.join(inbox, f"{capture_id}.json"))
+            worker.close()
+            assert os.listdir(os.path.join(inbox, ".claims")) == []
+
+    def test_expired_lease_is_taken_over_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, (capture_id,) = make_inbox(tmpdir, 1)
+            crashed = claims.Claims(inbox, owner="otherhost-1-a", lease_seconds=60)
+            path = crashed.claim(f"{capture_id}.json")
+
+            rescuer = claims.Claims(inbox, owner="otherhost-2-b", lease_seconds=60)
+            assert list(rescuer.expired()) == []  # Lease still fresh
+
+            # ctime cannot be backdated, so shrink the lease instead
+            rescuer.lease_seconds = -1
+            assert list(rescuer.expired()) == [path]
+            taken = rescuer.take_over(path)
+            assert taken == os.path.join(inbox, ".claims", "otherhost-2-b", f"{capture_id}.json")
+            assert rescuer.take_over(path) is None
+            assert crashed.renew(path) is False
+            assert rescuer.renew(taken) is True
+
+    def test_claim_of_exited_local_process_expires_at_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, (capture_id,) = make_inbox(tmpdir, 1)
+            worker = claims.Claims(inbox)
+            host = worker.owner.rsplit("-", 2)[0]
+            proc = multiprocessing.Process(target=time.sleep, args=(0,))
+            proc.start()
+            proc.join()
+            dead = claims.Claims(inbox, owner=f"{host}-{proc.pid}-dead00")
+            path = dead.claim(f"{capture_id}.json")
+            assert list(worker.expired()) == [path]
+
+    def test_abandoned_empty_folders_are_removed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, _ = make_inbox(tmpdir)
+            folder = os.path.join(inbox, ".claims", "otherhost-1-a")
+            os.makedirs(folder)
+            assert list(claims.Claims(inbox, lease_seconds=60).expired()) == []
+            assert os.path.exists(folder)
+            assert list(claims.Claims(inbox, lease_seconds=-1).expired()) == []
+            assert not os.path.exists(folder)
+
+
+def _drain(config, results):
+    results.put(process_inbox.process_inbox(config))
+
+
+class TestSharedInbox:
+    def _config(self, tmpdir, inbox):
+        return {
+            "inbox_folder": inbox,
+            "output_folder": os.path.join(tmpdir, "ideas"),
+            "state_folder": os.path.join(tmpdir, "state"),
+            "search": {"enabled": False},
+            "durability": {"mode": "none"},
+        }
+
+    def test_concurrent_runs_write_each_idea_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, ids = make_inbox(tmpdir, 200)
+            config = self._config(tmpdir, inbox)
+            results = multiprocessing.Queue()
+            runs = [
+                multiprocessing.Process(target=_drain, args=(config, results))
+                for _ in range(4)
+            ]
+            for run in runs:
+                run.start()
+            totals = [results.get(timeout=60) for _ in runs]
+            for run in runs:
+                run.join(10)
+
+            assert sum(processed for processed, _ in totals) == 200
+            assert sum(errors for _, errors in totals) == 0
+            assert len(os.listdir(config["output_folder"])) == 200
+            assert sorted(os.listdir(os.path.join(inbox, "processed"))) == sorted(
+                f"{capture_id}.json" for capture_id in ids
+            )
+            assert os.listdir(os.path.join(inbox, ".claims")) == []
+
+    def test_run_recovers_captures_from_a_crashed_worker(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, ids = make_inbox(tmpdir, 3)
+            crashed = claims.Claims(inbox, owner="otherhost-1-a")
+            for capture_id in ids[:2]:
+                crashed.claim(f"{capture_id}.json")
+            config = self._config(tmpdir, inbox)
+            config["claims"] = {"lease_seconds": -1}
+
+            assert process_inbox.process_inbox(config) == (3, 0)
+            assert len(os.listdir(config["output_folder"])) == 3
+            assert os.listdir(os.path.join(inbox, ".claims")) == ["otherhost-1-a"]
+
+    def test_failed_capture_goes_back_to_inbox(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, _ = make_inbox(tmpdir)
+            with open(os.path.join(inbox, "broken.json"), "w") as f:
+                f.write("{not json")
+            config = self._config(tmpdir, inbox)
+            assert process_inbox.process_inbox(config) == (0, 1)
+            assert os.path.exists(os.path.join(inbox, "broken.json"))
+
+    def test_claims_can_be_disabled(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, _ = make_inbox(tmpdir, 2)
+            config = self._config(tmpdir, inbox)
+            config["claims"] = {"enabled": False}
+            assert process_inbox.process_inbox(config) == (2, 0)
+            assert not os.path.exists(os.path.join(inbox, ".claims"))
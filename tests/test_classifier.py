@@ -0,0 +1,96 @@
+"""
+Tests for the IdeaShelf offline taxonomy classifier.
+
+Run with: python -m pytest tests/test_classifier.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import classifier
+
+TAXONOMY = {
+    "types": ["metaphor", "exercise", "example"],
+    "categories": ["machine-learning", "teaching", "research"],
+    "themes": ["scaffolding", "feedback-loops", "attention"],
+}
+
+NUMPY = [False] + ([True] if classifier.HAS_NUMPY else [])
+
+
+def capture(content, **fields):
+    return dict({"id": "x", "content": content}, **fields)
+
+
+@pytest.fixture(params=NUMPY, ids=lambda v: "numpy" if v else "python")
+def model(request):
+    return classifier.TaxonomyClassifier(TAXONOMY, use_numpy=request.param)
+
+
+class TestTaxonomyClassifier:
+    """Tests for scoring captures against the taxonomy."""
+
+    def test_fills_every_kind(self, model):
+        (tags,) = model.classify([capture(
+            "A metaphor for teaching: scaffolding lets machine learning students climb."
+        )])
+        assert tags == {
+            "idea_type": "metaphor",
+            "categories": ["machine-learning", "teaching"],
+            "themes": ["scaffolding"],
+        }
+
+    def test_multiword_term_needs_every_word(self, model):
+        (tags,) = model.classify([capture("Machines everywhere, machines all day")])
+        assert "categories" not in tags
+
+    def test_plurals_and_title_count(self, model):
+        (tags,) = model.classify([capture("Two exercises", source_title="Feedback loops")])
+        assert tags == {"idea_type": "exercise", "themes": ["feedback-loops"]}
+
+    def test_threshold(self):
+        strict = classifier.TaxonomyClassifier(TAXONOMY, threshold=0.8)
+        assert strict.classify([capture("attention")]) == [{}]
+        assert strict.classify([capture("attention attention attention")]) == [
+            {"themes": ["attention"]}
+        ]
+
+    def test_keywords_extend_terms(self):
+        model = classifier.TaxonomyClassifier(
+            TAXONOMY, keywords={"scaffolding": ["support structure", "ramp"]}
+        )
+        assert model.classify([capture("a ramp")])[0]["themes"] == ["scaffolding"]
+        assert model.classify([capture("some support")]) == [{}]
+        assert model.classify([capture("a support structure")])[0]["themes"] == ["scaffolding"]
+
+    def test_limits(self):
+        model = classifier.TaxonomyClassifier(TAXONOMY, max_categories=1)
+        (tags,) = model.classify([capture("teaching research teaching")])
+        assert tags["categories"] == ["teaching"]
+
+    def test_empty_taxonomy(self):
+        model = classifier.TaxonomyClassifier({})
+        assert model.classify([capture("anything")]) == [{}]
+
+    @pytest.mark.skipif(not classifier.HAS_NUMPY, reason="NumPy not installed")
+    def test_numpy_matches_pure_python(self):
+        texts = [capture(t) for t in (
+            "metaphor metaphor scaffolding", "machine learning research example",
+            "nothing relevant here", "feedback feedback loops attention exercise",
+        )]
+        fast = classifier.TaxonomyClassifier(TAXONOMY, use_numpy=True).scores(texts)
+        slow = classifier.TaxonomyClassifier(TAXONOMY, use_numpy=False).scores(texts)
+        for a, b in zip(fast, slow):
+            assert a == pytest.approx(b, abs=1e-5)
+
+
+class TestFromConfig:
+    """Tests for building a classifier from config.yaml settings."""
+
+    def test_disabled(self):
+        assert classifier.from_config({"enabled": False}, TAXONOMY) is None
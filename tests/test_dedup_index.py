@@ -0,0 +1,186 @@
+"""
+Tests for the IdeaShelf duplicate index.
+
+Tests fingerprinting, exact and near-duplicate lookup, and the skip,
+link and merge actions applied by the inbox processor.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import dedup_index
+import process_inbox
+from conftest import make_capture, write_capture_to_inbox
+
+PASSAGE = (
+    "Scaffolding is a temporary structure that lets learners reach a level "
+    "they could not reach alone, and it is removed once the skill is secure "
+    "so the learner can stand on their own."
+)
+
+
+@pytest.fixture
+def config():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbox = os.path.join(tmpdir, "inbox")
+        os.makedirs(inbox)
+        yield {
+            "inbox_folder": inbox,
+            "output_folder": os.path.join(tmpdir, "ideas"),
+            "defaults": {"status": "raw"},
+            "dedup": {"enabled": True},
+        }
+
+
+def read_outputs(config):
+    outputs = {}
+    for name in sorted(os.listdir(config["output_folder"])):
+        with open(os.path.join(config["output_folder"], name), "r") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+class TestFingerprints:
+    """Tests for the hashing primitives."""
+
+    def test_exact_hash_ignores_case_and_whitespace(self):
+        assert dedup_index.content_hash("Hello   World\n") == dedup_index.content_hash("hello world")
+
+    def test_simhash_is_close_for_small_edits(self):
+        a = dedup_index.simhash(PASSAGE)
+        b = dedup_index.simhash(PASSAGE.replace("on their own.", "on their own two feet."))
+        c = dedup_index.simhash("A completely different note about sourdough starters, "
+                                "hydration ratios and long cold fermentation times.")
+        assert dedup_index.hamming(a, b) < dedup_index.hamming(a, c)
+
+    def test_short_text_has_no_simhash(self):
+        assert dedup_index.simhash("just three words") is None
+
+
+class TestDedupIndex:
+    """Tests for lookups against the persisted index."""
+
+    def test_find_exact_and_near(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dedup.sqlite3")
+            index = dedup_index.DedupIndex(path)
+            index.add("a", PASSAGE, "/ideas/a.md")
+            index.commit()
+
+            exact = index.find(PASSAGE.upper())
+            assert (exact.kind, exact.capture_id) == ("exact", "a")
+
+            edited = PASSAGE.replace("temporary", "provisional")
+            near = index.find(edited)
+            if near is not None:  # SimHash is probabilistic for one-word edits
+                assert near.kind == "near"
+                assert near.distance <= dedup_index.MAX_DISTANCE
+
+            assert index.find("Something else entirely, about sourdough, with "
+                              "hydration and long cold fermentation.") is None
+            index.close()
+
+    def test_index_persists_across_opens(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dedup.sqlite3")
+            index = dedup_index.DedupIndex(path)
+            index.add("a", PASSAGE, "/ideas/a.md")
+            index.close()
+
+            reopened = dedup_index.DedupIndex(path)
+            assert reopened.find(PASSAGE).path == "/ideas/a.md"
+            reopened.close()
+
+    def test_near_match_found_through_bands(self, monkeypatch):
+        value = dedup_index.simhash(PASSAGE)
+        # Flip bits in two different bands: only the other bands still agree
+        flipped = value ^ (1 << 3) ^ (1 << 40)
+        other = "A rephrased passage standing in for a near duplicate capture."
+        real_simhash = dedup_index.simhash
+        monkeypatch.setattr(
+            dedup_index, "simhash",
+            lambda content: flipped if content == other else real_simhash(content),
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = dedup_index.DedupIndex(os.path.join(tmpdir, "d.sqlite3"))
+            index.add("a", PASSAGE, "/ideas/a.md")
+
+            match = index.find(other)
+
+            assert (match.kind, match.capture_id, match.distance) == ("near", "a", 2)
+            index.close()
+
+
+class TestProcessorDedup:
+    """Tests for the actions taken during processing."""
+
+    def test_exact_duplicates_are_skipped_by_default(self, config):
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        write_capture_to_inbox(make_capture(id="b", content=PASSAGE + "  "), config["inbox_folder"])
+
+        processed, errors = process_inbox.process_inbox(config)
+
+        assert (processed, errors) == (2, 0)
+        assert len(read_outputs(config)) == 1
+        processed_dir = os.path.join(config["inbox_folder"], "processed")
+        assert sorted(os.listdir(processed_dir)) == ["a.json", "b.json"]
+
+    def test_duplicates_across_runs_are_detected(self, config):
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+        write_capture_to_inbox(make_capture(id="b", content=PASSAGE), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+
+        assert len(read_outputs(config)) == 1
+
+    def test_link_action_writes_duplicate_of(self, config):
+        config["dedup"]["exact"] = "link"
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        write_capture_to_inbox(make_capture(id="b", content=PASSAGE), config["inbox_folder"])
+
+        process_inbox.process_inbox(config)
+
+        outputs = read_outputs(config)
+        assert len(outputs) == 2
+        original, duplicate = sorted(outputs, key=len)
+        assert f"duplicate_of: {original}" in outputs[duplicate]
+
+    def test_merge_action_appends_to_original(self, config):
+        config["dedup"]["exact"] = "merge"
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        write_capture_to_inbox(
+            make_capture(id="b", content=PASSAGE, source_url="https://other.example/page",
+                         user_note="seen again"),
+            config["inbox_folder"],
+        )
+
+        process_inbox.process_inbox(config, workers=2)
+
+        (text,) = read_outputs(config).values()
+        assert "*Also captured 2026-02-27T14:30:00Z*" in text
+        assert "*Source: https://other.example/page*" in text
+        assert "*User note: seen again*" in text
+
+    def test_deleted_original_does_not_block_recapture(self, config):
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+        for name in os.listdir(config["output_folder"]):
+            os.remove(os.path.join(config["output_folder"], name))
+
+        write_capture_to_inbox(make_capture(id="b", content=PASSAGE), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+
+        assert len(read_outputs(config)) == 1
+
+    def test_disabled_by_default(self, config):
+        del config["dedup"]
+        write_capture_to_inbox(make_capture(id="a", content=PASSAGE), config["inbox_folder"])
+        write_capture_to_inbox(make_capture(id="b", content=PASSAGE), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+        assert len(read_outputs(config)) == 2
@@ -0,0 +1,99 @@
+"""
+Tests for IdeaShelf durable writes.
+
+Run with: python -m pytest tests/test_durable.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import durable
+
+
+class TestWriteAtomic:
+    """Tests for write-then-rename."""
+
+    def test_replaces_existing_file(self, tmp_path):
+        path = tmp_path / "idea.md"
+        path.write_text("old")
+        durable.write_atomic(str(path), "new")
+        assert path.read_text() == "new"
+        assert os.listdir(tmp_path) == ["idea.md"]
+
+    def test_failed_write_leaves_original_and_no_temp(self, tmp_path, monkeypatch):
+        path = tmp_path / "idea.md"
+        path.write_text("old")
+
+        def broken_replace(src, dst):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(durable.os, "replace", broken_replace)
+        with pytest.raises(OSError):
+            durable.write_atomic(str(path), "new")
+        assert path.read_text() == "old"
+        assert os.listdir(tmp_path) == ["idea.md"]
+
+
+class TestDurableWriter:
+    """Tests for the sync policies."""
+
+    def _count_fsyncs(self, monkeypatch):
+        calls = []
+        real = os.fsync
+        monkeypatch.setattr(durable.os, "fsync", lambda fd: calls.append(fd) or real(fd))
+        return calls
+
+    def test_none_never_syncs(self, tmp_path, monkeypatch):
+        calls = self._count_fsyncs(monkeypatch)
+        writer = durable.DurableWriter("none")
+        for i in range(3):
+            writer.write(str(tmp_path / f"{i}.md"), "x")
+        writer.sync()
+        assert calls == []
+        assert not writer.due()
+
+    def test_file_syncs_every_write(self, tmp_path, monkeypatch):
+        calls = self._count_fsyncs(monkeypatch)
+        writer = durable.DurableWriter("file")
+        for i in range(3):
+            writer.write(str(tmp_path / f"{i}.md"), "x")
+        # File and directory for each write
+        assert len(calls) == 6
+
+    def test_batch_syncs_once_per_group(self, tmp_path, monkeypatch):
+        calls = self._count_fsyncs(monkeypatch)
+        writer = durable.DurableWriter("batch", every_files=3, every_ms=60_000)
+        writer.write(str(tmp_path / "a.md"), "x")
+        writer.write(str(tmp_path / "b.md"), "x")
+        assert calls == []
+        assert not writer.due()
+
+        writer.write(str(tmp_path / "c.md"), "x")
+        assert writer.due()
+        writer.sync()
+        # Three files, one directory
+        assert len(calls) == 4
+        assert writer.syncs == 1
+        assert not writer.due()
+
+    def test_batch_is_due_after_delay(self, tmp_path):
+        writer = durable.DurableWriter("batch", every_files=100, every_ms=0)
+        writer.write(str(tmp_path / "a.md"), "x")
+        assert writer.due()
+
+    def test_batch_syncs_touched_directories(self, tmp_path, monkeypatch):
+        calls = self._count_fsyncs(monkeypatch)
+        writer = durable.DurableWriter("batch")
+        writer.touched(str(tmp_path))
+        assert calls == []
+        writer.sync()
+        assert len(calls) == 1
+
+    def test_rejects_unknown_mode(self):
+        with pytest.raises(ValueError):
+            durable.DurableWriter("sometimes")
@@ -0,0 +1,193 @@
+"""
+Tests for IdeaShelf enrichment and the stub tagger.
+
+Run with: python -m pytest tests/test_enrich.py -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import enrich
+import stub_tagger
+
+STUB = os.path.join(os.path.dirname(__file__), "..", "runtime", "stub_tagger.py")
+
+TAXONOMY = {
+    "types": ["metaphor", "exercise"],
+    "categories": ["machine-learning", "teaching"],
+    "themes": ["scaffolding"],
+}
+
+
+def capture(i, content="A metaphor about scaffolding in machine learning"):
+    return {"id": f"c{i}", "content": content}
+
+
+class FakeTagger:
+    """Records calls; fails the first `fail` of them."""
+
+    def __init__(self, delay=0.0, fail=0):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, request, timeout):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.fail:
+                raise enrich.TaggerError("model overloaded")
+            return json.dumps(stub_tagger.tag(json.loads(request))).encode()
+        finally:
+            self.active -= 1
+
+
+class TestAnnotations:
+    """Tests for turning tagger replies into frontmatter."""
+
+    def test_keeps_known_keys_and_cleans_values(self):
+        result = {"id": "a", "themes": ["one, two", "[x]"], "categories": "solo",
+                  "idea_type": "metaphor", "score": 0.9}
+        assert enrich.to_annotations(result) == {
+            "themes": ["one two", "x"], "categories": ["solo"], "idea_type": "metaphor",
+        }
+
+    def test_parse_response_accepts_bare_list(self):
+        assert enrich.parse_response(b'[{"id": "a"}]') == {"a": {"id": "a"}}
+
+    def test_parse_response_rejects_garbage(self):
+        with pytest.raises(enrich.TaggerError):
+            enrich.parse_response(b"not json")
+
+
+class TestEnricher:
+    """Tests for batching, concurrency, retries and timeouts."""
+
+    def test_batches_and_bounds_concurrency(self):
+        tagger = FakeTagger(delay=0.01)
+        enricher = enrich.Enricher(tagger, TAXONOMY, batch_size=3, concurrency=2)
+
+        tags = enricher.tag([capture(i) for i in range(10)])
+
+        assert tagger.calls == 4
+        assert tagger.peak == 2
+        assert tags[9] == {
+            "categories": ["machine-learning"], "themes": ["scaffolding"],
+            "idea_type": "metaphor",
+        }
+
+    def test_retries_then_succeeds(self):
+        tagger = FakeTagger(fail=2)
+        enricher = enrich.Enricher(tagger, TAXONOMY, retries=2, backoff=0)
+        assert enricher.tag([capture(1)])[0]["themes"] == ["scaffolding"]
+        assert enricher.failures == 0
+
+    def test_gives_up_without_failing_captures(self):
+        tagger = FakeTagger(fail=10)
+        enricher = enrich.Enricher(tagger, TAXONOMY, retries=1, backoff=0)
+        assert enricher.tag([capture(1), capture(2)]) == [{}, {}]
+        assert enricher.failures == 2
+        assert tagger.calls == 2
+
+
+class TestCommandTagger:
+    """Tests for running the tagger as a command."""
+
+    def test_stub_tagger_command(self):
+        enricher = enrich.from_config(
+            {"enabled": True, "command": [sys.executable, STUB], "batch_size": 2,
+             "concurrency": 2, "timeout": 30, "retries": 0, "backoff": 0},
+            taxonomy=TAXONOMY,
+        )
+        tags = enricher.tag([capture(1), capture(2, "An exercise for teaching"), capture(3)])
+        assert tags[1] == {"categories": ["teaching"], "idea_type": "exercise"}
+
+    def test_timeout_kills_slow_tagger(self):
+        enricher = enrich.Enricher(
+            enrich.CommandTagger([sys.executable, STUB, "--delay", "5"]),
+            TAXONOMY, timeout=0.5, retries=0,
+        )
+        assert enricher.tag([capture(1)]) == [{}]
+        assert enricher.failures == 1
+
+    def test_missing_command_is_a_tagger_error(self):
+        enricher = enrich.Enricher(enrich.CommandTagger(["/nonexistent/tagger"]), retries=0)
+        assert enricher.tag([capture(1)]) == [{}]
+
+    def test_from_config_disabled(self):
+        assert enrich.from_config({"enabled": False}) is None
+
+
+class TestHttpTagger:
+    """Tests for POSTing to a tagger endpoint."""
+
+    def test_stub_tagger_server(self):
+        server = stub_tagger.make_server(0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            enricher = enrich.Enricher(
+                enrich.HttpTagger(f"http://127.0.0.1:{server.server_port}/tag"),
+                TAXONOMY, retries=0,
+            )
+            assert enricher.tag([capture(1)])[0]["themes"] == ["scaffolding"]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_unreachable_endpoint_is_a_tagger_error(self):
+        enricher = enrich.Enricher(
+            enrich.HttpTagger("http://127.0.0.1:9/tag"), timeout=2, retries=0
+        )
+        assert enricher.tag([capture(1)]) == [{}]
+
+
+class TestCachedEnricher:
+    """Tests for answering from the enrichment cache."""
+
+    def _enricher(self, tmp_path, tagger, version="v1"):
+        import enrich_cache
+
+        cache = enrich_cache.EnrichCache(str(tmp_path / "cache.sqlite3"))
+        return enrich.Enricher(tagger, TAXONOMY, batch_size=4, retries=0,
+                               cache=cache, version=version)
+
+    def test_second_run_makes_no_calls(self, tmp_path):
+        tagger = FakeTagger()
+        first = self._enricher(tmp_path, tagger).tag([capture(i, f"metaphor {i}") for i in range(8)])
+        calls = tagger.calls
+
+        again = self._enricher(tmp_path, tagger)
+        assert again.tag([capture(i + 100, f"metaphor {i}") for i in range(8)]) == first
+        assert tagger.calls == calls
+        assert again.cache.hits == 8
+
+    def test_identical_content_is_sent_once(self, tmp_path):
+        tagger = FakeTagger()
+        enricher = self._enricher(tmp_path, tagger)
+        tags = enricher.tag([capture(i) for i in range(6)])
+        assert tagger.calls == 1
+        assert len({str(t) for t in tags}) == 1
+
+    def test_new_version_misses(self, tmp_path):
+        tagger = FakeTagger()
+        self._enricher(tmp_path, tagger).tag([capture(1)])
+        self._enricher(tmp_path, tagger, version="v2").tag([capture(1)])
+        assert tagger.calls == 2
+
+    def test_failures_are_not_cached(self, tmp_path):
+        tagger = FakeTagger(fail=1)
+        assert self._enricher(tmp_path, tagger).tag([capture(1)]) == [{}]
+        assert self._enricher(tmp_path, tagger).tag([capture(1)])[0]["themes"] == ["scaffolding"]
@@ -0,0 +1,120 @@
+"""
+Tests for the IdeaShelf enrichment cache.
+
+Run with: python -m pytest tests/test_enrich_cache.py -v
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import enrich_cache
+
+
+def key(n):
+    return enrich_cache.cache_key({"content": f"capture {n}"}, {}, "v1")
+
+
+class TestCacheKey:
+    """Tests for what the key depends on."""
+
+    def test_depends_on_content_taxonomy_and_version(self):
+        item = {"content": "same"}
+        base = enrich_cache.cache_key(item, {"themes": ["a"]}, "v1")
+        assert base == enrich_cache.cache_key(dict(item), {"themes": ["a"]}, "v1")
+        assert base != enrich_cache.cache_key({"content": "other"}, {"themes": ["a"]}, "v1")
+        assert base != enrich_cache.cache_key(item, {"themes": ["b"]}, "v1")
+        assert base != enrich_cache.cache_key(item, {"themes": ["a"]}, "v2")
+
+
+class TestEnrichCache:
+    """Tests for storage, stats and eviction."""
+
+    def test_round_trip_and_counters(self, tmp_path):
+        cache = enrich_cache.EnrichCache(str(tmp_path / "cache.sqlite3"))
+        cache.put_many({key(1): {"themes": ["x"]}})
+
+        assert cache.get_many([key(1), key(2)]) == {key(1): {"themes": ["x"]}}
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.count() == 1
+        cache.close()
+
+    def test_survives_reopen(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite3")
+        cache = enrich_cache.EnrichCache(path)
+        cache.put_many({key(1): {}})
+        cache.close()
+
+        cache = enrich_cache.EnrichCache(path)
+        assert key(1) in cache.get_many([key(1)])
+        cache.close()
+
+    def test_evicts_least_recently_used_entries(self, tmp_path):
+        cache = enrich_cache.EnrichCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+        cache.put_many({key(1): {}})
+        time.sleep(0.01)
+        cache.put_many({key(2): {}})
+        time.sleep(0.01)
+        cache.get_many([key(1)])  # Now more recent than key(2)
+        time.sleep(0.01)
+        cache.put_many({key(3): {}})
+
+        assert set(cache.get_many([key(1), key(2), key(3)])) == {key(1), key(3)}
+        cache.close()
+
+    def test_evicts_by_size(self, tmp_path):
+        cache = enrich_cache.EnrichCache(
+            str(tmp_path / "cache.sqlite3"), max_entries=None, max_bytes=250
+        )
+        for n in range(5):
+            cache.put_many({key(n): {"themes": ["t" * 80]}})
+            time.sleep(0.01)
+
+        assert cache.size() <= 250
+        assert set(cache.get_many([key(n) for n in range(5)])) == {key(3), key(4)}
+        cache.close()
+
+    def test_eviction_does_not_count_the_table(self, tmp_path, monkeypatch):
+        cache = enrich_cache.EnrichCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+        monkeypatch.setattr(cache, "count", lambda: pytest.fail("count() on write"))
+        for n in range(6):
+            cache.put_many({key(n): {"themes": ["x"]}})
+            time.sleep(0.01)
+        cache.put_many({key(5): {"themes": ["y"]}})  # Replacing is not growth
+
+        assert set(cache.get_many([key(n) for n in range(6)])) == {key(3), key(4), key(5)}
+        monkeypatch.undo()
+        assert cache.count() == 3
+        cache.close()
+
+    def test_empty_answers_expire(self, tmp_path):
+        cache = enrich_cache.EnrichCache(str(tmp_path / "cache.sqlite3"), empty_ttl=-1)
+        cache.put_many({key(1): {}, key(2): {"themes": ["x"]}})
+
+        assert cache.get_many([key(1), key(2)]) == {key(2): {"themes": ["x"]}}
+        cache.close()
+
+    def test_old_cache_gets_expiring_empty_answers(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO answers VALUES (?, ?, ?, ?)",
+            [(key(1), "{}", 2, 0), (key(2), '{"themes":["x"]}', 16, 0)],
+        )
+        conn.commit()
+        conn.close()
+
+        cache = enrich_cache.EnrichCache(path, empty_ttl=-1)
+        assert set(cache.get_many([key(1), key(2)])) == {key(2)}
+        assert cache.count() == 2
+        cache.close()
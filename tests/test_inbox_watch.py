@@ -0,0 +1,175 @@
+"""
+Tests for the IdeaShelf inbox watcher (watch daemon mode).
+
+Tests the watcher backends and the end-to-end daemon loop: new captures
+are picked up without a rescan, bursts are batched, and failures retry.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import inbox_watch
+from conftest import make_capture, write_capture_to_inbox
+
+
+def count_files(path):
+    return len(os.listdir(path)) if os.path.isdir(path) else 0
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watcher_factory(request, monkeypatch):
+    if request.param == "inotify":
+        if not sys.platform.startswith("linux"):
+            pytest.skip("inotify is Linux-only")
+    else:
+        monkeypatch.setattr(
+            inbox_watch, "InotifyWatcher",
+            lambda path, subdirs=(): (_ for _ in ()).throw(OSError("disabled")),
+        )
+    return request.param
+
+
+class TestWatchers:
+    """Tests for the event sources."""
+
+    def test_open_watcher_reports_new_names(self, watcher_factory):
+        with tempfile.TemporaryDirectory() as inbox:
+            watcher = inbox_watch.open_watcher(inbox, poll_interval=0.01)
+            try:
+                write_capture_to_inbox(make_capture(id="abc"), inbox)
+                names = set()
+                assert wait_for(lambda: names.update(watcher.wait(0.1)) or "abc.json" in names)
+            finally:
+                watcher.close()
+
+    def test_polling_watcher_ignores_existing_files(self):
+        with tempfile.TemporaryDirectory() as inbox:
+            write_capture_to_inbox(make_capture(id="old"), inbox)
+            watcher = inbox_watch.PollingWatcher(inbox, interval=0.01)
+            assert watcher.wait(0.05) == set()
+            write_capture_to_inbox(make_capture(id="new"), inbox)
+            assert watcher.wait(1.0) == {"new.json"}
+
+
+class TestWatchInbox:
+    """Tests for the daemon loop."""
+
+    def _start(self, tmpdir, config=None, **kwargs):
+        inbox = os.path.join(tmpdir, "inbox")
+        output = os.path.join(tmpdir, "ideas")
+        os.makedirs(inbox)
+        config = dict(
+            config or {},
+            inbox_folder=inbox,
+            output_folder=output,
+            defaults={"status": "raw"},
+        )
+        stop = threading.Event()
+        batches = []
+        thread = threading.Thread(
+            target=inbox_watch.watch_inbox,
+            args=(config,),
+            kwargs=dict(stop_event=stop, poll_interval=0.02,
+                        on_batch=lambda p, e: batches.append((p, e)), **kwargs),
+        )
+        return inbox, output, stop, batches, thread
+
+    def test_existing_and_new_captures_are_processed(self, watcher_factory):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, stop, batches, thread = self._start(tmpdir)
+            write_capture_to_inbox(make_capture(content="Before start"), inbox)
+            thread.start()
+            try:
+                assert wait_for(lambda: count_files(output) == 1)
+
+                started = time.monotonic()
+                write_capture_to_inbox(make_capture(content="After start"), inbox)
+                assert wait_for(lambda: count_files(output) == 2)
+                assert time.monotonic() - started < 1.0
+            finally:
+                stop.set()
+                thread.join(5)
+
+            assert not [f for f in os.listdir(inbox) if f.endswith(".json")]
+
+    def test_burst_is_processed_in_few_batches(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, stop, batches, thread = self._start(
+                tmpdir, debounce=0.2, max_delay=1.0
+            )
+            thread.start()
+            try:
+                for i in range(20):
+                    write_capture_to_inbox(make_capture(content=f"Burst {i}"), inbox)
+                assert wait_for(lambda: count_files(output) == 20)
+            finally:
+                stop.set()
+                thread.join(5)
+
+            assert sum(p for p, _ in batches) == 20
+            assert len(batches) < 20
+
+    def test_failed_capture_is_retried_then_given_up(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, stop, batches, thread = self._start(tmpdir)
+            thread.start()
+            try:
+                with open(os.path.join(inbox, "broken.json"), "w") as f:
+                    f.write("{not json")
+                assert wait_for(
+                    lambda: sum(e for _, e in batches) == inbox_watch.MAX_ATTEMPTS
+                )
+                time.sleep(0.1)
+            finally:
+                stop.set()
+                thread.join(5)
+
+            assert sum(e for _, e in batches) == inbox_watch.MAX_ATTEMPTS
+
+    def test_files_inbox_gets_no_log_directory(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, stop, batches, thread = self._start(tmpdir)
+            thread.start()
+            try:
+                write_capture_to_inbox(make_capture(), inbox)
+                assert wait_for(lambda: count_files(output) == 1)
+            finally:
+                stop.set()
+                thread.join(5)
+
+            assert not os.path.exists(os.path.join(inbox, "log"))
+
+    def test_periodic_rescan_recovers_expired_claims(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, stop, batches, thread = self._start(
+                tmpdir, config={"claims": {"lease_seconds": -1}}, rescan_interval=0.1
+            )
+            thread.start()
+            try:
+                # Wait for the initial drain
+                assert wait_for(lambda: os.path.isdir(os.path.join(inbox, "processed")))
+                # A worker on another machine claims a capture, then dies
+                capture = make_capture()
+                os.makedirs(os.path.join(inbox, ".claims", "otherhost-1-a"))
+                write_capture_to_inbox(capture, os.path.join(inbox, ".claims", "otherhost-1-a"))
+                assert wait_for(lambda: count_files(output) == 1)
+            finally:
+                stop.set()
+                thread.join(5)
@@ -0,0 +1,197 @@
+"""
+Tests for the IdeaShelf processing journal.
+
+Tests intent/completion bookkeeping, adoption of crashed runs' journals,
+and that a capture interrupted after its idea was written is not
+duplicated when it is processed again.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import journal
+import process_inbox
+from conftest import make_capture, write_capture_to_inbox
+
+
+class TestJournal:
+    def test_done_clears_intents_and_close_removes_file(self, tmp_path):
+        j = journal.Journal(str(tmp_path), owner="host-1-a")
+        j.intend([("c1", "/ideas/a.md", "c1.json"), ("c2", "/ideas/b.md", "c2.json")])
+        assert j.resume("c1") == "/ideas/a.md"
+        j.done(["c1"])
+        assert j.resume("c1") is None
+        assert journal.read_entries(j.path) == {"c2": ("/ideas/b.md", "c2.json")}
+        j.done(["c2", "unknown"])
+        j.close()
+        assert os.listdir(tmp_path) == []
+
+    def test_unfinished_journal_is_kept_and_adopted(self, tmp_path):
+        crashed = journal.Journal(str(tmp_path), owner="otherhost-1-a")
+        crashed.intend([("c1", "/ideas/a.md", "c1.json")])
+        crashed.close()
+        assert os.listdir(tmp_path) == ["otherhost-1-a.jsonl"]
+
+        alive = journal.Journal(str(tmp_path), owner="thishost-2-b", lease_seconds=3600)
+        assert alive.recover() == 0  # Its owner may still be running
+
+        rescuer = journal.Journal(str(tmp_path), owner="thishost-3-c", lease_seconds=-1)
+        assert rescuer.recover() == 1
+        assert rescuer.resume("c1") == "/ideas/a.md"
+        assert os.listdir(tmp_path) == ["thishost-3-c.jsonl"]
+
+    def test_idle_journal_of_live_local_process_is_kept(self, tmp_path):
+        owner = journal.claims.make_owner()  # This process, which is alive
+        idle = journal.Journal(str(tmp_path), owner=owner)
+        idle.intend([("c1", "/ideas/a.md", "c1.json")])
+        os.utime(idle.path, (0, 0))  # Not written for decades
+
+        host = owner.rsplit("-", 2)[0]
+        other = journal.Journal(str(tmp_path), owner=f"{host}-1-b", lease_seconds=60)
+        assert other.recover() == 0
+        assert os.path.exists(idle.path)
+        idle.done(["c1"])
+        idle.close()
+
+    def test_torn_last_line_is_ignored(self, tmp_path):
+        path = tmp_path / "host-1-a.jsonl"
+        path.write_text(
+            json.dumps({"op": "intent", "id": "c1", "path": "/a.md", "source": "c1.json"})
+            + '\n{"op": "done", "id": "c'
+        )
+        assert journal.read_entries(str(path)) == {"c1": ("/a.md", "c1.json")}
+
+    def test_settle_drops_intents_whose_source_is_gone(self, tmp_path):
+        j = journal.Journal(str(tmp_path), owner="host-1-a")
+        j.intend([("c1", "/a.md", "c1.json"), ("c2", "/b.md", "c2.json")])
+        assert j.settle(lambda source: source == "c2.json") == ["/a.md"]
+        assert list(j.pending) == ["c2"]
+
+    def test_truncates_when_idle_and_large(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(journal, "COMPACT_BYTES", 100)
+        j = journal.Journal(str(tmp_path), owner="host-1-a")
+        for n in range(5):
+            j.intend([(f"c{n}", "/ideas/a.md", "c.json")])
+            j.done([f"c{n}"])
+        assert os.path.getsize(j.path) < 100
+        j.close()
+
+
+class Crash(BaseException):
+    """Stands in for the process dying."""
+
+
+def make_config(tmpdir):
+    inbox = os.path.join(tmpdir, "inbox")
+    os.makedirs(inbox)
+    return {
+        "inbox_folder": inbox,
+        "output_folder": os.path.join(tmpdir, "ideas"),
+        "state_folder": os.path.join(tmpdir, "state"),
+        # The crashed run is this same process, so only expiry frees it
+        "claims": {"lease_seconds": -1},
+    }
+
+
+def write_capture(config, **fields):
+    fields = dict({"source_title": "Crash Test", "content": "Written but never retired"},
+                  **fields)
+    capture = make_capture(**fields)
+    write_capture_to_inbox(capture, config["inbox_folder"])
+    return capture
+
+
+class TestCrashRecovery:
+    def _crash_before_retire(self, config, monkeypatch):
+        def crash(self):
+            raise Crash()
+
+        with monkeypatch.context() as m:
+            m.setattr(process_inbox.InboxFile, "finish", crash)
+            with pytest.raises(Crash):
+                process_inbox.process_inbox(config)
+
+    def test_rerun_overwrites_instead_of_duplicating(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_config(tmpdir)
+            capture = write_capture(config)
+            self._crash_before_retire(config, monkeypatch)
+            (name,) = os.listdir(config["output_folder"])
+            journal_dir = os.path.join(config["state_folder"], "journal")
+            assert len(os.listdir(journal_dir)) == 1
+
+            assert process_inbox.process_inbox(config) == (1, 0)
+            assert os.listdir(config["output_folder"]) == [name]
+            assert os.listdir(os.path.join(config["inbox_folder"], "processed")) == [
+                f"{capture['id']}.json"
+            ]
+            assert os.listdir(journal_dir) == []
+
+    def test_crash_while_tagging_leaves_no_extra_file(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_config(tmpdir)
+            write_capture(config)
+
+            def crash(self, jobs):
+                raise Crash()
+
+            with monkeypatch.context() as m:
+                m.setattr(process_inbox.Session, "enrich", crash)
+                with pytest.raises(Crash):
+                    process_inbox.process_inbox(config)
+            (placeholder,) = os.listdir(config["output_folder"])
+
+            assert process_inbox.process_inbox(config) == (1, 0)
+            assert os.listdir(config["output_folder"]) == [placeholder]
+            path = os.path.join(config["output_folder"], placeholder)
+            assert os.path.getsize(path) > 0
+
+    def test_placeholder_of_retired_source_is_removed(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_config(tmpdir)
+            write_capture(config)
+
+            def crash(self, jobs):
+                raise Crash()
+
+            with monkeypatch.context() as m:
+                m.setattr(process_inbox.Session, "enrich", crash)
+                with pytest.raises(Crash):
+                    process_inbox.process_inbox(config)
+            claims_dir = os.path.join(config["inbox_folder"], ".claims")
+            for owner in os.listdir(claims_dir):
+                for name in os.listdir(os.path.join(claims_dir, owner)):
+                    os.remove(os.path.join(claims_dir, owner, name))
+
+            assert process_inbox.process_inbox(config) == (0, 0)
+            assert os.listdir(config["output_folder"]) == []
+
+    def test_rerun_with_dedup_does_not_skip_own_idea(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_config(tmpdir)
+            config["dedup"] = {"enabled": True}
+            write_capture(config)
+            self._crash_before_retire(config, monkeypatch)
+            assert process_inbox.process_inbox(config) == (1, 0)
+            assert len(os.listdir(config["output_folder"])) == 1
+
+    def test_intent_for_retired_source_is_settled(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_config(tmpdir)
+            write_capture(config)
+            self._crash_before_retire(config, monkeypatch)
+            # The source goes away some other way (for example, deleted)
+            claims_dir = os.path.join(config["inbox_folder"], ".claims")
+            for owner in os.listdir(claims_dir):
+                for name in os.listdir(os.path.join(claims_dir, owner)):
+                    os.remove(os.path.join(claims_dir, owner, name))
+
+            assert process_inbox.process_inbox(config) == (0, 0)
+            assert os.listdir(os.path.join(config["state_folder"], "journal")) == []
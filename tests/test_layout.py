@@ -0,0 +1,161 @@
+"""
+Tests for IdeaShelf output layouts and layout migration.
+
+Run with: python -m pytest tests/test_layout.py -v
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import layout
+
+
+class RecordingIndex:
+    def __init__(self):
+        self.renamed = []
+
+    def rename_paths(self, pairs):
+        self.renamed.extend(pairs)
+
+
+def make_flat(output, names):
+    os.makedirs(output, exist_ok=True)
+    for name in names:
+        with open(os.path.join(output, name), "w") as f:
+            f.write(f"# {name}\n")
+
+
+class TestOutputSubdir:
+    """Tests for mapping file names to folders."""
+
+    def test_date_layout_uses_name_prefix(self):
+        assert layout.output_subdir("260227_idea.md", "date") == os.path.join("2026", "02")
+
+    def test_date_layout_without_prefix(self):
+        assert layout.output_subdir("notes.md", "date") == layout.UNDATED
+
+    def test_hash_layout_is_stable_two_hex_digits(self):
+        subdir = layout.output_subdir("260227_idea.md", "hash")
+        assert len(subdir) == 2
+        assert int(subdir, 16) >= 0
+        assert subdir == layout.output_subdir("260227_idea.md", "hash")
+
+    def test_flat_layout(self):
+        assert layout.output_subdir("260227_idea.md", "flat") == ""
+
+    def test_unknown_layout_raises(self):
+        with pytest.raises(ValueError):
+            layout.output_subdir("260227_idea.md", "weekly")
+
+
+class TestMigrate:
+    """Tests for moving an existing output folder."""
+
+    def test_moves_flat_folder_into_date_layout(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md", "251103_b.md", "notes.txt"])
+        index = RecordingIndex()
+
+        moved = layout.migrate(output, "date", str(tmp_path), indexes=[index], batch_size=1)
+
+        assert moved == 2
+        assert os.path.exists(os.path.join(output, "2026", "02", "260227_a.md"))
+        assert os.path.exists(os.path.join(output, "2025", "11", "251103_b.md"))
+        assert os.path.exists(os.path.join(output, "notes.txt"))
+        assert len(index.renamed) == 2
+        assert not os.path.exists(tmp_path / layout.JOURNAL_NAME)
+
+    def test_rerun_moves_nothing(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md", "260228_b.md"])
+        layout.migrate(output, "hash", str(tmp_path))
+        assert layout.migrate(output, "hash", str(tmp_path)) == 0
+
+    def test_limit_stops_early_and_rerun_continues(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, [f"2602{day:02d}_idea.md" for day in range(1, 11)])
+
+        assert layout.migrate(output, "date", str(tmp_path), batch_size=3, limit=4) == 4
+        assert layout.migrate(output, "date", str(tmp_path), batch_size=3) == 6
+        assert sorted(os.listdir(output)) == ["2026"]
+
+    def test_back_to_flat_removes_emptied_folders(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md", "251103_b.md"])
+        layout.migrate(output, "date", str(tmp_path))
+
+        assert layout.migrate(output, "flat", str(tmp_path)) == 2
+        assert sorted(os.listdir(output)) == ["251103_b.md", "260227_a.md"]
+
+    def test_name_collision_gets_the_id_suffix(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md", "260227_b.md"])
+        make_flat(os.path.join(output, "2026", "02"), ["260227_a.md", "260227_b.md"])
+
+        layout.migrate(output, "date", str(tmp_path),
+                       capture_ids={os.path.join(output, "260227_a.md"): "1234567890ab"})
+
+        assert sorted(os.listdir(os.path.join(output, "2026", "02"))) == [
+            "260227_a.md", "260227_a_12345678.md", "260227_b.md", "260227_b_dup.md",
+        ]
+
+    def test_links_to_moved_ideas_are_rewritten(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        os.makedirs(output)
+        notes = {
+            "260227_a.md": "---\nsummary: a\n---\n\n# A\n\nrelated: 251103_b.md stays in the body\n",
+            "251103_b.md": "---\nduplicate_of: 260227_a.md\nrelated: [260227_a.md, gone.md]\n---\n",
+        }
+        for name, text in notes.items():
+            with open(os.path.join(output, name), "w") as f:
+                f.write(text)
+        relinked = []
+
+        layout.migrate(output, "date", str(tmp_path), batch_size=1,
+                       relinked=lambda path, moved, old, new: relinked.append(path))
+
+        with open(os.path.join(output, "2025", "11", "251103_b.md")) as f:
+            assert f.read() == (
+                "---\nduplicate_of: 2026/02/260227_a.md\n"
+                "related: [2026/02/260227_a.md, gone.md]\n---\n"
+            )
+        with open(os.path.join(output, "2026", "02", "260227_a.md")) as f:
+            assert f.read() == notes["260227_a.md"]  # Only frontmatter is touched
+        assert relinked == [os.path.join(output, "2025", "11", "251103_b.md")]
+
+    def test_interrupted_batch_is_replayed(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md", "260228_b.md"])
+        old = os.path.join(output, "260227_a.md")
+        new = os.path.join(output, "2026", "02", "260227_a.md")
+        # Crash after moving the first file but before updating the index
+        os.makedirs(os.path.dirname(new))
+        os.rename(old, new)
+        with open(tmp_path / layout.JOURNAL_NAME, "w") as f:
+            json.dump({"layout": "date", "moves": [[old, new]]}, f)
+        index = RecordingIndex()
+
+        moved = layout.migrate(output, "date", str(tmp_path), indexes=[index])
+
+        assert moved == 2
+        assert (old, new) in index.renamed
+        assert sorted(os.listdir(os.path.join(output, "2026", "02"))) == [
+            "260227_a.md", "260228_b.md",
+        ]
+        assert not os.path.exists(tmp_path / layout.JOURNAL_NAME)
+
+    def test_skips_placeholders_and_hidden_folders(self, tmp_path):
+        output = str(tmp_path / "ideas")
+        make_flat(output, ["260227_a.md"])
+        open(os.path.join(output, "260228_pending.md"), "w").close()
+        make_flat(os.path.join(output, ".trash"), ["260101_old.md"])
+
+        assert layout.migrate(output, "date", str(tmp_path)) == 1
+        assert os.path.exists(os.path.join(output, "260228_pending.md"))
+        assert os.path.exists(os.path.join(output, ".trash", "260101_old.md"))
@@ -0,0 +1,58 @@
+"""
+Tests for IdeaShelf processor metrics.
+
+Run with: python -m pytest tests/test_metrics.py -v
+"""
+
+import json
+import os
+import sys
+
+# Add runtime to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import metrics
+
+
+class TestMetrics:
+    """Tests for timers, counters and output formats."""
+
+    def test_disabled_config_gives_null_metrics(self):
+        sink = metrics.from_config({"enabled": False})
+        assert isinstance(sink, metrics.NullMetrics)
+        with sink.timer("parse"):
+            pass
+        sink.count("errors")
+        sink.emit()
+
+    def test_timers_and_counters_accumulate(self):
+        m = metrics.Metrics()
+        for _ in range(3):
+            with m.timer("parse"):
+                pass
+        m.count("input_bytes", 100)
+        m.count("input_bytes", 50)
+        m.gauge("queue_depth", 7)
+
+        snapshot = m.snapshot()
+        assert snapshot["stages"]["parse"]["count"] == 3
+        assert snapshot["counters"]["input_bytes"] == 150
+        assert snapshot["gauges"]["queue_depth"] == 7
+
+    def test_emit_writes_jsonl_and_prometheus(self, tmp_path):
+        jsonl = tmp_path / "metrics.jsonl"
+        prom = tmp_path / "ideashelf.prom"
+        m = metrics.from_config({"enabled": True, "jsonl": str(jsonl), "prometheus": str(prom)})
+        m.add_time("write", 0.25)
+        m.count("errors", 2)
+        m.emit()
+        m.emit()
+
+        lines = jsonl.read_text().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[-1])["stages"]["write"]["seconds"] == 0.25
+
+        text = prom.read_text()
+        assert 'ideashelf_processor_stage_seconds_total{stage="write"} 0.25' in text
+        assert "ideashelf_processor_errors_total 2" in text
+        assert sorted(os.listdir(tmp_path)) == ["ideashelf.prom", "metrics.jsonl"]
@@ -5,6 +5,7 @@ Tests the core logic of ideashelf_host.py: payload validation,
 inbox creation, file writing, and error handling.
 """
 
+import io
 import json
 import os
 import struct
@@ -12,6 +13,7 @@ import sys
 import tempfile
 import threading
 import uuid
+import zlib
 
 import pytest
 
@@ -40,6 +42,11 @@ def make_payload(**overrides):
     return payload
 
 
+def inbox_files(inbox):
+    """Inbox entries other than the host's seen-id index."""
+    return [name for name in os.listdir(inbox) if name != ideashelf_host.SEEN_NAME]
+
+
 class TestValidatePayload:
     """Tests for payload validation."""
 
@@ -215,3 +222,598 @@ class TestWriteCapture:
 
         valid, err = ideashelf_host.validate_payload(42)
         assert valid is False
+
+
+def frame(obj):
+    """Encode an object using the native messaging framing."""
+    encoded = json.dumps(obj).encode("utf-8")
+    return struct.pack("<I", len(encoded)) + encoded
+
+
+def unframe_all(data):
+    """Decode every framed response in a byte string."""
+    messages = []
+    while data:
+        length = struct.unpack("<I", data[:4])[0]
+        messages.append(json.loads(data[4:4 + length].decode("utf-8")))
+        data = data[4 + length:]
+    return messages
+
+
+class TestPersistentMode:
+    """Tests for the long-lived multi-message loop."""
+
+    def test_serve_handles_many_messages_until_eof(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payloads = [make_payload() for _ in range(3)]
+            stdin = io.BytesIO(b"".join(frame(p) for p in payloads))
+            stdout = io.BytesIO()
+
+            handled = ideashelf_host.serve(stdin, stdout, idle_timeout=None)
+
+            assert handled == 3
+            responses = unframe_all(stdout.getvalue())
+            assert [r["id"] for r in responses] == [p["id"] for p in payloads]
+            assert all(r["success"] for r in responses)
+            assert len(inbox_files(inbox)) == 3
+
+    def test_invalid_message_does_not_end_session(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            bad = b"{not json"
+            good = make_payload()
+            stdin = io.BytesIO(
+                struct.pack("<I", len(bad)) + bad
+                + frame(make_payload(content=" "))
+                + frame(good)
+            )
+            stdout = io.BytesIO()
+
+            ideashelf_host.serve(stdin, stdout, idle_timeout=None)
+
+            responses = unframe_all(stdout.getvalue())
+            assert len(responses) == 3
+            assert responses[0]["success"] is False
+            assert "Invalid JSON" in responses[0]["error"]
+            assert responses[1]["success"] is False
+            assert responses[2]["success"] is True
+            assert responses[2]["id"] == good["id"]
+
+    def test_oversized_message_is_skipped_without_losing_framing(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            monkeypatch.setattr(ideashelf_host, "MAX_MESSAGE_BYTES", 512)
+            big = make_payload(content="x" * 1000)
+            small = make_payload(id="s", content="ok")
+            stdin = io.BytesIO(frame(big) + frame(small))
+            stdout = io.BytesIO()
+
+            ideashelf_host.serve(stdin, stdout, idle_timeout=None)
+
+            responses = unframe_all(stdout.getvalue())
+            assert responses[0]["success"] is False
+            assert "too large" in responses[0]["error"]
+            assert responses[1] == {"success": True, "id": "s",
+                                    "path": os.path.join(inbox, "s.json")}
+
+    def test_idle_timeout_ends_session(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            read_fd, write_fd = os.pipe()
+            stdin = os.fdopen(read_fd, "rb", buffering=0)
+            stdout = io.BytesIO()
+            try:
+                os.write(write_fd, frame(make_payload()))
+                # Write end stays open: only the idle timeout can stop serve()
+                handled = ideashelf_host.serve(stdin, stdout, idle_timeout=0.2)
+            finally:
+                os.close(write_fd)
+                stdin.close()
+
+            assert handled == 1
+            assert unframe_all(stdout.getvalue())[0]["success"] is True
+
+    def test_run_once_reads_a_single_message(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            stdin = io.BytesIO(frame(make_payload()) + frame(make_payload()))
+            stdout = io.BytesIO()
+
+            ideashelf_host.run_once(stdin, stdout)
+
+            assert len(unframe_all(stdout.getvalue())) == 1
+            assert len(inbox_files(inbox)) == 1
+
+    def test_run_once_reports_empty_input(self):
+        stdout = io.BytesIO()
+        ideashelf_host.run_once(io.BytesIO(b""), stdout)
+        assert unframe_all(stdout.getvalue()) == [
+            {"success": False, "error": "No message received"}
+        ]
+
+    def test_handle_message_echoes_id_on_failure(self):
+        payload = make_payload(content="")
+        response = ideashelf_host.handle_message(payload)
+        assert response["success"] is False
+        assert response["id"] == payload["id"]
+
+
+class TestCaptureLog:
+    """Tests for the append-only segmented inbox backend."""
+
+    def _records(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        records = []
+        pos = 0
+        while pos < len(data):
+            length, crc, flags = ideashelf_host.RECORD_HEADER.unpack_from(data, pos)
+            pos += ideashelf_host.RECORD_HEADER.size
+            payload = data[pos:pos + length]
+            assert zlib.crc32(payload) == crc
+            assert flags == 0
+            records.append(json.loads(payload.decode("utf-8")))
+            pos += length
+        return records
+
+    def test_append_writes_length_prefixed_records(self):
+        with tempfile.TemporaryDirectory() as inbox:
+            payloads = [make_payload() for _ in range(3)]
+            for payload in payloads:
+                ok, err, path = ideashelf_host.append_capture(payload, inbox)
+                assert ok is True, err
+
+            assert os.path.dirname(path) == os.path.join(inbox, "log")
+            assert self._records(path) == payloads
+            # No per-capture files in the inbox itself
+            assert sorted(os.listdir(inbox)) == ["log"]
+
+    def test_segments_rotate_when_full(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "SEGMENT_MAX_BYTES", 1024)
+        with tempfile.TemporaryDirectory() as inbox:
+            payloads = [make_payload(content="x" * 300) for _ in range(6)]
+            for payload in payloads:
+                ideashelf_host.append_capture(payload, inbox)
+
+            log_dir = os.path.join(inbox, "log")
+            segments = sorted(
+                n for n in os.listdir(log_dir) if n.endswith(".seg")
+            )
+            assert len(segments) > 1
+            assert segments[0] == "000000000001.seg"
+            replayed = []
+            for name in segments:
+                path = os.path.join(log_dir, name)
+                assert os.path.getsize(path) <= 1024
+                replayed.extend(self._records(path))
+            assert replayed == payloads
+
+    def test_concurrent_appends_do_not_interleave(self):
+        with tempfile.TemporaryDirectory() as inbox:
+            payloads = [make_payload(content="y" * 5000) for _ in range(20)]
+            threads = [
+                threading.Thread(
+                    target=ideashelf_host.append_capture, args=(p, inbox)
+                )
+                for p in payloads
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            path = os.path.join(inbox, "log", "000000000001.seg")
+            ids = sorted(r["id"] for r in self._records(path))
+            assert ids == sorted(p["id"] for p in payloads)
+
+    def test_handle_message_uses_configured_format(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            monkeypatch.setattr(ideashelf_host, "INBOX_FORMAT", "log")
+            response = ideashelf_host.handle_message(make_payload())
+            assert response["success"] is True
+            assert response["path"].endswith(".seg")
+
+
+class TestBatchMessages:
+    """Tests for batches of captures in one native message."""
+
+    def test_array_batch_writes_every_capture(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payloads = [make_payload() for _ in range(3)]
+            response = ideashelf_host.handle_message(payloads)
+
+            assert response["success"] is True
+            assert response["written"] == 3
+            assert response["failed"] == 0
+            assert [r["id"] for r in response["results"]] == [p["id"] for p in payloads]
+            for result in response["results"]:
+                assert os.path.exists(result["path"])
+
+    def test_envelope_echoes_batch_id(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            message = {"type": "batch", "id": "batch-1", "captures": [make_payload()]}
+            response = ideashelf_host.handle_message(message)
+            assert response["success"] is True
+            assert response["id"] == "batch-1"
+
+    def test_invalid_capture_does_not_block_others(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            good = make_payload()
+            bad = make_payload(content="")
+            response = ideashelf_host.handle_message([good, bad, "nonsense"])
+
+            assert response["success"] is False
+            assert response["written"] == 1
+            assert response["failed"] == 2
+            ok, failed, garbage = response["results"]
+            assert ok["success"] is True
+            assert failed["id"] == bad["id"]
+            assert "content" in failed["error"]
+            assert garbage["success"] is False
+            assert inbox_files(inbox) == [f"{good['id']}.json"]
+
+    def test_envelope_requires_capture_list(self):
+        response = ideashelf_host.handle_message({"type": "batch", "id": "b", "captures": "x"})
+        assert response["success"] is False
+        assert response["id"] == "b"
+
+    def test_log_batch_is_appended_in_order(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            monkeypatch.setattr(ideashelf_host, "INBOX_FORMAT", "log")
+            monkeypatch.setattr(ideashelf_host, "SEGMENT_MAX_BYTES", 1024)
+            payloads = [make_payload(content="z" * 300) for _ in range(6)]
+            response = ideashelf_host.handle_message(payloads)
+
+            assert response["written"] == 6
+            paths = [r["path"] for r in response["results"]]
+            assert len(set(paths)) > 1
+            replayed = []
+            for path in sorted(set(paths)):
+                assert os.path.getsize(path) <= 1024
+                replayed.extend(TestCaptureLog()._records(path))
+            assert replayed == payloads
+
+    def test_batch_over_persistent_connection(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payloads = [make_payload() for _ in range(4)]
+            stdin = io.BytesIO(frame(payloads))
+            stdout = io.BytesIO()
+            assert ideashelf_host.serve(stdin, stdout, idle_timeout=1) == 1
+            (response,) = unframe_all(stdout.getvalue())
+            assert response["written"] == 4
+            assert len(inbox_files(inbox)) == 4
+
+
+class TestDurability:
+    """Tests for atomic writes and sync batching in the host."""
+
+    def test_write_leaves_no_temporary_files(self):
+        with tempfile.TemporaryDirectory() as inbox:
+            for mode in ("none", "file", "batch"):
+                ok, err, _ = ideashelf_host.write_capture(make_payload(), inbox, durability=mode)
+                assert ok is True, err
+            ideashelf_host.pending_sync.flush()
+            assert all(name.endswith(".json") for name in os.listdir(inbox))
+            assert len(os.listdir(inbox)) == 3
+
+    def test_batch_mode_syncs_when_group_fills(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "SYNC_EVERY_FILES", 3)
+        monkeypatch.setattr(ideashelf_host, "pending_sync", ideashelf_host.PendingSync())
+        synced = []
+        monkeypatch.setattr(ideashelf_host, "_fsync_files", lambda paths: synced.append(list(paths)))
+        with tempfile.TemporaryDirectory() as inbox:
+            for _ in range(4):
+                ideashelf_host.write_capture(make_payload(), inbox, durability="batch")
+            assert len(synced) == 1
+            assert len(synced[0]) == 3
+            assert ideashelf_host.pending_sync.remaining() is not None
+
+            ideashelf_host.pending_sync.flush()
+            assert len(synced) == 2
+            assert ideashelf_host.pending_sync.remaining() is None
+
+    def test_serve_flushes_pending_writes_on_exit(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "batch")
+        monkeypatch.setattr(ideashelf_host, "pending_sync", ideashelf_host.PendingSync())
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            stdin = io.BytesIO(frame(make_payload()) + frame(make_payload()))
+            ideashelf_host.serve(stdin, io.BytesIO(), idle_timeout=1)
+            assert ideashelf_host.pending_sync.remaining() is None
+
+
+class TestChunkedTransfer:
+    """Tests for captures streamed in several messages."""
+
+    def _messages(self, payload, chunk_size):
+        content = payload["content"]
+        metadata = {k: v for k, v in payload.items() if k != "content"}
+        pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        messages = [{"type": "chunk_start", "id": payload["id"], "capture": metadata}]
+        messages += [
+            {"type": "chunk", "id": payload["id"], "seq": seq, "data": piece}
+            for seq, piece in enumerate(pieces)
+        ]
+        messages.append({"type": "chunk_end", "id": payload["id"], "chunks": len(pieces)})
+        return messages
+
+    def _serve(self, messages):
+        stdin = io.BytesIO(b"".join(frame(m) for m in messages))
+        stdout = io.BytesIO()
+        ideashelf_host.serve(stdin, stdout, idle_timeout=1)
+        return unframe_all(stdout.getvalue())
+
+    def test_capture_larger_than_message_limit(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "MAX_MESSAGE_BYTES", 4096)
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            content = 'Line with "quotes", \\ and ünïcode\n' * 2000
+            payload = make_payload(content=content)
+            responses = self._serve(self._messages(payload, 1000))
+
+            assert all(r["success"] for r in responses)
+            final = responses[-1]
+            assert final["id"] == payload["id"]
+            with open(final["path"], encoding="utf-8") as f:
+                assert json.load(f) == payload
+            assert inbox_files(inbox) == [f"{payload['id']}.json"]
+
+    def test_chunks_into_capture_log(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            monkeypatch.setattr(ideashelf_host, "INBOX_FORMAT", "log")
+            payload = make_payload(content="x" * 10_000)
+            responses = self._serve(self._messages(payload, 3000))
+
+            assert responses[-1]["success"] is True
+            assert TestCaptureLog()._records(responses[-1]["path"]) == [payload]
+            assert inbox_files(inbox) == ["log"]
+
+    def test_out_of_order_chunk_aborts(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            messages = self._messages(make_payload(content="abc" * 100), 100)
+            messages[1], messages[2] = messages[2], messages[1]
+            responses = self._serve(messages)
+
+            assert responses[1]["success"] is False
+            assert responses[-1]["success"] is False
+            assert os.listdir(inbox) == []
+
+    def test_abandoned_upload_is_cleaned_up(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            messages = self._messages(make_payload(), 5)[:-1]
+            self._serve(messages)
+            assert os.listdir(inbox) == []
+
+    def test_unhashable_id_is_rejected(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payload = make_payload()
+            messages = [{"type": "chunk", "id": [1], "seq": 0, "data": "x"},
+                        {"type": "chunk_start", "id": ""}]
+            responses = self._serve(messages + self._messages(payload, 10))
+            assert [r["success"] for r in responses[:2]] == [False, False]
+            assert responses[0]["id"] == [1]
+            assert responses[-1]["success"] is True
+            assert inbox_files(inbox) == [f"{payload['id']}.json"]
+
+    def test_unexpected_error_does_not_end_session(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            real = ideashelf_host.handle_message
+            calls = []
+
+            def flaky(message, uploads=None):
+                calls.append(message)
+                if len(calls) == 1:
+                    raise RuntimeError("boom")
+                return real(message, uploads)
+
+            monkeypatch.setattr(ideashelf_host, "handle_message", flaky)
+            first, second = make_payload(), make_payload()
+            responses = self._serve([first, second])
+            assert responses[0] == {"success": False, "id": first["id"],
+                                    "error": "Internal error: boom"}
+            assert responses[1]["success"] is True
+
+    def test_size_limit_is_enforced(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "MAX_CAPTURE_BYTES", 1000)
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            responses = self._serve(self._messages(make_payload(content="y" * 5000), 500))
+            assert responses[-1]["success"] is False
+            assert os.listdir(inbox) == []
+
+    def test_one_shot_mode_rejects_chunks(self):
+        response = ideashelf_host.handle_message({"type": "chunk_start", "id": "a"})
+        assert response["success"] is False
+        assert response["id"] == "a"
+
+
+class TestZipapp:
+    """Tests for the precompiled host build."""
+
+    def test_zipapp_answers_like_the_script(self, tmp_path):
+        import subprocess
+
+        import build_zipapp
+
+        archive = build_zipapp.build(str(tmp_path / "host.pyz"), "/usr/bin/env python3")
+        home = tmp_path / "home"
+        home.mkdir()
+        payload = make_payload()
+        result = subprocess.run(
+            [sys.executable, "-S", archive, "--once"],
+            input=frame(payload),
+            capture_output=True,
+            env=dict(os.environ, HOME=str(home)),
+            timeout=30,
+        )
+        (response,) = unframe_all(result.stdout)
+        assert response["success"] is True, response
+        assert os.path.exists(home / "IdeaShelf" / "inbox" / f"{payload['id']}.json")
+
+
+class TestHostMetrics:
+    """Tests for per-connection host metrics."""
+
+    def test_connection_appends_one_json_line(self, monkeypatch, tmp_path):
+        metrics_path = tmp_path / "host.jsonl"
+        inbox = tmp_path / "inbox"
+        monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: str(inbox))
+        monkeypatch.setenv("IDEASHELF_HOST_METRICS", str(metrics_path))
+        stdin = io.BytesIO(frame(make_payload()) + frame(make_payload(content="")))
+        ideashelf_host.serve(stdin, io.BytesIO(), idle_timeout=1)
+
+        (line,) = metrics_path.read_text().splitlines()
+        record = json.loads(line)
+        assert record["counters"]["messages"] == 2
+        assert record["counters"]["captures"] == 1
+        assert record["counters"]["errors"] == 1
+        assert record["counters"]["bytes_in"] > 0
+        assert record["counters"]["bytes_out"] > 0
+        assert record["stages"]["handle"]["count"] == 2
+
+    def test_no_metrics_file_by_default(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("IDEASHELF_HOST_METRICS", raising=False)
+        monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: str(tmp_path))
+        ideashelf_host.serve(io.BytesIO(frame(make_payload())), io.BytesIO(), idle_timeout=1)
+        assert len(inbox_files(tmp_path)) == 1
+
+
+class TestSeenIndex:
+    """Tests for acknowledging retried sends as duplicates."""
+
+    def test_index_reports_recent_maybe_and_unseen(self, tmp_path):
+        path = str(tmp_path / ".seen")
+        index = ideashelf_host.SeenIndex(path, bloom_bytes=1024, ring_slots=2)
+        index.add_many(["a", "b", "c"])  # "a" falls out of the ring
+        assert index.check("c") == "recent"
+        assert index.check("a") == "maybe"
+        assert index.check("never-added") is None
+        index.close()
+
+        reopened = ideashelf_host.SeenIndex(path, bloom_bytes=1024, ring_slots=2)
+        assert reopened.check("b") == "recent"
+        reopened.close()
+        # A different size starts a fresh index
+        resized = ideashelf_host.SeenIndex(path, bloom_bytes=2048, ring_slots=2)
+        assert resized.check("b") is None
+        resized.close()
+
+    def test_retry_is_acknowledged_without_rewriting(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "none")
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payload = make_payload()
+            first = ideashelf_host.handle_message(payload)
+            assert "duplicate" not in first
+            os.makedirs(os.path.join(inbox, "processed"))
+            os.rename(first["path"], os.path.join(inbox, "processed", f"{payload['id']}.json"))
+
+            retry = ideashelf_host.handle_message(payload)
+            assert retry == {"success": True, "id": payload["id"], "duplicate": True}
+            assert inbox_files(inbox) == ["processed"]
+
+    def test_filter_hit_is_confirmed_on_disk(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "none")
+        monkeypatch.setattr(ideashelf_host, "SEEN_RING_SLOTS", 1)
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            old, new = make_payload(), make_payload()
+            ideashelf_host.handle_message(old)
+            ideashelf_host.handle_message(new)  # Pushes `old` out of the ring
+            os.unlink(os.path.join(inbox, f"{old['id']}.json"))
+
+            # Filter says maybe, but the file is gone: store it again
+            response = ideashelf_host.handle_message(old)
+            assert "path" in response
+            assert ideashelf_host.handle_message(new)["duplicate"] is True
+
+    def test_batch_reports_duplicates_and_remembers_after_sync(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "batch")
+        monkeypatch.setattr(ideashelf_host, "pending_sync", ideashelf_host.PendingSync())
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            first, second = make_payload(), make_payload()
+            response = ideashelf_host.handle_batch([first])
+            # Not yet durable, so a retry now is written again
+            assert not ideashelf_host.seen_before(first["id"], inbox)
+            ideashelf_host.pending_sync.flush()
+            assert ideashelf_host.seen_before(first["id"], inbox)
+
+            response = ideashelf_host.handle_batch([first, second])
+            assert response["written"] == 1
+            assert response["duplicates"] == 1
+            assert response["results"][0]["duplicate"] is True
+            assert "path" in response["results"][1]
+
+    def test_chunked_retry_is_discarded(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "none")
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payload = make_payload()
+            ideashelf_host.handle_message(payload)
+            uploads = ideashelf_host.ChunkedUploads()
+            metadata = {k: v for k, v in payload.items() if k != "content"}
+            for message in (
+                {"type": "chunk_start", "id": payload["id"], "capture": metadata},
+                {"type": "chunk", "id": payload["id"], "seq": 0, "data": "retry"},
+            ):
+                assert uploads.handle(message)["success"] is True
+            end = uploads.handle({"type": "chunk_end", "id": payload["id"], "chunks": 1})
+            assert end["duplicate"] is True
+            assert inbox_files(inbox) == [f"{payload['id']}.json"]
+
+    def test_can_be_disabled(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "SEEN_INDEX", False)
+        monkeypatch.setattr(ideashelf_host, "DURABILITY", "none")
+        with tempfile.TemporaryDirectory() as inbox:
+            monkeypatch.setattr(ideashelf_host, "get_inbox_path", lambda: inbox)
+            payload = make_payload()
+            ideashelf_host.handle_message(payload)
+            assert "path" in ideashelf_host.handle_message(payload)
+            assert os.listdir(inbox) == [f"{payload['id']}.json"]
+
+
+class TestCaptureEncoding:
+    """Tests for the pretty and compact capture encodings."""
+
+    def test_pretty_is_the_default(self, monkeypatch):
+        monkeypatch.delenv("IDEASHELF_CAPTURE_ENCODING", raising=False)
+        payload = make_payload()
+        data, compressed = ideashelf_host.encode_capture(payload)
+        assert compressed is False
+        assert data == json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def test_compact_compresses_only_past_threshold(self, monkeypatch):
+        monkeypatch.setenv("IDEASHELF_CAPTURE_ENCODING", "compact")
+        small = make_payload()
+        data, compressed = ideashelf_host.encode_capture(small)
+        assert compressed is False
+        assert json.loads(data) == small and b"\n" not in data
+
+        large = make_payload(content="word " * 5000)
+        data, compressed = ideashelf_host.encode_capture(large)
+        assert compressed is True
+        assert data[:2] == b"\x1f\x8b"
+        assert json.loads(zlib.decompress(data, 16 + zlib.MAX_WBITS)) == large
+
+    def test_log_records_flag_compression(self, monkeypatch):
+        monkeypatch.setattr(ideashelf_host, "CAPTURE_ENCODING", "compact")
+        monkeypatch.delenv("IDEASHELF_CAPTURE_ENCODING", raising=False)
+        for payload, flags in ((make_payload(), 0),
+                               (make_payload(content="word " * 5000), ideashelf_host.RECORD_GZIP)):
+            record = ideashelf_host.encode_record(payload)
+            length, crc, got = ideashelf_host.RECORD_HEADER.unpack_from(record)
+            assert got == flags
+            assert length == len(record) - ideashelf_host.RECORD_HEADER.size
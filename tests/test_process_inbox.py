@@ -17,34 +17,7 @@ import pytest
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
 
 import process_inbox
-
-
-def make_capture(**overrides):
-    """Create a valid capture dict with optional overrides."""
-    capture = {
-        "id": str(uuid.uuid4()),
-        "captured_at": "2026-02-27T14:30:00Z",
-        "source_url": "https://example.com/article",
-        "source_title": "Test Article Title",
-        "content_type": "text_selection",
-        "content": "This is a test capture for processing.",
-        "context": {
-            "preceding_text": "Before",
-            "following_text": "After",
-        },
-        "user_note": "",
-    }
-    capture.update(overrides)
-    return capture
-
-
-def write_capture_to_inbox(capture, inbox_path):
-    """Write a capture dict as a JSON file in the inbox."""
-    filename = f"{capture['id']}.json"
-    filepath = os.path.join(inbox_path, filename)
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(capture, f, indent=2)
-    return filepath
+from conftest import make_capture, write_capture_to_inbox
 
 
 class TestBuildMarkdown:
@@ -258,3 +231,642 @@ class TestProcessInbox:
 
             output_files = os.listdir(output)
             assert len(output_files) == 6
+
+
+class TestParallelProcessing:
+    """Tests for --workers mode."""
+
+    def _run(self, tmpdir, captures, workers):
+        inbox = os.path.join(tmpdir, "inbox")
+        output = os.path.join(tmpdir, "ideas")
+        os.makedirs(inbox)
+        for capture in captures:
+            write_capture_to_inbox(capture, inbox)
+
+        config = {
+            "inbox_folder": inbox,
+            "output_folder": output,
+            "defaults": {"status": "raw"},
+        }
+        counts = process_inbox.process_inbox(config, workers=workers)
+        outputs = {}
+        for name in os.listdir(output):
+            with open(os.path.join(output, name), "r") as f:
+                outputs[name] = f.read()
+        return counts, outputs
+
+    def test_parallel_output_matches_serial(self):
+        # Repeated content forces filename collisions
+        captures = [
+            make_capture(id=f"{i:08d}-aaaa", content=f"Shared idea {i % 3}")
+            for i in range(40)
+        ]
+        with tempfile.TemporaryDirectory() as serial_dir, \
+                tempfile.TemporaryDirectory() as parallel_dir:
+            serial = self._run(serial_dir, captures, workers=1)
+            parallel = self._run(parallel_dir, captures, workers=4)
+
+        assert serial[0] == (40, 0)
+        assert parallel == serial
+
+    def test_errors_are_counted_in_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            os.makedirs(inbox)
+            with open(os.path.join(inbox, "broken.json"), "w") as f:
+                f.write("{not json")
+            captures = [make_capture(content=f"Idea {i}") for i in range(5)]
+            for capture in captures:
+                write_capture_to_inbox(capture, inbox)
+
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": os.path.join(tmpdir, "ideas"),
+                "defaults": {"status": "raw"},
+            }
+            processed, errors = process_inbox.process_inbox(config, workers=3)
+
+            assert processed == 5
+            assert errors == 1
+            assert os.path.exists(os.path.join(inbox, "broken.json"))
+
+    def test_cli_accepts_workers_flag(self):
+        args = process_inbox.parse_args(["--workers", "8"])
+        assert args.workers == 8
+
+
+class TestDurability:
+    """Tests for crash-safe output writing."""
+
+    def _setup(self, tmpdir, mode="batch"):
+        inbox = os.path.join(tmpdir, "inbox")
+        output = os.path.join(tmpdir, "ideas")
+        os.makedirs(inbox)
+        config = {
+            "inbox_folder": inbox,
+            "output_folder": output,
+            "durability": {"mode": mode, "every_files": 2, "every_ms": 60_000},
+        }
+        return inbox, output, config
+
+    @pytest.mark.parametrize("mode", ["none", "file", "batch"])
+    def test_every_mode_produces_the_same_output(self, mode):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, config = self._setup(tmpdir, mode)
+            for i in range(5):
+                write_capture_to_inbox(make_capture(content=f"Capture {i}"), inbox)
+
+            processed, errors = process_inbox.process_inbox(config)
+            assert (processed, errors) == (5, 0)
+            assert len(os.listdir(output)) == 5
+            assert not any(name.endswith(".tmp") for name in os.listdir(output))
+            assert not any(name.endswith(".json") for name in os.listdir(inbox))
+
+    def test_capture_stays_in_inbox_when_sync_fails(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, config = self._setup(tmpdir)
+            capture = make_capture()
+            write_capture_to_inbox(capture, inbox)
+
+            def broken_fsync(path):
+                raise OSError("I/O error")
+
+            monkeypatch.setattr(process_inbox.durable, "fsync_path", broken_fsync)
+            processed, errors = process_inbox.process_inbox(config)
+
+            assert (processed, errors) == (0, 1)
+            assert f"{capture['id']}.json" in os.listdir(inbox)
+
+    def test_moves_into_processed_are_synced(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, output, config = self._setup(tmpdir)
+            write_capture_to_inbox(make_capture(), inbox)
+            synced = []
+            real = process_inbox.durable.fsync_path
+            monkeypatch.setattr(
+                process_inbox.durable, "fsync_path",
+                lambda path: synced.append(os.path.abspath(path)) or real(path),
+            )
+
+            assert process_inbox.process_inbox(config) == (1, 0)
+            assert os.path.abspath(os.path.join(inbox, "processed")) in synced
+
+
+class TestReplays:
+    """Tests for captures the extension sent again after processing."""
+
+    def _config(self, tmpdir):
+        inbox = os.path.join(tmpdir, "inbox")
+        os.makedirs(inbox)
+        return {"inbox_folder": inbox, "output_folder": os.path.join(tmpdir, "ideas")}
+
+    def test_rendered_capture_is_retired_without_a_new_idea(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir)
+            capture = make_capture()
+            write_capture_to_inbox(capture, config["inbox_folder"])
+            assert process_inbox.process_inbox(config) == (1, 0)
+            (name,) = os.listdir(config["output_folder"])
+
+            write_capture_to_inbox(capture, config["inbox_folder"])
+            session = process_inbox.Session(config)
+            try:
+                assert process_inbox.process_inbox(config, session=session) == (1, 0)
+                assert session.duplicates == 1
+            finally:
+                session.close()
+            assert os.listdir(config["output_folder"]) == [name]
+            assert not os.path.exists(
+                os.path.join(config["inbox_folder"], f"{capture['id']}.json")
+            )
+
+    def test_capture_whose_idea_was_deleted_is_rendered_again(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir)
+            capture = make_capture()
+            write_capture_to_inbox(capture, config["inbox_folder"])
+            process_inbox.process_inbox(config)
+            (name,) = os.listdir(config["output_folder"])
+            os.unlink(os.path.join(config["output_folder"], name))
+
+            write_capture_to_inbox(capture, config["inbox_folder"])
+            assert process_inbox.process_inbox(config) == (1, 0)
+            assert os.listdir(config["output_folder"]) == [name]
+
+
+class TestMetrics:
+    """Tests for per-stage processor metrics."""
+
+    def test_run_reports_every_stage(self, tmp_path):
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        for i in range(3):
+            write_capture_to_inbox(make_capture(content=f"Capture {i}"), str(inbox))
+        jsonl = tmp_path / "metrics.jsonl"
+        config = {
+            "inbox_folder": str(inbox),
+            "output_folder": str(tmp_path / "ideas"),
+            "metrics": {"enabled": True, "jsonl": str(jsonl)},
+        }
+
+        process_inbox.process_inbox(config)
+
+        (line,) = jsonl.read_text().splitlines()
+        report = json.loads(line)
+        for stage in ("read", "parse", "allocate", "render", "write", "sync", "finish", "index"):
+            assert stage in report["stages"], stage
+        assert report["stages"]["parse"]["count"] == 3
+        assert report["counters"]["processed"] == 3
+        assert report["counters"]["input_bytes"] > 0
+        assert report["counters"]["output_bytes"] > 0
+        assert report["gauges"]["queue_depth"] == 0
+
+
+class TestLoadConfig:
+    """Tests for reading config.yaml."""
+
+    @pytest.fixture(autouse=True)
+    def snapshot_folder(self, tmp_path, monkeypatch):
+        folder = tmp_path / "state" / "config"
+        monkeypatch.setattr(process_inbox, "CONFIG_SNAPSHOT_FOLDER", str(folder))
+        return folder
+
+    def test_sections_merge_over_defaults(self, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            "output_folder: ~/Elsewhere/\n"
+            "defaults:\n"
+            "  status: draft\n"
+        )
+        config = process_inbox.load_config(str(config_path))
+        assert config["output_folder"] == os.path.expanduser("~/Elsewhere/")
+        if process_inbox.HAS_YAML:
+            assert config["defaults"]["status"] == "draft"
+        assert config["taxonomy"] == process_inbox.DEFAULT_CONFIG["taxonomy"]
+
+    def test_fallback_parser_skips_nested_settings(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(process_inbox, "HAS_YAML", False)
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            "output_folder: /ideas/\n"
+            "defaults:\n"
+            "  status: draft\n"
+            "search:\n"
+            "  enabled: false\n"
+        )
+        config = process_inbox.load_config(str(config_path))
+        assert config["output_folder"] == "/ideas/"
+        assert "status" not in config and "enabled" not in config
+        assert config["search"] == process_inbox.DEFAULT_CONFIG["search"]
+
+    def test_snapshot_is_reused_until_config_changes(self, tmp_path, monkeypatch,
+                                                     snapshot_folder):
+        parsed = []
+        real_parse = process_inbox._parse_simple_yaml
+        monkeypatch.setattr(process_inbox, "HAS_YAML", False)
+        monkeypatch.setattr(
+            process_inbox, "_parse_simple_yaml",
+            lambda path: parsed.append(path) or real_parse(path),
+        )
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text("output_folder: /first/\n")
+
+        for _ in range(3):
+            config = process_inbox.load_config(str(config_path))
+            assert config["output_folder"] == "/first/"
+        assert len(parsed) == 1
+        assert len(os.listdir(snapshot_folder)) == 1
+        assert sorted(os.listdir(tmp_path)) == ["config.yaml", "state"]
+
+        config_path.write_text("output_folder: /second/path/\n")
+        config = process_inbox.load_config(str(config_path))
+        assert config["output_folder"] == "/second/path/"
+        assert len(parsed) == 2
+
+    def test_missing_sections_use_defaults(self):
+        section = process_inbox.config_section({"search": {}}, "search")
+        assert section["enabled"] is True
+
+
+class TestFilenameRegistry:
+    """Tests for output name allocation."""
+
+    def test_collisions_get_id_then_counter_suffix(self):
+        with tempfile.TemporaryDirectory() as output:
+            registry = process_inbox.FilenameRegistry()
+            capture = make_capture(id="abcdef12-0000")
+            paths = [registry.allocate(output, "260227_idea.md", capture) for _ in range(3)]
+            assert [os.path.basename(p) for p in paths] == [
+                "260227_idea.md",
+                "260227_idea_abcdef12.md",
+                "260227_idea_abcdef12_2.md",
+            ]
+
+    def test_second_collision_never_overwrites(self):
+        """The old scheme wrote name_<id8>.md without checking it again."""
+        with tempfile.TemporaryDirectory() as output:
+            for name in ("260227_idea.md", "260227_idea_abcdef12.md"):
+                with open(os.path.join(output, name), "w") as f:
+                    f.write("existing")
+            registry = process_inbox.FilenameRegistry()
+            path = registry.allocate(output, "260227_idea.md", make_capture(id="abcdef12"))
+            assert os.path.basename(path) == "260227_idea_abcdef12_2.md"
+            for name in ("260227_idea.md", "260227_idea_abcdef12.md"):
+                with open(os.path.join(output, name)) as f:
+                    assert f.read() == "existing"
+
+    def test_directory_is_listed_once(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as output:
+            calls = []
+            real_scandir = os.scandir
+            monkeypatch.setattr(
+                process_inbox.os, "scandir",
+                lambda path: calls.append(path) or real_scandir(path),
+            )
+            registry = process_inbox.FilenameRegistry()
+            for i in range(5):
+                registry.allocate(output, f"260227_idea_{i}.md", make_capture())
+            assert calls == [output]
+
+    def test_names_taken_by_another_process_are_skipped(self):
+        with tempfile.TemporaryDirectory() as output:
+            registry = process_inbox.FilenameRegistry()
+            registry.allocate(output, "260227_first.md", make_capture())
+            # Another processor claims the name after our one-time listing
+            with open(os.path.join(output, "260227_idea.md"), "w") as f:
+                f.write("theirs")
+            path = registry.allocate(output, "260227_idea.md", make_capture(id="abcdef12"))
+            assert os.path.basename(path) == "260227_idea_abcdef12.md"
+
+    def test_release_frees_name_and_placeholder(self):
+        with tempfile.TemporaryDirectory() as output:
+            registry = process_inbox.FilenameRegistry()
+            path = registry.allocate(output, "260227_idea.md", make_capture())
+            registry.release(path)
+            assert not os.path.exists(path)
+            assert registry.allocate(output, "260227_idea.md", make_capture()) == path
+
+    def test_repeated_runs_keep_distinct_names(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            output = os.path.join(tmpdir, "ideas")
+            os.makedirs(inbox)
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": output,
+                "defaults": {"status": "raw"},
+            }
+            for run in range(3):
+                write_capture_to_inbox(
+                    make_capture(id="samepref-" + str(run), content="Same idea"), inbox
+                )
+                process_inbox.process_inbox(config)
+
+            assert sorted(os.listdir(output)) == [
+                "260227_same_idea.md",
+                "260227_same_idea_samepref.md",
+                "260227_same_idea_samepref_2.md",
+            ]
+
+
+class TestOutputLayout:
+    """Tests for sharded output folders."""
+
+    def _config(self, tmpdir, output_layout):
+        inbox = os.path.join(tmpdir, "inbox")
+        os.makedirs(inbox)
+        return inbox, {
+            "inbox_folder": inbox,
+            "output_folder": os.path.join(tmpdir, "ideas"),
+            "output_layout": output_layout,
+        }
+
+    def test_date_layout_writes_into_year_and_month(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, config = self._config(tmpdir, "date")
+            write_capture_to_inbox(make_capture(), inbox)
+
+            assert process_inbox.process_inbox(config) == (1, 0)
+            month = os.path.join(config["output_folder"], "2026", "02")
+            assert [name.startswith("260227_") for name in os.listdir(month)] == [True]
+
+    def test_unknown_layout_is_an_error(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, config = self._config(tmpdir, "weekly")
+            write_capture_to_inbox(make_capture(), inbox)
+            with pytest.raises(ValueError):
+                process_inbox.process_inbox(config)
+
+    def test_migration_keeps_search_and_dedup_indexes_pointing_at_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, config = self._config(tmpdir, "flat")
+            config["dedup"] = {"enabled": True, "exact": "link"}
+            write_capture_to_inbox(make_capture(content="Scaffolded workshop idea"), inbox)
+            process_inbox.process_inbox(config)
+
+            config["output_layout"] = "hash"
+            assert process_inbox.migrate_output_layout(config) == 1
+
+            results = process_inbox.search_ideas(config, "workshop")
+            assert len(results) == 1
+            assert os.path.exists(results[0]["path"])
+
+            # A repeat links to the moved original by its relative path
+            write_capture_to_inbox(make_capture(content="Scaffolded workshop idea"), inbox)
+            process_inbox.process_inbox(config)
+            original = os.path.relpath(results[0]["path"], config["output_folder"])
+            linked = [
+                path for path in process_inbox.layout.iter_ideas(config["output_folder"])
+                if path != results[0]["path"]
+            ]
+            with open(linked[0], "r", encoding="utf-8") as f:
+                assert f"duplicate_of: {original}" in f.read()
+
+    def test_migration_rewrites_links_between_ideas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, config = self._config(tmpdir, "flat")
+            config["dedup"] = {"enabled": True, "exact": "link"}
+            for _ in range(2):
+                write_capture_to_inbox(make_capture(content="Scaffolded workshop idea"), inbox)
+            process_inbox.process_inbox(config)
+
+            config["output_layout"] = "date"
+            assert process_inbox.migrate_output_layout(config) == 2
+
+            def links():
+                found = {}
+                for path in process_inbox.layout.iter_ideas(config["output_folder"]):
+                    with open(path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            if line.startswith("duplicate_of: "):
+                                found[path] = line[len("duplicate_of: "):].strip()
+                return found
+
+            ((path, target),) = links().items()
+            assert target.startswith("2026/02/")
+            assert os.path.exists(os.path.join(config["output_folder"], target))
+
+            # The rewritten idea is still ours to rebuild, with the new link
+            config["defaults"] = {"status": "reviewed"}
+            assert process_inbox.rebuild_output(config)["rewritten"] == 2
+            assert links() == {path: target}
+
+    def test_reindex_finds_ideas_in_subfolders(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox, config = self._config(tmpdir, "date")
+            write_capture_to_inbox(make_capture(), inbox)
+            process_inbox.process_inbox(config)
+            assert process_inbox.reindex_output(config) == 1
+
+
+class TestArchive:
+    """Tests for compacting processed captures."""
+
+    def test_auto_compaction_archives_processed_captures(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            os.makedirs(inbox)
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": os.path.join(tmpdir, "ideas"),
+                "archive": {"auto": True},
+            }
+            capture = make_capture()
+            write_capture_to_inbox(capture, inbox)
+
+            session = process_inbox.Session(config)
+            processed, _ = process_inbox.process_inbox(config, session=session)
+            session.maybe_compact(processed, force=True)
+            session.close()
+
+            assert os.listdir(os.path.join(inbox, "processed")) == []
+            assert process_inbox.find_capture(config, capture["id"]) == capture
+
+    def test_compaction_is_off_by_default(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            os.makedirs(inbox)
+            config = {"inbox_folder": inbox, "output_folder": os.path.join(tmpdir, "ideas")}
+            capture = make_capture()
+            write_capture_to_inbox(capture, inbox)
+
+            session = process_inbox.Session(config)
+            processed, _ = process_inbox.process_inbox(config, session=session)
+            session.maybe_compact(processed, force=True)
+            session.close()
+
+            assert os.listdir(os.path.join(inbox, "processed")) == [f"{capture['id']}.json"]
+            assert process_inbox.find_capture(config, capture["id"]) == capture
+
+
+class TestEnrichment:
+    """Tests for tagging captures before they are rendered."""
+
+    def test_stub_tagger_fills_frontmatter(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            output = os.path.join(tmpdir, "ideas")
+            os.makedirs(inbox)
+            stub = os.path.join(os.path.dirname(__file__), "..", "runtime", "stub_tagger.py")
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": output,
+                "taxonomy": {"types": ["metaphor"], "categories": ["teaching"],
+                             "themes": ["scaffolding"]},
+                "enrich": {"enabled": True, "command": [sys.executable, stub]},
+            }
+            write_capture_to_inbox(
+                make_capture(content="Scaffolding is a teaching metaphor"), inbox
+            )
+            write_capture_to_inbox(make_capture(content="Nothing relevant"), inbox)
+
+            assert process_inbox.process_inbox(config) == (2, 0)
+            texts = {}
+            for name in os.listdir(output):
+                with open(os.path.join(output, name), "r", encoding="utf-8") as f:
+                    texts[name] = f.read()
+            tagged = next(t for t in texts.values() if "Scaffolding" in t)
+            assert "themes: [scaffolding]" in tagged
+            assert "categories: [teaching]" in tagged
+            assert "idea_type: metaphor" in tagged
+            plain = next(t for t in texts.values() if "Nothing relevant" in t)
+            assert "themes: []" in plain
+
+    def test_broken_tagger_still_writes_ideas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            os.makedirs(inbox)
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": os.path.join(tmpdir, "ideas"),
+                "enrich": {"enabled": True, "command": ["/nonexistent/tagger"],
+                           "retries": 0},
+            }
+            write_capture_to_inbox(make_capture(), inbox)
+            assert process_inbox.process_inbox(config) == (1, 0)
+
+
+class TestRebuild:
+    """Tests for re-rendering ideas from processed captures."""
+
+    def _setup(self, tmpdir, count=3, **extra):
+        inbox = os.path.join(tmpdir, "inbox")
+        output = os.path.join(tmpdir, "ideas")
+        os.makedirs(inbox)
+        config = {"inbox_folder": inbox, "output_folder": output,
+                  "defaults": {"status": "raw"}, **extra}
+        for i in range(count):
+            write_capture_to_inbox(make_capture(content=f"Idea number {i}"), inbox)
+        assert process_inbox.process_inbox(config) == (count, 0)
+        return config, output
+
+    def _read(self, output):
+        texts = {}
+        for name in sorted(os.listdir(output)):
+            with open(os.path.join(output, name), "r", encoding="utf-8") as f:
+                texts[name] = f.read()
+        return texts
+
+    def test_nothing_changed_rewrites_nothing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            counts = process_inbox.rebuild_output(config)
+            assert counts["rewritten"] == 0
+            assert counts["unchanged"] == 3
+
+    def test_config_change_rerenders(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            config["defaults"] = {"status": "reviewed"}
+
+            counts = process_inbox.rebuild_output(config, workers=2)
+
+            assert counts["rewritten"] == 3
+            assert all("status: reviewed" in t for t in self._read(output).values())
+            assert process_inbox.rebuild_output(config)["rewritten"] == 0
+
+    def test_renderer_version_change_rerenders(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            monkeypatch.setattr(process_inbox, "RENDERER_VERSION", 999)
+            counts = process_inbox.rebuild_output(config)
+            # Same bytes, so nothing is written, but the new fingerprint is kept
+            assert counts["rewritten"] == 0
+            assert counts["unchanged"] == 3
+
+    def test_edited_and_deleted_ideas_are_left_alone(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            names = sorted(os.listdir(output))
+            with open(os.path.join(output, names[0]), "a", encoding="utf-8") as f:
+                f.write("\nMy own thoughts\n")
+            os.remove(os.path.join(output, names[1]))
+            config["defaults"] = {"status": "reviewed"}
+
+            counts = process_inbox.rebuild_output(config)
+
+            assert (counts["rewritten"], counts["edited"], counts["missing"]) == (1, 1, 1)
+            texts = self._read(output)
+            assert "My own thoughts" in texts[names[0]]
+            assert "status: raw" in texts[names[0]]
+            assert names[1] not in texts
+
+    def test_rebuilds_from_the_archive(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            process_inbox.compact_processed(config)
+            config["defaults"] = {"status": "reviewed"}
+            assert process_inbox.rebuild_output(config)["rewritten"] == 3
+
+    def test_adopt_takes_over_untracked_ideas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(tmpdir)
+            os.remove(os.path.join(config["inbox_folder"], ".state", "render-manifest.sqlite3"))
+            config["defaults"] = {"status": "reviewed"}
+
+            assert process_inbox.rebuild_output(config)["untracked"] == 3
+            assert process_inbox.rebuild_output(config, adopt=True)["rewritten"] == 3
+            assert process_inbox.rebuild_output(config)["unchanged"] == 3
+
+    def test_merged_duplicates_are_not_rerendered(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, output = self._setup(
+                tmpdir, count=1, dedup={"enabled": True, "exact": "merge"}
+            )
+            write_capture_to_inbox(make_capture(content="Idea number 0"), config["inbox_folder"])
+            process_inbox.process_inbox(config)
+            config["defaults"] = {"status": "reviewed"}
+
+            counts = process_inbox.rebuild_output(config)
+
+            assert counts["rewritten"] == 0
+            assert counts["edited"] == 1
+            (text,) = self._read(output).values()
+            assert "Also captured" in text
+
+
+class TestClassification:
+    """Tests for the built-in taxonomy classifier."""
+
+    def test_fills_frontmatter_offline(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            output = os.path.join(tmpdir, "ideas")
+            os.makedirs(inbox)
+            config = {
+                "inbox_folder": inbox,
+                "output_folder": output,
+                "taxonomy": {"types": ["metaphor"], "categories": ["teaching"],
+                             "themes": ["scaffolding"]},
+                "classify": {"enabled": True},
+            }
+            write_capture_to_inbox(
+                make_capture(content="Scaffolding is a teaching metaphor"), inbox
+            )
+            assert process_inbox.process_inbox(config) == (1, 0)
+            (name,) = os.listdir(output)
+            with open(os.path.join(output, name), "r", encoding="utf-8") as f:
+                text = f.read()
+            assert "themes: [scaffolding]" in text
+            assert "categories: [teaching]" in text
+            assert "idea_type: metaphor" in text
@@ -0,0 +1,193 @@
+"""
+Tests for the IdeaShelf related-ideas index.
+
+Tests term extraction, nearest-neighbour lookup, incremental updates and
+the `related:` links written by the inbox processor.
+"""
+
+import os
+import sys
+import tempfile
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import process_inbox
+import related
+from conftest import make_capture, write_capture_to_inbox
+
+FILLER = [
+    "Gardening tips for growing tomatoes in small urban balconies",
+    "Sourdough bread needs a lively starter and patient folding",
+    "Marathon training blocks alternate easy mileage with tempo runs",
+    "Watercolor washes dry lighter than they look when wet",
+    "Chess openings reward development before early queen raids",
+]
+
+
+def doc(content, title="", url=""):
+    return {"title": title, "content": content, "user_note": "", "source_url": url}
+
+
+class TestTerms:
+    def test_folds_case_plurals_and_stopwords(self):
+        counts = related.terms(doc("Metaphors about metaphor WITH scaffolding"))
+        assert counts == {"metaphor": 2, "scaffolding": 1}
+
+    def test_adds_source_host(self):
+        counts = related.terms(doc("ideas", url="https://www.example.com/a"))
+        assert counts["site:example.com"] == 1
+
+    def test_ignores_numbers_and_short_words(self):
+        assert related.terms(doc("a 2026 of to")) == {}
+
+
+class TestRelatedIndex:
+    def _index(self, tmp_path, **kwargs):
+        return related.RelatedIndex(str(tmp_path / "related.sqlite3"), **kwargs)
+
+    def test_finds_most_similar_first(self, tmp_path):
+        index = self._index(tmp_path)
+        for n, text in enumerate(FILLER):
+            index.add(f"f{n}", doc(text), f"/ideas/f{n}.md")
+        index.add("close", doc("scaffolding supports learners until the skill is secure"),
+                  "/ideas/close.md")
+        index.add("far", doc("scaffolding on building sites needs inspection"),
+                  "/ideas/far.md")
+
+        found = index.neighbours(doc("learners need scaffolding until skill is secure"), k=2)
+        assert [n.capture_id for n in found] == ["close", "far"]
+        assert 0 < found[1].score < found[0].score <= 1.0 + 1e-9
+
+    def test_min_score_and_exclude(self, tmp_path):
+        index = self._index(tmp_path)
+        index.add("a", doc("spaced repetition strengthens memory"), "/ideas/a.md")
+        index.add("b", doc("spaced repetition scheduling"), "/ideas/b.md")
+        query = doc("spaced repetition strengthens memory")
+        assert [n.capture_id for n in index.neighbours(query, exclude={"a"})] == ["b"]
+        assert [n.capture_id for n in index.neighbours(query, min_score=0.9)] == ["a"]
+
+    def test_unrelated_query_finds_nothing(self, tmp_path):
+        index = self._index(tmp_path)
+        for n, text in enumerate(FILLER):
+            index.add(f"f{n}", doc(text), f"/ideas/f{n}.md")
+        assert index.neighbours(doc("quantum entanglement")) == []
+
+    def test_discard_and_readd(self, tmp_path):
+        index = self._index(tmp_path)
+        index.add("a", doc("habit loops need cues"), "/ideas/a.md")
+        index.add("a", doc("habit loops need cues"), "/ideas/a.md")
+        assert index.count() == 1
+        index.discard("a")
+        assert index.count() == 0
+        assert index.neighbours(doc("habit loops")) == []
+        df = index.conn.execute("SELECT df FROM terms WHERE term = 'habit'").fetchone()[0]
+        assert df == 0
+
+    def test_common_terms_are_skipped(self, tmp_path):
+        index = self._index(tmp_path, max_df=0.1)
+        for n in range(40):
+            index.add(f"c{n}", doc(f"common word filler{chr(97 + n % 26)}"), f"/ideas/c{n}.md")
+        assert index.neighbours(doc("common word")) == []
+
+    def test_postings_read_per_term_are_capped(self, tmp_path):
+        index = self._index(tmp_path, max_postings=3, max_df=1.0)
+        for n in range(10):
+            index.add(f"p{n}", doc("pattern " * (n + 1) + f"extra{chr(97 + n)}"),
+                      f"/ideas/p{n}.md")
+        assert len(index.neighbours(doc("pattern"), k=10)) == 3
+
+    def test_persists_and_rebuilds(self, tmp_path):
+        path = str(tmp_path / "related.sqlite3")
+        index = related.RelatedIndex(path)
+        index.add("a", doc("attention is a spotlight"), "/ideas/a.md")
+        index.close()
+
+        index = related.RelatedIndex(path)
+        assert [n.capture_id for n in index.neighbours(doc("attention spotlight"))] == ["a"]
+        index.rebuild([("b", doc("working memory limits"), "/ideas/b.md")])
+        assert index.capture_ids_by_path() == {"/ideas/b.md": "b"}
+        assert [n.capture_id for n in index.neighbours(doc("memory limits"))] == ["b"]
+        index.rename_paths([("/ideas/b.md", "/ideas/2026/b.md")])
+        assert index.capture_ids_by_path() == {"/ideas/2026/b.md": "b"}
+        index.close()
+
+
+class TestRelatedLinks:
+    def _config(self, tmpdir, **related_settings):
+        inbox = os.path.join(tmpdir, "inbox")
+        os.makedirs(inbox)
+        return {
+            "inbox_folder": inbox,
+            "output_folder": os.path.join(tmpdir, "ideas"),
+            "related": dict({"enabled": True}, **related_settings),
+        }
+
+    def _write(self, config, content, name, **fields):
+        fields = dict({"source_url": "", "source_title": name.replace("-", " ")}, **fields)
+        write_capture_to_inbox(make_capture(content=content, **fields), config["inbox_folder"])
+
+    def _frontmatter(self, config):
+        result = {}
+        output = config["output_folder"]
+        for name in sorted(os.listdir(output)):
+            with open(os.path.join(output, name), "r", encoding="utf-8") as f:
+                head = f.read().split("\n---\n", 1)[0]
+            result[name] = dict(
+                line.split(": ", 1) for line in head.splitlines()[1:] if ": " in line
+            )
+        return result
+
+    def test_new_idea_links_to_earlier_ones(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir)
+            self._write(config, "Spaced repetition strengthens long term memory", "first")
+            self._write(config, "Sourdough starters need daily feeding", "bread")
+            assert process_inbox.process_inbox(config) == (2, 0)
+
+            self._write(config, "Memory fades without spaced repetition", "second")
+            assert process_inbox.process_inbox(config) == (1, 0)
+
+            meta = self._frontmatter(config)
+            (second,) = [m for m in meta.values() if m["source_title"] == "second"]
+            (first_name,) = [n for n, m in meta.items() if m["source_title"] == "first"]
+            assert second["related"] == f"[{first_name}]"
+            bread = [m for m in meta.values() if m["source_title"] == "bread"][0]
+            assert "related" not in bread
+
+    def test_links_within_a_batch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir, k=1)
+            for n in range(3):
+                self._write(config, "Interleaved practice beats blocked practice",
+                            f"practice-{n}", captured_at=f"2026-02-2{n}T00:00:00Z")
+            assert process_inbox.process_inbox(config) == (3, 0)
+            linked = [m for m in self._frontmatter(config).values() if "related" in m]
+            assert len(linked) == 2
+            assert all(m["related"].count(".md") == 1 for m in linked)
+
+    def test_disabled_by_default(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir)
+            config.pop("related")
+            for n in range(2):
+                self._write(config, "Interleaved practice", f"p{n}")
+            assert process_inbox.process_inbox(config) == (2, 0)
+            assert all("related" not in m for m in self._frontmatter(config).values())
+            assert not os.path.exists(
+                os.path.join(process_inbox.get_state_path(config), "related.sqlite3")
+            )
+
+    def test_reindex_backfills_existing_ideas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = self._config(tmpdir)
+            config["related"]["enabled"] = False
+            self._write(config, "Retrieval practice improves recall", "old")
+            assert process_inbox.process_inbox(config) == (1, 0)
+
+            config["related"]["enabled"] = True
+            assert process_inbox.reindex_output(config) == 1
+            self._write(config, "Recall improves with retrieval practice", "new")
+            assert process_inbox.process_inbox(config) == (1, 0)
+            new = [m for m in self._frontmatter(config).values() if m["source_title"] == "new"]
+            assert new[0]["related"] == "[260227_retrieval_practice_improves_recall.md]"
@@ -0,0 +1,136 @@
+"""
+Tests for the IdeaShelf full-text search index.
+
+Tests the FTS5 index directly and its incremental maintenance by the
+inbox processor, plus rebuilding it from existing markdown.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Add runtime to the import path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "runtime"))
+
+import process_inbox
+import search_index
+from conftest import make_capture, write_capture_to_inbox
+
+
+@pytest.fixture
+def config():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbox = os.path.join(tmpdir, "inbox")
+        os.makedirs(inbox)
+        yield {
+            "inbox_folder": inbox,
+            "output_folder": os.path.join(tmpdir, "ideas"),
+            "defaults": {"status": "raw"},
+        }
+
+
+def doc(capture_id, **fields):
+    base = {field: "" for field in search_index.FIELDS}
+    base.update(capture_id=capture_id, path=f"/ideas/{capture_id}.md")
+    base.update(fields)
+    return base
+
+
+class TestSearchIndex:
+    """Tests for the index itself."""
+
+    def test_search_ranks_title_matches_first(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = search_index.SearchIndex(os.path.join(tmpdir, "s.sqlite3"))
+            index.add_many([
+                doc("a", title="Gardening notes", content="scaffolding for tomatoes"),
+                doc("b", title="Scaffolding as a teaching metaphor", content="support"),
+            ])
+            results = index.search("scaffolding")
+            assert [r["capture_id"] for r in results] == ["b", "a"]
+            assert "[scaffolding]" in results[1]["snippet"].lower()
+            index.close()
+
+    def test_all_words_must_match(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = search_index.SearchIndex(os.path.join(tmpdir, "s.sqlite3"))
+            index.add_many([
+                doc("a", content="machine learning basics"),
+                doc("b", content="machine shop safety"),
+            ])
+            assert [r["capture_id"] for r in index.search("machine learning")] == ["a"]
+            index.close()
+
+    def test_punctuation_in_query_is_not_a_syntax_error(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = search_index.SearchIndex(os.path.join(tmpdir, "s.sqlite3"))
+            index.add(doc("a", source_url="https://example.com/post"))
+            assert index.search('example.com "post') != []
+            assert index.search("***") == []
+            index.close()
+
+    def test_readding_a_capture_replaces_it(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = search_index.SearchIndex(os.path.join(tmpdir, "s.sqlite3"))
+            index.add(doc("a", content="old words"))
+            index.add(doc("a", content="new words"))
+            assert index.count() == 1
+            assert index.search("old") == []
+            assert len(index.search("new")) == 1
+            index.close()
+
+
+class TestProcessorIntegration:
+    """Tests for index maintenance during processing."""
+
+    def test_processed_captures_are_searchable(self, config):
+        write_capture_to_inbox(
+            make_capture(content="Scaffolding lets learners climb", user_note="for workshop"),
+            config["inbox_folder"],
+        )
+        write_capture_to_inbox(make_capture(content="Unrelated idea"), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+
+        results = process_inbox.search_ideas(config, "workshop")
+        assert len(results) == 1
+        assert os.path.isfile(results[0]["path"])
+        assert results[0]["title"] == "Scaffolding lets learners climb"
+
+    def test_index_is_updated_incrementally(self, config):
+        write_capture_to_inbox(make_capture(content="First idea"), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+        write_capture_to_inbox(make_capture(content="Second idea"), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+
+        assert len(process_inbox.search_ideas(config, "idea")) == 2
+
+    def test_search_can_be_disabled(self, config):
+        config["search"] = {"enabled": False}
+        write_capture_to_inbox(make_capture(), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+        assert not os.path.exists(
+            os.path.join(process_inbox.get_state_path(config), "search.sqlite3")
+        )
+        assert process_inbox.search_ideas(config, "test") == []
+
+    def test_reindex_reads_existing_markdown(self, config):
+        capture = make_capture(content="Legacy idea body", user_note="kept note")
+        os.makedirs(config["output_folder"])
+        path = os.path.join(config["output_folder"], "260227_legacy.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(process_inbox.build_markdown(capture, config))
+
+        assert process_inbox.reindex_output(config) == 1
+        results = process_inbox.search_ideas(config, "kept note")
+        assert [r["path"] for r in results] == [path]
+        assert results[0]["title"] == "Legacy idea body"
+
+    def test_reindex_does_not_duplicate_processed_ideas(self, config):
+        write_capture_to_inbox(make_capture(content="Indexed once"), config["inbox_folder"])
+        process_inbox.process_inbox(config)
+
+        process_inbox.reindex_output(config)
+
+        assert len(process_inbox.search_ideas(config, "indexed once")) == 1